@@ -0,0 +1,7 @@
+# Headless simulation benchmarks: python -m bench [--quick] [--out results.json]
+#
+# Each scenario builds a World from a fixed config (not config.json, so local
+# tweaks don't skew results), seeds every RNG and drives the snakes with
+# scripted bots, so two runs of the same code do exactly the same work.
+# See bench/sim.py for what is measured and bench/__main__.py for comparing
+# two result files.
@@ -0,0 +1,99 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from bench.sim import scenarios, scenario_name, run_scenario, run_replay
+
+# python -m bench                          run every scenario, print a table
+# python -m bench --out new.json           ... and save the results
+# python -m bench --only snakes16          just the matching scenarios
+# python -m bench --replay match.rpl       a recorded match instead (repeatable)
+# python -m bench --compare old.json new.json
+#     compare two saved runs; exits with 1 if anything got slower than
+#     --threshold percent (ticks/s, median tick latency or a micro benchmark).
+#     Timings wobble by several percent between runs; use the full --ticks
+#     on a quiet machine before trusting a small difference.
+
+COMPARED = [
+    # (label, how to read it from a result, higher is better)
+    ("ticks/s", lambda r: r['ticks_per_sec'], True),
+    ("p50 us", lambda r: r['tick_us']['p50'], False),
+    ("update us", lambda r: r['update_us'], False),
+    ("collision us", lambda r: r['check_collision_us'], False),
+    ("spawn us", lambda r: r['spawn_us'], False),
+]
+
+
+def run(args):
+    results = []
+    print(f"{'scenario':<48} {'ticks/s':>9} {'p50 us':>8} {'p99 us':>8} {'peak KB':>9} {'deaths':>6}")
+    if args.replay:
+        runs = [lambda path=path: run_replay(path) for path in args.replay]
+    else:
+        runs = [lambda scenario=scenario: run_scenario(scenario, ticks=args.ticks, seed=args.seed)
+                for scenario in scenarios()
+                if not args.only or args.only in scenario_name(scenario)]
+    for run_one in runs:
+        result = run_one()
+        results.append(result)
+        print(f"{result['name']:<48} {result['ticks_per_sec']:>9.0f} {result['tick_us']['p50']:>8.1f} "
+              f"{result['tick_us']['p99']:>8.1f} {result['peak_kb']:>9.0f} {result['deaths']:>6}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": results}, f, indent=4)
+        print(f"Saved {len(results)} results to {args.out}")
+
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as f:
+        old = {r['name']: r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {r['name']: r for r in json.load(f)['results']}
+
+    regressions = 0
+    for name, result in new.items():
+        if name not in old:
+            continue
+        changes = []
+        for label, read, higher_is_better in COMPARED:
+            before, after = read(old[name]), read(result)
+            if not before:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            mark = ""
+            if worse > threshold:
+                mark = " !"
+                regressions += 1
+            changes.append(f"{label} {change:+.0f}%{mark}")
+        print(f"{name:<48} " + ", ".join(changes))
+    print(f"{regressions} regression(s) over {threshold:.0f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--ticks", type=int, default=2000, help="timed ticks per scenario")
+    parser.add_argument("--quick", action="store_true", help="300 ticks per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="run scenarios whose name contains this")
+    parser.add_argument("--replay", nargs="+", metavar="FILE", help="benchmark recorded matches instead")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent slower that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    if args.quick:
+        args.ticks = 300
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
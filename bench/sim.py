@@ -0,0 +1,265 @@
+import copy
+import os
+import random
+import time
+import tracemalloc
+from engine import World
+from grid import FOOD_OWNER
+from snake import Direction
+from replay import Replay
+
+# One benchmark scenario = one World, run for a fixed number of ticks.
+#
+# Reported per scenario:
+#   ticks_per_sec       World.step() throughput over the timed ticks
+#   tick_us             per-tick latency percentiles (p50/p95/p99/max, microseconds)
+#   peak_kb             peak Python allocation while building and running the
+#                       world (tracemalloc, measured in a separate shorter pass)
+#   update_us etc.      median time of Snake.update, Snake.check_collision and
+#                       Food.spawn on the final world, to tell which one moved
+#   deaths, points      how much respawning happened and the body sizes reached
+#
+# Snakes start short and grow to `length` blocks during an untimed warm-up.
+# A snake that dies is respawned (growing again), so the workload stays
+# roughly constant and is identical from run to run.
+
+BASE_CONFIG = {
+    "window": {"width": 800, "height": 600, "title": "bench"},
+    "colors": {"snake": [0, 255, 0], "food": [255, 0, 0], "background": [0, 0, 0], "text": [255, 255, 255]},
+    "game": {"speed": 10, "block_size": 20, "solid_walls": False, "score_per_move": 0,
+             "score_per_food": 10, "pixel_movement": True, "pixel_speed": 3, "tick_rate": 60,
+             "body_model": "points", "collision": "grid"},
+}
+
+# Middle of every sweep; each sweep below varies one parameter from here
+BASE_SCENARIO = {"length": 50, "snakes": 4, "food": 1, "width": 800, "height": 600,
+                 "pixel_movement": True, "pixel_speed": 3}
+
+SWEEPS = [
+    ("length", [10, 50, 150]),
+    ("snakes", [1, 4, 16]),
+    ("food", [1, 50, 500]),
+    (("width", "height"), [(400, 300), (800, 600), (1600, 1200)]),
+    ("pixel_movement", [True, False]),
+    ("pixel_speed", [1, 3, 6]),
+]
+
+TURN_CHANCE = 0.05 # Per tick, for a bot that isn't about to hit something
+MICRO_REPEATS = 200
+
+
+def scenarios():
+    # Every distinct scenario of the sweeps, base first
+    seen = []
+    for keys, values in SWEEPS:
+        for value in values:
+            scenario = dict(BASE_SCENARIO)
+            if isinstance(keys, tuple):
+                scenario.update(zip(keys, value))
+            else:
+                scenario[keys] = value
+            if scenario not in seen:
+                seen.append(scenario)
+    return seen
+
+
+def scenario_name(scenario):
+    mode = "pixel" if scenario['pixel_movement'] else "grid"
+    return (f"len{scenario['length']}-snakes{scenario['snakes']}-food{scenario['food']}-"
+            f"{scenario['width']}x{scenario['height']}-{mode}{scenario['pixel_speed']}")
+
+
+def make_config(scenario):
+    config = copy.deepcopy(BASE_CONFIG)
+    config['window']['width'] = scenario['width']
+    config['window']['height'] = scenario['height']
+    config['game']['pixel_movement'] = scenario['pixel_movement']
+    config['game']['pixel_speed'] = scenario['pixel_speed']
+    return config
+
+
+class Bot:
+    # Scripted driver: mostly straight ahead, turning at random (seeded) or
+    # when the block ahead is taken by a snake
+    def __init__(self, world, snake_id, rng):
+        self.world = world
+        self.id = snake_id
+        self.rng = rng
+
+    def _free(self, snake, direction):
+        size = snake.block_size
+        head = snake.body.head
+        ahead = (head[0] + direction.value[0] * size, head[1] + direction.value[1] * size)
+        for owner, _, _ in self.world.grid.overlaps(ahead):
+            if owner != FOOD_OWNER:
+                return False
+        return True
+
+    def input(self):
+        # Input message for this tick, or None
+        snake = self.world.snakes.get(self.id)
+        if snake is None:
+            return None
+        current = snake.direction
+        if self.rng.random() >= TURN_CHANCE and self._free(snake, current):
+            return None
+        options = [d for d in Direction
+                   if d != current and d.value != (-current.value[0], -current.value[1])]
+        self.rng.shuffle(options)
+        for direction in options:
+            if self._free(snake, direction):
+                return {"type": "input", "player_id": self.id, "dir": direction.name}
+        return None
+
+
+class Sim:
+    def __init__(self, scenario, seed=0):
+        self.scenario = scenario
+        self.config = make_config(scenario)
+        self.world = World(self.config, seed=seed)
+        rng = random.Random(seed)
+        self.spawn_rng = random.Random(rng.random())
+        self.bots = [Bot(self.world, sid, random.Random(rng.random())) for sid in range(scenario['snakes'])]
+        self.deaths = 0
+        for bot in self.bots:
+            self.spawn(bot.id)
+        self.world.spawn_food(scenario['food'])
+
+    def spawn(self, snake_id):
+        pos = self.world.grid.sample_free(self.spawn_rng)
+        if pos is None:
+            return
+        snake = self.world.add_snake(snake_id, pos, f"Bot {snake_id}")
+        snake.direction = snake.next_direction = self.spawn_rng.choice(list(Direction))
+        snake.grow_pending = (self.scenario['length'] - 1) * snake.block_size
+
+    def warmup_ticks(self):
+        # Enough ticks for a new snake to grow to full length
+        game = self.config['game']
+        per_block = game['block_size'] / game['pixel_speed'] if game['pixel_movement'] else 1
+        return int(self.scenario['length'] * per_block) + 1
+
+    def tick(self):
+        inputs = [msg for msg in (bot.input() for bot in self.bots) if msg is not None]
+        start = time.perf_counter()
+        events = self.world.step(inputs)
+        elapsed = time.perf_counter() - start
+        for event in events:
+            if event['type'] == 'death':
+                self.deaths += 1
+                self.spawn(event['player_id'])
+        return elapsed
+
+
+def _timings(times):
+    total = sum(times)
+    ordered = sorted(times)
+    return {"ticks": len(times),
+            "ticks_per_sec": len(times) / total if total else 0.0,
+            "tick_us": {"p50": _percentile(ordered, 0.50) * 1e6,
+                        "p95": _percentile(ordered, 0.95) * 1e6,
+                        "p99": _percentile(ordered, 0.99) * 1e6,
+                        "max": ordered[-1] * 1e6}}
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _micro(world):
+    # Median microseconds per call on the final world (medians shrug off the
+    # odd scheduler hiccup). Snakes keep moving through whatever they hit;
+    # only the timing matters here.
+    snakes = list(world.snakes.values())
+    update, collide, spawn = [], [], []
+    for _ in range(MICRO_REPEATS):
+        for snake in snakes:
+            start = time.perf_counter()
+            snake.update()
+            mid = time.perf_counter()
+            snake.check_collision()
+            update.append(mid - start)
+            collide.append(time.perf_counter() - mid)
+
+    food = world.food
+    for _ in range(MICRO_REPEATS):
+        start = time.perf_counter()
+        placed = food.spawn(1)
+        spawn.append(time.perf_counter() - start)
+        if placed:
+            food.remove(food.positions[-1])
+
+    return {"update_us": _median(update) * 1e6,
+            "check_collision_us": _median(collide) * 1e6,
+            "spawn_us": _median(spawn) * 1e6}
+
+
+def _median(samples):
+    return _percentile(sorted(samples), 0.5) if samples else 0.0
+
+
+def run_scenario(scenario, ticks=2000, seed=0):
+    sim = Sim(scenario, seed)
+    for _ in range(sim.warmup_ticks()):
+        sim.tick()
+    sim.deaths = 0
+
+    times = [sim.tick() for _ in range(ticks)]
+    points = [len(snake.body) for snake in sim.world.snakes.values()]
+    result = {
+        "name": scenario_name(scenario),
+        "scenario": scenario,
+        "seed": seed,
+        "deaths": sim.deaths,
+        "points": {"mean": sum(points) / len(points) if points else 0, "max": max(points, default=0)},
+    }
+    result.update(_timings(times))
+    result.update(_micro(sim.world))
+    result["peak_kb"] = peak_memory(scenario, max(1, ticks // 10), seed) / 1024
+    return result
+
+
+def peak_memory(scenario, ticks, seed=0):
+    # Peak bytes allocated building, warming up and running the scenario.
+    # Separate from the timed run since tracing slows everything down.
+    tracemalloc.start()
+    try:
+        sim = Sim(scenario, seed)
+        for _ in range(sim.warmup_ticks() + ticks):
+            sim.tick()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_replay(path):
+    # A recorded match as the workload (python -m bench --replay FILE).
+    # Tick times include reading the tick's record, a few microseconds.
+    replay = Replay(path)
+    times, deaths, world = [], 0, None
+    plays = replay.play()
+    while True:
+        start = time.perf_counter()
+        try:
+            world, events = next(plays)
+        except StopIteration:
+            break
+        times.append(time.perf_counter() - start)
+        deaths += sum(1 for event in events if event['type'] == 'death')
+    if world is None:
+        raise ValueError(f"{path} has no recorded ticks")
+
+    points = [len(snake.body) for snake in world.snakes.values()]
+    result = {"name": "replay-" + os.path.basename(path), "replay": path, "deaths": deaths,
+              "points": {"mean": sum(points) / len(points) if points else 0, "max": max(points, default=0)}}
+    result.update(_timings(times))
+    result.update(_micro(world))
+
+    tracemalloc.start()
+    try:
+        for _ in Replay(path).play():
+            pass
+        result["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+    return result
@@ -0,0 +1,288 @@
+import math
+from array import array
+from collections import deque
+from itertools import chain
+
+# Snake body storage.
+# RingBody keeps the body points in two typed arrays (x and y) used as a ring
+# buffer: body[0] is the head, body[-1] the tail. Pushing a new head and
+# popping the tail are O(1) and no per-point tuple objects are kept alive,
+# which matters in pixel mode where a snake holds block_size/pixel_speed
+# points per block of length. CornerBody (below) goes further and only keeps
+# the turn points.
+#
+# The head is also kept as a plain tuple (self.head): body[0] is read several
+# times per snake per tick, and iteration zips slices of the two arrays in C
+# rather than computing a slot and building a tuple per point in Python.
+
+class RingBody:
+    def __init__(self, points=(), typecode='d', capacity=16):
+        points = list(points)
+        self.typecode = typecode
+
+        cap = 16
+        while cap < max(capacity, len(points)):
+            cap *= 2
+        self._alloc(cap)
+
+        # points are given head first, like the old list body
+        for x, y in reversed(points):
+            self.push_head((x, y))
+
+    def _alloc(self, cap):
+        self._xs = array(self.typecode, [0]) * cap
+        self._ys = array(self.typecode, [0]) * cap
+        self._mask = cap - 1
+        self._head = 0 # Slot of body[0]
+        self._len = 0
+        self.head = None # body[0] as a tuple
+
+    def _grow(self):
+        # Double the capacity, re-laying points out from slot 0
+        xs, ys, head, mask, n, first = self._xs, self._ys, self._head, self._mask, self._len, self.head
+        self._alloc((mask + 1) * 2)
+        for i in range(n):
+            slot = (head + i) & mask
+            self._xs[i] = xs[slot]
+            self._ys[i] = ys[slot]
+        self._len = n
+        self.head = first
+
+    def push_head(self, point):
+        if self._len > self._mask:
+            self._grow()
+        head = self._head = (self._head - 1) & self._mask
+        self._xs[head] = point[0]
+        self._ys[head] = point[1]
+        self.head = (self._xs[head], self._ys[head]) # As stored (the arrays may round)
+        self._len += 1
+
+    def pop_tail(self):
+        if not self._len:
+            raise IndexError("pop from empty body")
+        self._len -= 1
+        if not self._len:
+            self.head = None
+        slot = (self._head + self._len) & self._mask
+        return (self._xs[slot], self._ys[slot])
+
+    def _slot(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("body index out of range")
+        return (self._head + index) & self._mask
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if index == 0 and self._len:
+            return self.head
+        if index == -1 and self._len:
+            slot = (self._head + self._len - 1) & self._mask
+            return (self._xs[slot], self._ys[slot])
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step == 1:
+                return list(self.iter_from(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        slot = self._slot(index)
+        return (self._xs[slot], self._ys[slot])
+
+    def __setitem__(self, index, point):
+        # Only used to snap the head onto the grid in place
+        slot = self._slot(index)
+        self._xs[slot] = point[0]
+        self._ys[slot] = point[1]
+        if slot == self._head:
+            self.head = (self._xs[slot], self._ys[slot])
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def keep_tail(self):
+        # Growing: simply don't pop
+        pass
+
+    def iter_from(self, start, stop=None):
+        # Iterate body[start:stop] without building a list: one or two
+        # contiguous runs of the arrays, depending on whether it wraps
+        stop = self._len if stop is None else min(stop, self._len)
+        if start >= stop:
+            return iter(())
+        xs, ys, cap = self._xs, self._ys, self._mask + 1
+        lo, hi = self._head + start, self._head + stop # Unwrapped slots
+        if lo >= cap:
+            lo, hi = lo - cap, hi - cap
+        if hi <= cap:
+            return zip(xs[lo:hi], ys[lo:hi]) # Array slices copy in C, faster to walk than islice
+        return chain(zip(xs[lo:], ys[lo:]), zip(xs[:hi - cap], ys[:hi - cap]))
+
+    def to_list(self):
+        return list(self)
+
+    def copy(self):
+        body = RingBody.__new__(RingBody)
+        body.typecode = self.typecode
+        body._xs = self._xs[:]
+        body._ys = self._ys[:]
+        body._mask, body._head, body._len = self._mask, self._head, self._len
+        body.head = self.head
+        return body
+
+
+def _span_hit(lo, hi, h, size, period):
+    # Is there an x in [lo, hi] whose block (size wide) overlaps the block at h?
+    # Coordinates are floored like pygame.Rect does for non-negative values.
+    lo, hi, h = math.floor(lo), math.floor(hi), math.floor(h)
+    if period is None:
+        return lo - size < h < hi + size
+    start = lo - size + 1
+    if hi + size - start >= period:
+        return True
+    return start + (h - start) % period < hi + size
+
+
+class CornerBody:
+    # Pixel-mode body stored as its turn points only (head first), plus the
+    # path length between head and tail. Turns only ever happen on grid lines,
+    # so head, tail and corners fully describe the shape: a long snake is a
+    # handful of points instead of block_size/pixel_speed points per block.
+    #
+    # On a wrap-around arena corners are kept unwrapped (a segment never jumps
+    # across the board); whenever the head leaves the arena everything is
+    # shifted back so the head itself stays inside it.
+
+    def __init__(self, points=(), period=None):
+        self.corners = deque(tuple(p) for p in points)
+        self.period = period # (width, height) when walls wrap, else None
+        self.length = 0.0
+        for a, b in self.segments():
+            self.length += abs(a[0] - b[0]) + abs(a[1] - b[1])
+        self._advanced = 0.0 # Head travel since the tail was last updated
+
+    def __len__(self):
+        return len(self.corners)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.corners)[index]
+        return self.corners[index]
+
+    def __iter__(self):
+        return iter(self.corners)
+
+    @property
+    def head(self):
+        return self.corners[0]
+
+    def to_list(self):
+        return list(self.corners)
+
+    def copy(self):
+        body = CornerBody((), self.period)
+        body.corners = deque(self.corners)
+        body.length = self.length
+        body._advanced = self._advanced
+        return body
+
+    def segments(self):
+        # (nearer_to_head, nearer_to_tail) pairs; a lone point is one empty segment
+        if len(self.corners) == 1:
+            yield self.corners[0], self.corners[0]
+        for i in range(len(self.corners) - 1):
+            yield self.corners[i], self.corners[i + 1]
+
+    def push_head(self, point):
+        """Move the head to point (one straight move from the current head).
+           Returns the (from, to) leg the head travelled, before any re-basing.
+        """
+        hx, hy = self.corners[0]
+        dx, dy = point[0] - hx, point[1] - hy
+        if self.period:
+            # point comes in wrapped; take the short way round
+            w, h = self.period
+            dx = (dx + w / 2) % w - w / 2
+            dy = (dy + h / 2) % h - h / 2
+        if not dx and not dy:
+            return None
+        new_head = (hx + dx, hy + dy)
+
+        # Keep going straight: stretch the head segment, else the old head is a corner
+        if len(self.corners) > 1:
+            nx, ny = self.corners[1]
+            straight = ((dx and hx != nx and (dx > 0) == (hx > nx) and hy == ny) or
+                        (dy and hy != ny and (dy > 0) == (hy > ny) and hx == nx))
+        else:
+            straight = False
+        if straight:
+            self.corners[0] = new_head
+        else:
+            self.corners.appendleft(new_head)
+
+        step = abs(dx) + abs(dy)
+        self.length += step
+        self._advanced += step
+        self._rebase()
+        return (hx, hy), new_head
+
+    def _rebase(self):
+        if not self.period:
+            return
+        w, h = self.period
+        hx, hy = self.corners[0]
+        shift_x = math.floor(hx / w) * w
+        shift_y = math.floor(hy / h) * h
+        if shift_x or shift_y:
+            self.corners = deque((x - shift_x, y - shift_y) for x, y in self.corners)
+
+    def pop_tail(self):
+        """Pull the tail in by as far as the head moved since the last call.
+           Returns the legs the tail travelled, tail end first.
+        """
+        dist, self._advanced = self._advanced, 0.0
+        legs = []
+        while dist > 0 and len(self.corners) > 1:
+            tx, ty = self.corners[-1]
+            nx, ny = self.corners[-2]
+            seg = abs(nx - tx) + abs(ny - ty)
+            if seg <= dist:
+                self.corners.pop()
+                legs.append(((tx, ty), (nx, ny)))
+                dist -= seg
+                self.length -= seg
+            else:
+                frac = dist / seg
+                end = (tx + (nx - tx) * frac, ty + (ny - ty) * frac)
+                self.corners[-1] = end
+                legs.append(((tx, ty), end))
+                self.length -= dist
+                dist = 0
+        return legs
+
+    def keep_tail(self):
+        # Growing: the tail stays put and the head travel becomes extra length
+        self._advanced = 0.0
+
+    def overlaps(self, point, size, skip=0.0):
+        """Does the block at point overlap any block along the body?
+           skip: ignore this much path length behind the head (the neck).
+        """
+        px_period = self.period[0] if self.period else None
+        py_period = self.period[1] if self.period else None
+
+        for a, b in self.segments():
+            seg = abs(a[0] - b[0]) + abs(a[1] - b[1])
+            if skip > 0 and skip >= seg:
+                skip -= seg
+                continue
+            if skip > 0:
+                # Start part way along this segment
+                frac = skip / seg
+                a = (a[0] + (b[0] - a[0]) * frac, a[1] + (b[1] - a[1]) * frac)
+                skip = 0
+            if (_span_hit(min(a[0], b[0]), max(a[0], b[0]), point[0], size, px_period) and
+                _span_hit(min(a[1], b[1]), max(a[1], b[1]), point[1], size, py_period)):
+                return True
+        return False
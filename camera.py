@@ -0,0 +1,198 @@
+from utils import arena_size
+
+# Viewport onto an arena bigger than the window (arena.width/height in config).
+#
+# The camera keeps the followed head in the middle of the window: clamped to
+# the arena edges when walls are solid, scrolling seamlessly across them when
+# they wrap. An axis where the arena fits in the window doesn't scroll, so
+# with the default arena (the window size) nothing moves and world and screen
+# coordinates are the same.
+#
+# Culling: a point body is cut into chunks of CHUNK points by seq number
+# (body[i] was pushed as seq - i). Points never move once pushed, so once the
+# head has left a chunk its bounding box is computed once and filed in a
+# coarse grid of CELL px cells. Per frame only the chunks filed under the
+# cells in view are tested, plus the few newest ones, and only the points of
+# the visible ones are walked: what a frame costs depends on what is on
+# screen, not on how long the snakes or how big the arena are.
+
+CHUNK = 32 # Body points per culling box
+LIVE_CHUNKS = 2 # Newest chunks recomputed every frame (the head snaps onto the grid in place)
+CELL = 256 # px per side of a culling grid cell
+WIDE_CELLS = 16 # Boxes covering more cells (across a wrap seam) are always tested
+
+
+def _axis_visible(lo, hi, view, size, arena, wrap):
+    # Does [lo, hi) overlap [view, view + size), going round a wrapping arena?
+    if not wrap:
+        return lo < view + size and view < hi
+    if hi - lo >= arena:
+        return True
+    d = (lo - view) % arena
+    return d < size or d + (hi - lo) > arena
+
+
+class Camera:
+    def __init__(self, config):
+        self.view_w = config['window']['width']
+        self.view_h = config['window']['height']
+        self.arena_w, self.arena_h = arena_size(config)
+        self.block_size = config['game']['block_size']
+        self.wrap = not config['game']['solid_walls']
+        self.scroll_x = self.arena_w > self.view_w
+        self.scroll_y = self.arena_h > self.view_h
+        self.x = 0 # World position of the window's top-left corner
+        self.y = 0
+        self.cols = -(-self.arena_w // CELL) # Culling grid
+        self.rows = -(-self.arena_h // CELL)
+        self.indexes = {} # snake ID -> _BodyIndex
+
+    @property
+    def active(self):
+        return self.scroll_x or self.scroll_y
+
+    def follow(self, point):
+        # Centre the view on the block at point
+        half = self.block_size / 2
+        if self.scroll_x:
+            x = point[0] + half - self.view_w / 2
+            self.x = int(x % self.arena_w if self.wrap else min(max(x, 0), self.arena_w - self.view_w))
+        if self.scroll_y:
+            y = point[1] + half - self.view_h / 2
+            self.y = int(y % self.arena_h if self.wrap else min(max(y, 0), self.arena_h - self.view_h))
+
+    def to_screen(self, point):
+        x, y = point[0] - self.x, point[1] - self.y
+        if self.wrap:
+            # The copy nearest the view; a block straddling the left/top edge stays there
+            if self.scroll_x:
+                x %= self.arena_w
+                if x > self.arena_w - self.block_size:
+                    x -= self.arena_w
+            if self.scroll_y:
+                y %= self.arena_h
+                if y > self.arena_h - self.block_size:
+                    y -= self.arena_h
+        return x, y
+
+    def visible(self, left, top, right, bottom):
+        # Does the world box overlap the view?
+        return ((not self.scroll_x or _axis_visible(left, right, self.x, self.view_w, self.arena_w, self.wrap)) and
+                (not self.scroll_y or _axis_visible(top, bottom, self.y, self.view_h, self.arena_h, self.wrap)))
+
+    def block_visible(self, point):
+        size = self.block_size
+        return self.visible(point[0], point[1], point[0] + size, point[1] + size)
+
+    def rects(self, rect):
+        # Screen rects for a world rect: none if it's off screen, two if it
+        # straddles the seam of a wrapping arena
+        left, top, w, h = rect
+        if not self.visible(left, top, left + w, top + h):
+            return []
+        xs, ys = [left - self.x], [top - self.y]
+        if self.wrap and self.scroll_x:
+            x = (left - self.x) % self.arena_w
+            xs = [sx for sx in (x, x - self.arena_w) if sx < self.view_w and sx + w > 0]
+        if self.wrap and self.scroll_y:
+            y = (top - self.y) % self.arena_h
+            ys = [sy for sy in (y, y - self.arena_h) if sy < self.view_h and sy + h > 0]
+        return [(sx, sy, w, h) for sx in xs for sy in ys]
+
+    def prune(self, snakes):
+        # Forget the indexes of snakes that are gone
+        for sid in [sid for sid in self.indexes if sid not in snakes]:
+            del self.indexes[sid]
+
+    def _cells(self, left, top, right, bottom):
+        # Cells under a world box (right/bottom exclusive)
+        cols = range(int(left) // CELL, (int(right) - 1) // CELL + 1)
+        rows = range(int(top) // CELL, (int(bottom) - 1) // CELL + 1)
+        if self.wrap:
+            return {(cx % self.cols, cy % self.rows) for cx in cols for cy in rows}
+        return {(cx, cy) for cx in cols for cy in rows}
+
+    def view_cells(self):
+        left = self.x if self.scroll_x else 0
+        top = self.y if self.scroll_y else 0
+        return self._cells(left, top, left + max(self.view_w, self.arena_w * (not self.scroll_x)),
+                           top + max(self.view_h, self.arena_h * (not self.scroll_y)))
+
+    def runs(self, snake, start, stop):
+        """Visible parts of body[start:stop] as (start, stop) index ranges,
+           newest first, adjacent chunks merged.
+        """
+        index = self.indexes.get(snake.id)
+        if index is None or index.body is not snake.body or index.seq > snake.seq:
+            # New, replaced or rewound body: nothing filed is valid
+            index = self.indexes[snake.id] = _BodyIndex(self, snake.body)
+        index.update(snake.seq)
+
+        seq = snake.seq
+        newest, oldest = (seq - start) // CHUNK, (seq - stop + 1) // CHUNK
+        chunks = {c for cell in self.view_cells() for c in index.cells.get(cell, ())}
+        chunks.update(index.wide)
+        chunks = [c for c in chunks if oldest <= c <= newest and self.visible(*index.boxes[c])]
+        for c in range(max(index.settled + 1, oldest), newest + 1):
+            if self.visible(*index.box(c)):
+                chunks.append(c)
+
+        runs = []
+        for c in sorted(chunks, reverse=True):
+            first = max(start, seq - c * CHUNK - CHUNK + 1)
+            end = min(stop, seq - c * CHUNK + 1)
+            if runs and runs[-1][1] == first:
+                runs[-1] = (runs[-1][0], end)
+            else:
+                runs.append((first, end))
+        return runs
+
+
+class _BodyIndex:
+    # Culling boxes of one snake body's settled chunks, filed by camera cell
+    def __init__(self, camera, body):
+        self.camera = camera
+        self.body = body
+        self.seq = None
+        self.boxes = {} # chunk -> (left, top, right, bottom)
+        self.cells = {} # cell -> set of chunks
+        self.wide = set()
+        self.lo = self.settled = None # Chunks lo..settled are filed
+
+    def box(self, chunk):
+        # Bounding box of the chunk's points still in the body
+        seq, size = self.seq, self.camera.block_size
+        first = max(0, seq - chunk * CHUNK - CHUNK + 1)
+        count = seq - max(chunk * CHUNK, seq - len(self.body) + 1) + 1 - first
+        xs, ys = [], []
+        for x, y in self.body.iter_from(first, first + count):
+            xs.append(x)
+            ys.append(y)
+        return (min(xs), min(ys), max(xs) + size, max(ys) + size)
+
+    def update(self, seq):
+        self.seq = seq
+        oldest = (seq - len(self.body) + 1) // CHUNK
+        if self.lo is None:
+            self.lo, self.settled = oldest, oldest - 1
+        # Chunks gone off the tail
+        while self.lo < oldest:
+            box = self.boxes.pop(self.lo, None)
+            if box is not None:
+                if self.lo in self.wide:
+                    self.wide.discard(self.lo)
+                else:
+                    for cell in self.camera._cells(*box):
+                        self.cells[cell].discard(self.lo)
+            self.lo += 1
+        # Chunks the head has left behind for good
+        self.settled = max(self.settled, self.lo - 1)
+        while self.settled < seq // CHUNK - LIVE_CHUNKS:
+            self.settled += 1
+            box = self.boxes[self.settled] = self.box(self.settled)
+            cells = self.camera._cells(*box)
+            if len(cells) > WIDE_CELLS:
+                self.wide.add(self.settled)
+            else:
+                for cell in cells:
+                    self.cells.setdefault(cell, set()).add(self.settled)
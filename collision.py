@@ -0,0 +1,146 @@
+from utils import blocks_overlap
+
+try:
+    import numpy as np
+except ImportError: # Pure Python fallback below
+    np = None
+
+# Block-vs-body overlap tests over whole point bodies (RingBody).
+#
+# With NumPy the body's x/y arrays are viewed in place (no copy) and every
+# point is tested in one vectorized pass; without it the same test runs as a
+# plain loop. Either way the answer matches blocks_overlap(), including
+# pygame.Rect's truncation to ints, and, when given a period (width, height),
+# the wrap-around distance OccupancyGrid uses.
+#
+# The engine normally asks its OccupancyGrid instead, which only looks at the
+# cells around the head. These are for bodies that aren't in a grid, and for
+# checking every head against every body at once (heads_vs_bodies).
+
+_DTYPES = {'d': 'float64', 'f': 'float32', 'i': 'int32'}
+
+
+def _ring_slices(body, start):
+    # Slot ranges of body[start:] in the ring arrays, as at most two slices
+    cap = body._mask + 1
+    first = (body._head + start) & body._mask
+    count = len(body) - start
+    if count <= 0:
+        return []
+    if first + count <= cap:
+        return [slice(first, first + count)]
+    return [slice(first, cap), slice(0, first + count - cap)]
+
+
+def _views(body):
+    dtype = _DTYPES[body.typecode]
+    return np.frombuffer(body._xs, dtype=dtype), np.frombuffer(body._ys, dtype=dtype)
+
+
+def _near(values, p, size, period):
+    # Per point: is the truncated coordinate within size of p?
+    d = np.abs(np.trunc(values) - p)
+    if period is not None:
+        d = np.minimum(d, period - d)
+    return d < size
+
+
+def body_hits(body, point, size, start=0, period=None):
+    """Does the block at point overlap the block of any point in body[start:]?"""
+    px, py = int(point[0]), int(point[1])
+    if np is None:
+        if period is None:
+            for segment in body.iter_from(start):
+                if blocks_overlap(point, segment, size):
+                    return True
+            return False
+        width, height = period
+        for x, y in body.iter_from(start):
+            dx = abs(int(x) - px)
+            dy = abs(int(y) - py)
+            if min(dx, width - dx) < size and min(dy, height - dy) < size:
+                return True
+        return False
+
+    xs, ys = _views(body)
+    wx, wy = period if period is not None else (None, None)
+    for part in _ring_slices(body, start):
+        if np.any(_near(xs[part], px, size, wx) & _near(ys[part], py, size, wy)):
+            return True
+    return False
+
+
+def heads_vs_bodies(snakes, size, period=None, neck=None):
+    """Ids of the snakes whose head overlaps a body: any point of another
+       snake, or one of their own points past the neck.
+       snakes: {id: Snake} with point bodies.
+       neck: {id: number of own points behind the head to skip} (default 1).
+    """
+    neck = neck or {}
+    if np is None:
+        hit = set()
+        for sid, snake in snakes.items():
+            head = snake.body.head
+            for other_id, other in snakes.items():
+                start = neck.get(sid, 1) if other_id == sid else 0
+                if body_hits(other.body, head, size, start, period):
+                    hit.add(sid)
+                    break
+        return hit
+
+    # All bodies side by side: one (heads x points) comparison
+    ids = list(snakes)
+    if not ids:
+        return set()
+    heads = np.array([[int(c) for c in snakes[sid].body.head] for sid in ids], dtype=np.float64)
+    xs, ys, owners, index = [], [], [], []
+    for n, sid in enumerate(ids):
+        body = snakes[sid].body
+        bx, by = _views(body)
+        done = 0
+        for part in _ring_slices(body, 0):
+            xs.append(bx[part])
+            ys.append(by[part])
+            count = part.stop - part.start
+            owners.append(np.full(count, n))
+            index.append(np.arange(done, done + count)) # Position along the body
+            done += count
+    xs = np.trunc(np.concatenate(xs))
+    ys = np.trunc(np.concatenate(ys))
+    owners = np.concatenate(owners)
+    index = np.concatenate(index)
+
+    dx = np.abs(xs[None, :] - heads[:, 0:1])
+    dy = np.abs(ys[None, :] - heads[:, 1:2])
+    if period is not None:
+        dx = np.minimum(dx, period[0] - dx)
+        dy = np.minimum(dy, period[1] - dy)
+    overlap = (dx < size) & (dy < size)
+
+    # Own points inside the neck don't count
+    necks = np.array([neck.get(sid, 1) for sid in ids])
+    own = owners[None, :] == np.arange(len(ids))[:, None]
+    overlap &= ~(own & (index[None, :] < necks[:, None]))
+    return {ids[n] for n in np.flatnonzero(overlap.any(axis=1))}
+
+
+if __name__ == "__main__":
+    # Compare against the pure Python loop: python collision.py [points]
+    import sys
+    import time
+    from body import RingBody
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    body = RingBody([(i * 3.0 % 800, i * 3.0 // 800 * 20) for i in range(n)], 'd')
+    head = (790.0, 590.0)
+    backend = np
+    for name in ("numpy", "python"):
+        if name == "numpy" and backend is None:
+            print("numpy not installed")
+            continue
+        np = backend if name == "numpy" else None
+        start = time.perf_counter()
+        for _ in range(200):
+            body_hits(body, head, 20, 20)
+        elapsed = (time.perf_counter() - start) / 200
+        print(f"{name}: {n} points in {elapsed * 1e6:.0f} us")
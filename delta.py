@@ -0,0 +1,262 @@
+from body import RingBody, CornerBody
+from utils import arena_size
+
+# Keyframe + delta state broadcast.
+#
+# The host used to send every point of every snake on every tick. Now it
+# sends a full 'state' keyframe every KEYFRAME_INTERVAL ticks (or when a
+# client asks for one), and in between a 'delta' that only carries what
+# changed since the previous tick:
+#
+#   {"type": "delta", "tick": 12, "base": 11,
+#    "snakes": [{"id": 1, "push": 1, "head": [[x, y], [x, y]], "trim": 1, "len": 40,
+#                "dir": "UP"}],            # dir only when it changed
+#    "added": [<Snake.to_dict()>], "removed": [2],
+#    "food_add": [[x, y]], "food_remove": [[x, y]],
+#    "scores": {"1": 30},                  # changed scores only
+#    "acks": {"1": [17, 840]}}             # changed input acks only
+#
+# 'tick' is the host's World.tick, so messages needn't go out every tick;
+# 'base' is the tick of the previous message. 'acks' holds, per player, the
+# seq of the last numbered input the host applied and the tick it was applied
+# on, for client-side reconciliation (see interp.py).
+#
+# 'head' is the newest push+1 points, head first: the extra (last) one is the
+# previous head, re-sent because grid snapping may have moved it in place.
+# If the snake moved its whole length or more, 'head' is simply the new body.
+# Corner bodies are tiny, so they simply send 'body' (all corners) instead.
+#
+# A client that misses a tick (joined late, fell out of sync) can't apply the
+# next delta; it sends {"type": "resync"} and waits for a keyframe. Only that
+# client gets one (see take_resyncs): over UDP a lost snapshot is routine, and
+# a room-wide keyframe per loss would drown everyone else's deltas.
+
+KEYFRAME_INTERVAL = 60
+RESYNC_RETRY = 30 # Deltas to ignore before asking for a keyframe again
+
+
+def make_body(model, points, period=None):
+    if model == 'corners':
+        return CornerBody(points, period)
+    if model == 'grid':
+        # The binary wire format sends floats; grid bodies are integer arrays
+        return RingBody([(int(x), int(y)) for x, y in points], 'i')
+    return RingBody(points, 'd')
+
+
+class StateEncoder:
+    # Host side. One encoder per match; every client gets the same stream,
+    # bar the odd keyframe for a client that lost track of it.
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.tick = 0
+        self.last_keyframe = None
+        self.force_keyframe = True
+        self.resyncs = set() # Player IDs waiting for a keyframe of their own
+        self.sent = {} # snake ID -> (seq, len, direction, score)
+        self.food = set()
+        self.acks = {} # player ID -> (seq, tick) last sent
+
+    def request_keyframe(self, pid=None):
+        # pid: just that client lost track; None: everyone gets a keyframe
+        if pid is None:
+            self.force_keyframe = True
+        else:
+            self.resyncs.add(pid)
+
+    def take_resyncs(self, snakes, food_positions, acks=None):
+        # After encode(): (IDs of the clients that asked for a keyframe, a full
+        # state at this tick for them instead of the message everyone else
+        # gets), or (empty set, None). The shared stream carries on untouched,
+        # so its next delta applies on top of either.
+        pids, self.resyncs = self.resyncs, set()
+        if not pids:
+            return pids, None
+        msg = self._state(snakes, food_positions)
+        if acks:
+            msg["acks"] = {str(pid): list(ack) for pid, ack in acks.items()}
+        return pids, msg
+
+    def encode(self, snakes, food_positions, tick=None, acks=None):
+        # tick: the world tick this describes (default: one more than last time)
+        # acks: World.acks
+        self.base = self.tick
+        self.tick = self.tick + 1 if tick is None else tick
+        if (self.force_keyframe or self.last_keyframe is None or
+                self.tick - self.last_keyframe >= self.keyframe_interval):
+            msg = self._keyframe(snakes, food_positions)
+            changed = dict(acks or {})
+        else:
+            msg = self._delta(snakes, food_positions)
+            changed = {pid: ack for pid, ack in (acks or {}).items() if self.acks.get(pid) != ack}
+        if changed:
+            msg["acks"] = {str(pid): list(ack) for pid, ack in changed.items()}
+            self.acks.update(changed)
+        return msg
+
+    def _remember(self, snake):
+        self.sent[snake.id] = (snake.seq, len(snake.body), snake.direction, snake.score)
+
+    def _keyframe(self, snakes, food_positions):
+        self.force_keyframe = False
+        self.last_keyframe = self.tick
+        self.resyncs.clear() # Everyone gets this one
+        self.sent = {}
+        for s in snakes.values():
+            self._remember(s)
+        self.food = set(food_positions)
+        return self._state(snakes, food_positions)
+
+    def _state(self, snakes, food_positions):
+        return {
+            "type": "state",
+            "tick": self.tick,
+            "snakes": [s.to_dict() for s in snakes.values()],
+            "food": list(food_positions),
+            "scores": {str(sid): s.score for sid, s in snakes.items()}
+        }
+
+    def _delta(self, snakes, food_positions):
+        msg = {"type": "delta", "tick": self.tick, "base": self.base}
+        changes = []
+        added = []
+        scores = {}
+
+        for sid, s in snakes.items():
+            if sid not in self.sent:
+                added.append(s.to_dict())
+                scores[str(sid)] = s.score
+                self._remember(s)
+                continue
+
+            seq, length, direction, score = self.sent[sid]
+            change = {"id": sid}
+            if s.corner_mode:
+                change["body"] = s.body.to_list()
+            else:
+                pushed = s.seq - seq
+                if pushed or len(s.body) != length:
+                    change["push"] = pushed
+                    change["head"] = s.body[:pushed + 1]
+                    change["trim"] = length + pushed - len(s.body)
+                    change["len"] = len(s.body)
+            if s.direction != direction:
+                change["dir"] = s.direction.name
+            if len(change) > 1:
+                changes.append(change)
+            if s.score != score:
+                scores[str(sid)] = s.score
+            self._remember(s)
+
+        removed = [sid for sid in self.sent if sid not in snakes]
+        for sid in removed:
+            del self.sent[sid]
+
+        food = set(food_positions)
+        food_add = [p for p in food_positions if p not in self.food]
+        food_remove = [p for p in self.food if p not in food]
+        self.food = food
+
+        if changes:
+            msg["snakes"] = changes
+        if added:
+            msg["added"] = added
+        if removed:
+            msg["removed"] = removed
+        if food_add:
+            msg["food_add"] = food_add
+        if food_remove:
+            msg["food_remove"] = food_remove
+        if scores:
+            msg["scores"] = scores
+        return msg
+
+
+class StateDecoder:
+    # Client side mirror of the host's state, rebuilt from keyframes + deltas.
+    def __init__(self, config):
+        if config['game']['solid_walls']:
+            self.period = None
+        else:
+            self.period = arena_size(config)
+        self.tick = None # Last tick applied; None until the first keyframe
+        self.snakes = {} # ID -> {"id", "name", "color", "model", "direction", "seq", "body"}
+        self.food = []
+        self.scores = {}
+        self.acks = {} # player ID (str) -> [seq, tick]
+        self.ignored = 0
+
+    def _add_snake(self, data):
+        self.snakes[data['id']] = {
+            "id": data['id'],
+            "name": data['name'],
+            "color": tuple(data['color']),
+            "model": data.get('model', 'points'),
+            "direction": data['direction'],
+            "seq": data.get('seq', 0),
+            "body": make_body(data.get('model', 'points'), data['body'], self.period),
+        }
+
+    def apply(self, msg):
+        """Apply a 'state' or 'delta' message.
+           Returns (applied, want_resync).
+        """
+        if msg['type'] == 'state':
+            self.snakes = {}
+            for data in msg['snakes']:
+                self._add_snake(data)
+            self.food = [tuple(p) for p in msg['food']]
+            self.scores = dict(msg['scores'])
+            self.acks.update(msg.get('acks', {}))
+            self.tick = msg.get('tick')
+            self.ignored = 0
+            return True, False
+
+        if self.tick is None or msg['base'] != self.tick:
+            # Missing history: ask for a keyframe, then again every so often
+            self.ignored += 1
+            return False, self.ignored % RESYNC_RETRY == 1
+
+        for data in msg.get('added', []):
+            self._add_snake(data)
+        for sid in msg.get('removed', []):
+            self.snakes.pop(sid, None)
+
+        for change in msg.get('snakes', []):
+            snake = self.snakes.get(change['id'])
+            if snake is None:
+                continue
+            if 'body' in change:
+                snake['body'] = make_body(snake['model'], change['body'], self.period)
+            elif 'head' in change:
+                body = snake['body']
+                head = change['head']
+                if snake['model'] == 'grid':
+                    head = [(int(x), int(y)) for x, y in head]
+                if len(head) <= change['push']:
+                    # Moved further than its own length since the last
+                    # message: head is the whole body
+                    body = snake['body'] = make_body(snake['model'], head, self.period)
+                else:
+                    body[0] = head[-1]
+                    for point in reversed(head[:-1]):
+                        body.push_head(point)
+                    for _ in range(change['trim']):
+                        body.pop_tail()
+                snake['seq'] += change['push']
+                if len(body) != change['len']:
+                    # Out of step with the host
+                    self.tick = None
+                    self.ignored = 0
+                    return False, True
+            if 'dir' in change:
+                snake['direction'] = change['dir']
+
+        removed_food = {tuple(p) for p in msg.get('food_remove', [])}
+        if removed_food:
+            self.food = [p for p in self.food if p not in removed_food]
+        self.food.extend(tuple(p) for p in msg.get('food_add', []))
+        self.scores.update(msg.get('scores', {}))
+        self.acks.update(msg.get('acks', {}))
+        self.tick = msg['tick']
+        return True, False
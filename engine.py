@@ -0,0 +1,218 @@
+import random
+import time
+from snake import Snake, Direction
+from food import Food
+from grid import OccupancyGrid, FOOD_OWNER
+import collision
+from utils import arena_size
+
+# Headless game rules.
+# World owns snakes + food and advances them one tick at a time with step().
+# Nothing in here imports pygame, so the server tick can run (and be timed)
+# without a display, a mixer or clock.tick(60). Game drives it for rendering.
+
+def tick_rate(config):
+    # Simulation ticks per second. Grid mode moves one block per tick, so
+    # 'speed' is its rate; pixel mode moves pixel_speed px per tick.
+    if config['game'].get('pixel_movement', False):
+        return config['game'].get('tick_rate', 60)
+    return config['game']['speed']
+
+
+class World:
+    def __init__(self, config, seed=None):
+        self.config = config
+        self.width, self.height = arena_size(config)
+        self.rng = random.Random(seed)
+        self.tick_rate = tick_rate(config)
+
+        self.snakes = {} # ID -> Snake
+        # Every body point and food item, for constant-time head checks
+        # and for picking empty cells to spawn food in
+        self.grid = OccupancyGrid(config)
+        self.food = Food(config, rng=self.rng, grid=self.grid)
+        # 'numpy': test every head against every point body in one vectorized
+        # pass after all snakes moved (faster than the grid only when bodies
+        # are long and tightly packed). Needs NumPy; otherwise, and for
+        # corner bodies, the grid does it.
+        self.vectorized = (config['game'].get('collision', 'grid') == 'numpy' and
+                           collision.np is not None and
+                           config['game'].get('body_model', 'points') != 'corners')
+        self.period = None if config['game']['solid_walls'] else (self.width, self.height)
+        self.dead_players = set() # Track dead players to prevent respawn
+        self.tick = 0
+        self.acks = {} # player ID -> (seq, tick) of the last numbered input applied
+        self.seed = seed
+        self.recorder = None # replay.Recorder, told about every input and change
+        self.stepping = False
+        self.profiler = None # profiler.Profiler, gets move/collide/food times per step
+
+    def add_snake(self, snake_id, start_pos, name, color=None):
+        snake = Snake(self.config, start_pos, snake_id, name)
+        if color is not None:
+            snake.color = color
+        if snake_id in self.snakes:
+            self.snakes[snake_id].detach()
+        snake.attach(self.grid)
+        self.snakes[snake_id] = snake
+        if self.recorder is not None:
+            self.recorder.add(snake_id, start_pos, name, color)
+        return snake
+
+    def remove_snake(self, snake_id):
+        if snake_id in self.snakes:
+            self.snakes.pop(snake_id).detach()
+            self.dead_players.add(snake_id)
+            if self.recorder is not None and not self.stepping:
+                self.recorder.remove(snake_id)
+
+    def spawn_food(self, count=1):
+        # Spawn food on cells no snake covers. Returns how many were placed
+        # (0 once the board is full).
+        placed = self.food.spawn(count)
+        if self.recorder is not None and not self.stepping:
+            self.recorder.spawn(count)
+        return placed
+
+    def apply_input(self, msg):
+        # msg uses the network message shape:
+        # {"type": "input", "player_id": 1, "dir": "UP"} or
+        # {"type": "accel", "player_id": 1, "state": True}
+        # Inputs may carry a "seq" number; the latest one applied is acked
+        # back to the client together with the tick it took effect on.
+        pid = msg.get('player_id')
+        if pid not in self.snakes:
+            return
+        snake = self.snakes[pid]
+        if 'seq' in msg:
+            self.acks[pid] = (msg['seq'], self.tick)
+
+        if msg['type'] == 'input':
+            direction = Direction[msg['dir']]
+            # BUG FIX 2: Validate against *physical* direction (direction)
+            # to firmly prevent 180 turns even with fast input queuing
+            curr_dir = snake.direction
+
+            # 180 degree check
+            if (direction.value[0] * -1 != curr_dir.value[0] or
+                direction.value[1] * -1 != curr_dir.value[1]):
+                snake.next_direction = direction
+
+        elif msg['type'] == 'accel':
+            snake.accelerating = msg['state']
+
+        if self.recorder is not None and not self.stepping:
+            self.recorder.input(msg)
+
+    def step(self, inputs=(), held=None):
+        """Advance the world by one tick.
+           inputs: iterable of input/accel messages (see apply_input).
+           held: {player_id: set of Directions} for locally controlled snakes.
+           Returns a list of events: 'eat' and 'death' dicts.
+        """
+        if self.recorder is not None:
+            inputs = list(inputs)
+            self.recorder.step(inputs, held)
+        self.stepping = True # Changes from here on follow from what was recorded
+        for msg in inputs:
+            self.apply_input(msg)
+
+        held = held or {}
+        events = []
+        dead_snakes = []
+        clock = time.perf_counter
+        start = clock()
+        moved = fed = 0.0 # Seconds in Snake.update and in eating/spawning; the rest is collision
+
+        hits = None
+        if self.vectorized:
+            # Move everybody first, then one pass for all heads vs all bodies
+            t = clock()
+            for snake_id, snake in self.snakes.items():
+                snake.update(held=held.get(snake_id))
+            moved += clock() - t
+            hits = collision.heads_vs_bodies(self.snakes, self.grid.block_size, self.period,
+                                             {sid: s.neck for sid, s in self.snakes.items()})
+
+        for snake_id, snake in self.snakes.items():
+            if hits is not None:
+                if snake.hits_wall() or snake_id in hits:
+                    dead_snakes.append(snake_id)
+                    continue
+            else:
+                t = clock()
+                snake.update(held=held.get(snake_id))
+                moved += clock() - t
+
+                # Check collision (Walls and Self)
+                if snake.check_collision():
+                    dead_snakes.append(snake_id)
+                    continue
+
+            # Check collision with other snakes' bodies and with food,
+            # looking only at the grid cells around the head
+            head = snake.body.head
+            eaten_pos = None
+
+            for owner, seq, point in self.grid.overlaps(head):
+                if owner == FOOD_OWNER:
+                    eaten_pos = point
+                elif owner != snake_id and hits is None:
+                    dead_snakes.append(snake_id)
+                    break
+
+            if snake.corner_mode and snake_id not in dead_snakes:
+                # Corner bodies aren't in the grid; test their segments instead
+                for other_id, other_snake in self.snakes.items():
+                    if other_id != snake_id and other_snake.body.overlaps(head, other_snake.block_size):
+                        dead_snakes.append(snake_id)
+                        break
+
+            if snake_id in dead_snakes:
+                continue
+
+            if eaten_pos:
+                t = clock()
+                self.food.remove(eaten_pos)
+                snake.grow()
+                snake.score += self.config['game']['score_per_food']
+
+                # Spawn new food
+                self.spawn_food(1)
+                events.append({"type": "eat", "player_id": snake_id,
+                               "pos": eaten_pos, "score": snake.score})
+                fed += clock() - t
+
+        # Remove dead snakes from game
+        for snake_id in dead_snakes:
+            score = self.snakes[snake_id].score
+            self.remove_snake(snake_id)
+            events.append({"type": "death", "player_id": snake_id, "score": score})
+
+        if self.profiler is not None:
+            self.profiler.add('move', moved)
+            self.profiler.add('collide', clock() - start - moved - fed)
+            self.profiler.add('food', fed)
+
+        self.tick += 1
+        self.stepping = False
+        return events
+
+
+if __name__ == "__main__":
+    # Quick headless throughput check: python engine.py [ticks]
+    import sys
+    from utils import load_config
+
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    world = World(load_config(), seed=0)
+    world.add_snake(0, (world.width // 2, world.height // 2), "Bot")
+    world.spawn_food(1)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        if not world.snakes:
+            break
+        world.step()
+    elapsed = time.perf_counter() - start
+    print(f"{world.tick} ticks in {elapsed:.3f}s ({world.tick / elapsed:.0f} ticks/s)")
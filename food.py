@@ -1,43 +1,44 @@
-import pygame
 import random
+from grid import OccupancyGrid, FOOD_OWNER
+from utils import arena_size
+
 
 class Food:
-    def __init__(self, config):
+    def __init__(self, config, rng=None, grid=None):
         self.block_size = config['game']['block_size']
         self.color = tuple(config['colors']['food'])
-        self.window_width = config['window']['width']
-        self.window_height = config['window']['height']
+        self.arena_width, self.arena_height = arena_size(config)
         self.positions = []
+        # Seeded by the engine so headless runs are reproducible
+        self.rng = rng if rng is not None else random.Random()
+        # Shared with the engine, which keeps snake bodies in it; the grid
+        # tracks which cells are still empty
+        self.grid = grid if grid is not None else OccupancyGrid(config)
         
-    def spawn(self, snake_body, count=1):
-        # Generate random position aligned with grid
-        cols = self.window_width // self.block_size
-        rows = self.window_height // self.block_size
-        
-        while len(self.positions) < count:
-            x = random.randint(0, cols - 1) * self.block_size
-            y = random.randint(0, rows - 1) * self.block_size
-            
-            # Check collision with snake body (rect based)
-            food_rect = pygame.Rect(x, y, self.block_size, self.block_size)
-            collides = False
-            
-            # Optimization: Check only if simple check fails or always?
-            # Always check rects for safety in pixel mode
-            for segment in snake_body:
-                seg_rect = pygame.Rect(segment[0], segment[1], self.block_size, self.block_size)
-                if food_rect.colliderect(seg_rect):
-                    collides = True
-                    break
-            
-            if not collides and (x, y) not in self.positions:
-                self.positions.append((x, y))
+    def spawn(self, count=1):
+        # Place up to 'count' new food items on random empty grid cells.
+        # Returns how many were placed: fewer than asked means the board is full.
+        placed = 0
+        while placed < count:
+            pos = self.grid.sample_free(self.rng)
+            if pos is None:
+                break
+            self.positions.append(pos)
+            self.grid.add(FOOD_OWNER, 0, pos)
+            placed += 1
+        return placed
 
     def remove(self, pos):
         if pos in self.positions:
             self.positions.remove(pos)
+            self.grid.remove(FOOD_OWNER, pos)
 
-    def draw(self, surface):
+    def draw(self, surface, camera=None):
+        import pygame # Drawing only; the headless engine never loads it
         for pos in self.positions:
+            if camera is not None:
+                if not camera.block_visible(pos):
+                    continue
+                pos = camera.to_screen(pos)
             pygame.draw.rect(surface, self.color, 
                              (pos[0], pos[1], self.block_size, self.block_size))
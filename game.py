@@ -2,9 +2,17 @@ import pygame
 import sys
 import os
 from snake import Snake, Direction
-from food import Food
-from utils import load_config, load_leaderboard, save_leaderboard
-from network import SnakeNetwork
+from engine import World
+from delta import StateEncoder, StateDecoder
+from interest import InterestManager
+from interp import SnapshotBuffer, Predictor, follow
+from render import Renderer, TextCache
+from camera import Camera
+from replay import Recorder
+from profiler import Profiler
+from utils import load_config
+from leaderboard import Leaderboard, board_for
+from network import SnakeNetwork, network_options
 import time
 
 # Game States
@@ -15,6 +23,15 @@ STATE_PLAYING = 3
 STATE_NAME_INPUT = 5
 STATE_LOBBY = 6
 
+MAX_FRAME_TIME = 0.25 # Longest frame the simulation catches up on (s)
+
+# Arrow keys -> snake direction
+KEY_DIRECTIONS = {
+    pygame.K_UP: Direction.UP,
+    pygame.K_DOWN: Direction.DOWN,
+    pygame.K_LEFT: Direction.LEFT,
+    pygame.K_RIGHT: Direction.RIGHT,
+}
 
 class Game:
     def __init__(self):
@@ -29,6 +46,22 @@ class Game:
         
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont("Arial", 24)
+        self.text = TextCache() # Rendered strings, reused across frames
+        # Per-phase frame timings (profiler.enabled); F3 shows them
+        settings = self.config.get('profiler', {})
+        self.profiler = Profiler(settings.get('window', 600)) if settings.get('enabled') else None
+        self.show_profile = False
+        self.small_font = pygame.font.SysFont("monospace", 14)
+        self.scores = Leaderboard(board=board_for(self.config)) # Per game mode
+        self.reload_leaderboard()
+        self.alpha = 1.0 # Fraction of a tick since the last update, for drawing
+        # Follows our head when the arena is bigger than the window
+        self.camera = Camera(self.config)
+        # Repaint only what changed during play (slow machines); None: full
+        # redraws. A scrolling view changes every pixel, so never with the camera.
+        self.renderer = None
+        if self.config['window'].get('dirty_rects') and not self.camera.active:
+            self.renderer = Renderer(self.screen, self.config)
         
         self.reset_game(full_reset=True)
         
@@ -57,7 +90,22 @@ class Game:
         
         # Soft reset: Keep network, clear game state
         
-        self.snakes = {}
+        # Rules live in the headless engine; these are shortcuts into it
+        self.stop_recording()
+        self.world = World(self.config)
+        self.world.profiler = self.profiler
+        self.snakes = self.world.snakes
+        self.food = self.world.food
+        self.dead_players = self.world.dead_players # Track dead players to prevent respawn
+        # Keyframe/delta state sync: host encodes, clients decode
+        self.encoder = StateEncoder()
+        self.decoder = StateDecoder(self.config)
+        # network.interest_radius: each client only gets what is near its head
+        self.interest = InterestManager(self.config) if self.config.get('network', {}).get('interest_radius') else None
+        # Client: snapshot history for remote snakes, input history for ours
+        self.snapshots = SnapshotBuffer(delay=2 * self.snapshot_interval() + 1)
+        self.predictor = Predictor()
+        self.trails = {} # Remote snake ID -> seq of the newest point in its trail
         self.local_player_id = 0
         if self.network:
             if self.is_server:
@@ -69,21 +117,19 @@ class Game:
         # But for Lobby, we wait for update loop.
         
         # Default start pos, will be updated by server or logic
-        start_pos = (self.width // 2, self.height // 2)
+        start_pos = (self.world.width // 2, self.world.height // 2)
         
         if self.state == STATE_PLAYING and not self.network:
             # Single Player
-            self.snakes[self.local_player_id] = Snake(self.config, start_pos, self.local_player_id, "Player 1")
+            self.world.add_snake(self.local_player_id, start_pos, "Player 1")
         
-        self.food = Food(self.config)
         if self.local_player_id in self.snakes:
-            self.food.spawn(self.snakes[self.local_player_id].body)
+            self.world.spawn_food(1)
             
         self.score = 0 # This line is removed as per instruction 1, score is now in Snake object
         self.game_over = False
         self.paused = False
         self.spectating = False
-        self.dead_players = set() # Track dead players to prevent respawn
         self.input_active = False # For leaderboard or IP entry
         self.input_text = ""
         self.showing_leaderboard = False
@@ -99,23 +145,53 @@ class Game:
         self.spectating = False
 
     def run(self):
-        while True:
-            self.handle_events()
-            
-            if self.state == STATE_PLAYING or self.state == STATE_LOBBY:
-                if not self.paused:
-                    self.update()
-            
-            self.draw()
-            
-            # Speed control
-            # Always run at 60 FPS for consistency, handle legacy speed in update if needed
-            self.clock.tick(60)
+        # Fixed timestep: the simulation advances in ticks of exactly
+        # 1/tick_rate seconds however fast we render. A slow frame runs several
+        # ticks to catch up; a fast one draws in between ticks, interpolated.
+        accumulator = 0.0
+        last_time = time.perf_counter()
+        try:
+            while True:
+                frame_start = time.perf_counter()
+                self.handle_events()
+                if self.profiler:
+                    self.profiler.add('events', time.perf_counter() - frame_start)
+
+                now = time.perf_counter()
+                accumulator += min(now - last_time, MAX_FRAME_TIME)
+                last_time = now
+                tick_time = 1.0 / self.world.tick_rate
+
+                if (self.state == STATE_PLAYING or self.state == STATE_LOBBY) and not self.paused:
+                    while accumulator >= tick_time:
+                        self.update()
+                        accumulator -= tick_time
+                    self.alpha = accumulator / tick_time
+                else:
+                    accumulator = 0.0
+                    self.alpha = 1.0
+
+                draw_start = time.perf_counter()
+                self.draw()
+                if self.profiler:
+                    done = time.perf_counter()
+                    self.profiler.add('draw', done - draw_start)
+                    self.profiler.frame(done - frame_start)
+
+                # Render rate only; 0 draws as fast as the machine allows
+                self.clock.tick(self.config['window'].get('fps', 60))
+        finally:
+            # Quit or crash: keep what was recorded so far playable
+            self.stop_recording()
+            if self.profiler:
+                self.profiler.dump(self.config['profiler'].get('dump'))
 
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.quit_game()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.show_profile = not self.show_profile and self.profiler is not None
             elif event.type == pygame.KEYDOWN:
                 if self.state == STATE_MENU:
                     if event.key == pygame.K_UP:
@@ -138,7 +214,7 @@ class Game:
                             # Let's say: Join -> Enter IP. Host -> Enter Port.
                             self.input_text = self.input_text[:-1]
                     else:
-                        if self.input_active and len(self.input_text) < 20:
+                        if self.input_active and len(self.input_text) < 40:
                             self.input_text += event.unicode
                 
                 elif self.state == STATE_NAME_INPUT:
@@ -179,10 +255,7 @@ class Game:
                             # Start Game
                             if self.network:
                                 # Spawn initial food ensuring it doesn't hit snakes
-                                all_bodies = []
-                                for s in self.snakes.values():
-                                    all_bodies.extend(s.body)
-                                self.food.spawn(all_bodies, 1)
+                                self.world.spawn_food(1)
                                 
                                 self.network.send_update({"type": "start_game"}) # Broadcast start
                                 self.state = STATE_PLAYING
@@ -213,9 +286,8 @@ class Game:
                                     self.state = STATE_LOBBY
                                     
                                     # Fix: Re-add Host Snake after soft reset so it appears in Lobby
-                                    start_pos = (self.width // 2, self.height // 2)
-                                    self.snakes[0] = Snake(self.config, start_pos, 0, self.player_name)
-                                    self.snakes[0].color = self.colors[0]
+                                    start_pos = (self.world.width // 2, self.world.height // 2)
+                                    self.world.add_snake(0, start_pos, self.player_name, self.colors[0])
                                     
                                     # Clients will rejoin via update loop logic (polling network)
                             else:
@@ -239,43 +311,42 @@ class Game:
                             if self.local_player_id in self.snakes:
                                 self.snakes[self.local_player_id].handle_input(event)
                                 
-                                # Send input to server
+                                # Send input to server, numbered for reconciliation
                                 if self.network and not self.is_server:
-                                    key_map = {
-                                        pygame.K_UP: "UP", pygame.K_DOWN: "DOWN",
-                                        pygame.K_LEFT: "LEFT", pygame.K_RIGHT: "RIGHT"
-                                    }
-                                    if event.key in key_map:
-                                        self.network.send_input({"type": "input", "dir": key_map[event.key]})
+                                    if event.key in KEY_DIRECTIONS:
+                                        direction = KEY_DIRECTIONS[event.key]
+                                        seq = self.predictor.input(direction)
+                                        self.network.send_input({"type": "input", "dir": direction.name, "seq": seq})
+
+    def held_directions(self):
+        # Directions whose arrow keys are currently held (acceleration input)
+        keys = pygame.key.get_pressed()
+        return {d for k, d in KEY_DIRECTIONS.items() if keys[k]}
 
     def update(self):
         # Network Handling
+        start = time.perf_counter()
         if self.network:
             events = self.network.get_events()
             
             if self.is_server:
-                # Process remote inputs
+                # Process remote inputs: input/accel messages are applied by the engine
                 for event in events:
-                    if event['type'] == 'input':
-                        pid = event['player_id']
-                        direction_str = event['dir']
-                        if pid in self.snakes:
-                            # We need to manually trigger handle_input equivalent logic
-                            # Or update snake class to accept abstract Direction
-                            direction = Direction[direction_str]
-                            # BUG FIX 2: Validate against *physical* direction (direction)
-                            # to firmly prevent 180 turns even with fast input queuing
-                            curr_dir = self.snakes[pid].direction
-                            
-                            # 180 degree check
-                            if (direction.value[0] * -1 != curr_dir.value[0] or 
-                                direction.value[1] * -1 != curr_dir.value[1]):
-                                self.snakes[pid].next_direction = direction
-                                
-                    elif event['type'] == 'accel':
-                        pid = event['player_id']
-                        if pid in self.snakes:
-                            self.snakes[pid].accelerating = event['state']
+                    if event['type'] in ('input', 'accel'):
+                        self.world.apply_input(event)
+                        if event['type'] == 'input':
+                            self.network.input_applied(event)
+
+                    elif event['type'] == 'resync':
+                        # A client lost track of the deltas
+                        if self.interest:
+                            self.interest.request_keyframe(event['player_id'])
+                        else:
+                            self.encoder.request_keyframe(event['player_id'])
+
+                    elif event['type'] == 'disconnect':
+                        if self.interest:
+                            self.interest.forget(event['player_id'])
 
                     elif event['type'] == 'init':
                          # New player requested join (handshake part 2?)
@@ -290,12 +361,11 @@ class Game:
                 for pid in connected_ids:
                     if pid not in self.snakes and pid not in self.dead_players:
                         # Spawn new snake
-                        start_pos = (self.width // 2 + pid * 20, self.height // 2 + pid * 20) # Offset
+                        start_pos = (self.world.width // 2 + pid * 20, self.world.height // 2 + pid * 20) # Offset
                         name = f"Player {pid}"
-                        self.snakes[pid] = Snake(self.config, start_pos, pid, name)
                         # Assign color
                         color_idx = pid % len(self.colors)
-                        self.snakes[pid].color = self.colors[color_idx]
+                        self.world.add_snake(pid, start_pos, name, self.colors[color_idx])
                         
                         # Add to lobby list
                         if pid not in [p['id'] for p in self.lobby_players if isinstance(p, dict)]:
@@ -307,9 +377,11 @@ class Game:
                     # Or we just rely on 'state' updates which contain snakes?
                     # Snakes are created upon join. So 'snakes' dict exists.
                     # Send lobby-specific update?
+                    stats = self.network.stats()
                     lobby_data = {
                         "type": "lobby",
-                        "players": [{"id": s.id, "name": s.name} for s in self.snakes.values()]
+                        "players": [dict({"id": s.id, "name": s.name}, **stats.get(s.id, {}))
+                                    for s in self.snakes.values()]
                     }
                     self.network.send_update(lobby_data)
                 
@@ -324,33 +396,23 @@ class Game:
                         # Host reset game
                         self.reset_game(soft_reset=True)
                         self.state = STATE_LOBBY
-                    elif event['type'] == 'state':
-                        # Update Snakes
-                        server_snakes = event['snakes']
-                        current_ids = []
-                        for s_data in server_snakes:
-                            sid = s_data['id']
-                            current_ids.append(sid)
-                            if sid not in self.snakes:
-                                # Create new
-                                self.snakes[sid] = Snake.from_dict(s_data, self.config)
-                            else:
-                                # Update
-                                self.snakes[sid].update_from_dict(s_data)
-                        
-                        # Remove disconnected snakes
-                        to_remove = [k for k in self.snakes if k not in current_ids]
-                        for k in to_remove:
-                            del self.snakes[k]
+                    elif event['type'] in ('state', 'delta'):
+                        applied, want_resync = self.decoder.apply(event)
+                        if want_resync:
+                            self.network.send_input({"type": "resync"})
+                        if not applied:
+                            continue
+
+                        self.apply_snapshot()
                         
                         # Check if I died (was in game, now not)
                         if self.local_player_id not in self.snakes and self.state == STATE_PLAYING:
                             self.spectating = True
                             
                         # Update Food
-                        self.food.positions = [tuple(p) for p in event['food']]
+                        self.food.positions = list(self.decoder.food)
                         # BUG FIX: If dead, score is missing from update. Keep last known score.
-                        self.score = event['scores'].get(str(self.local_player_id), self.score)
+                        self.score = self.decoder.scores.get(str(self.local_player_id), self.score)
                         
                         # Update my ID if just assigned
                         if self.network.my_id is not None:
@@ -361,105 +423,52 @@ class Game:
                          self.check_leaderboard()
 
 
-        # Client-Side Dead Reckoning (Prediction)
-        # Run physics for all snakes to smooth out jitter
+        if self.profiler:
+            self.profiler.add('network', time.perf_counter() - start)
+
+        # Client-Side Prediction
+        # Only MY snake is simulated; remote snakes are interpolated between
+        # snapshots when drawn, so they just need the render clock moved on
         if self.network and not self.is_server and self.state == STATE_PLAYING and not self.paused:
-             for snake_id, snake in self.snakes.items():
-                  # For Client, 'is_local' means "Can I accelerate it?"
-                  # Only MY snake (local_player_id) should read MY keyboard.
-                  # Other snakes (remote) should just move at base speed.
-                  is_local = (snake_id == self.local_player_id)
-                  snake.update(is_local=is_local)
+             self.snapshots.advance()
+             snake = self.snakes.get(self.local_player_id)
+             if snake:
+                  held = self.held_directions()
+                  self.predictor.record(held)
+                  snake.update(held=held)
                   
                   # Check for acceleration state change to sync
-                  if is_local:
-                      if snake.accelerating != getattr(self, 'last_accel_state', False):
-                           self.last_accel_state = snake.accelerating
-                           self.network.send_input({"type": "accel", "state": snake.accelerating})
+                  if snake.accelerating != getattr(self, 'last_accel_state', False):
+                       self.last_accel_state = snake.accelerating
+                       self.network.send_input({"type": "accel", "state": snake.accelerating})
 
         # Update Logic (Server Only or Single Player)
         # Only run physics/logic if we are actually PLAYING
         if self.state == STATE_PLAYING and (not self.network or self.is_server):
-            # Update all snakes
-            dead_snakes = []
+            # BUG FIX: Only allow acceleration input for local player
+            # On Server: Local is ID 0. Others are remote.
+            held = {self.local_player_id: self.held_directions()}
+            self.start_recording()
             
-            for snake_id, snake in self.snakes.items():
-                # BUG FIX: Only allow acceleration input for local player
-                # On Server: Local is ID 0. Others are remote.
-                # On Client (if we ran this block, which we usually don't): Local is self.local_player_id.
-                
-                is_local = (snake_id == self.local_player_id)
-                snake.update(is_local=is_local)
-                
-                # Check collision (Walls and Self)
-                if snake.check_collision():
-                    dead_snakes.append(snake_id)
-                    continue
-                
-                # Check collision with other snakes
-                head = snake.body[0]
-                head_rect = pygame.Rect(head[0], head[1], snake.block_size, snake.block_size)
-                
-                for other_id, other_snake in self.snakes.items():
-                    if snake_id == other_id:
-                        continue
-                    
-                    # Check collision with other snake's body
-                    for segment in other_snake.body:
-                        seg_rect = pygame.Rect(segment[0], segment[1], other_snake.block_size, other_snake.block_size)
-                        if head_rect.colliderect(seg_rect):
-                            dead_snakes.append(snake_id)
-                            break
-                
-                if snake_id in dead_snakes:
-                    continue
-    
-                # Check food
-                # Check collision with any food
-                eaten_pos = None
-                for pos in self.food.positions:
-                    food_rect = pygame.Rect(pos[0], pos[1], self.food.block_size, self.food.block_size)
-                    if head_rect.colliderect(food_rect):
-                        eaten_pos = pos
-                        break
-                        
-                if eaten_pos:
-                    self.food.remove(eaten_pos)
-                    snake.grow()
-                    self.food.remove(eaten_pos)
-                    snake.grow()
-                    # Score update
+            for event in self.world.step(held=held):
+                snake_id = event['player_id']
+                if event['type'] == 'eat':
                     # Fix: Update the snake's score object, then local score if it's us
-                    snake.score += self.config['game']['score_per_food']
-                    
                     if snake_id == self.local_player_id:
-                         self.score = snake.score
-                    
-                    # Spawn new food
-                    all_bodies = []
-                    for s in self.snakes.values():
-                        all_bodies.extend(s.body)
-                    
-                    self.food.spawn(all_bodies, 1)
+                         self.score = event['score']
     
                     if self.eat_sound:
                         self.eat_sound.play()
-    
-            # Handle deaths
-            for snake_id in dead_snakes:
-                if snake_id == self.local_player_id:
-                    if not self.network:
-                        # Single Player -> Immediate Game Over
-                        self.game_over = True
-                        self.check_leaderboard() 
-                    else:
-                        # Multiplayer -> Spectate
-                        self.spectating = True
-                
-                # Remove from game
-                if snake_id in self.snakes:
-                    del self.snakes[snake_id]
-                    self.dead_players.add(snake_id)
+
+                elif event['type'] == 'death':
+                    if snake_id == self.local_player_id:
+                        if not self.network:
+                            # Single Player -> Immediate Game Over
+                            self.game_over = True
+                            self.check_leaderboard() 
+                        else:
+                            # Multiplayer -> Spectate
+                            self.spectating = True
 
             # Check Game Over (Server)
             if self.is_server and self.network and self.state == STATE_PLAYING:
@@ -469,34 +478,108 @@ class Game:
                      self.network.send_update({"type": "game_over"})
                      self.check_leaderboard()
             
-            # Broadcast State (Server)
-            if self.is_server and self.network:
-                state = {
-                    "type": "state",
-                    "snakes": [s.to_dict() for s in self.snakes.values()],
-                    "food": self.food.positions,
-                    "type": "state",
-                    "snakes": [s.to_dict() for s in self.snakes.values()],
-                    "food": self.food.positions,
-                    "scores": {str(sid): s.score for sid, s in self.snakes.items()} # Fix: Broadcast actual scores
-                }
-                self.network.send_update(state)
-
-                self.network.send_update(state)
+            # Broadcast State (Server): keyframe or delta since the last snapshot
+            if self.is_server and self.network and self.world.tick % self.snapshot_interval() == 0:
+                start = time.perf_counter()
+                if self.interest:
+                    with self.network.lock:
+                        client_ids = list(self.network.clients)
+                    messages = [([pid], msg) for pid, msg in self.interest.encode(self.world, client_ids)]
+                else:
+                    msg = self.encoder.encode(self.snakes, self.food.positions,
+                                              self.world.tick, self.world.acks)
+                    resync, keyframe = self.encoder.take_resyncs(self.snakes, self.food.positions,
+                                                                 self.world.acks)
+                    messages = [(None, msg)]
+                    if keyframe is not None:
+                        # Just the clients that lost track get the keyframe
+                        with self.network.lock:
+                            client_ids = list(self.network.clients)
+                        messages = [([cid for cid in client_ids if cid not in resync], msg),
+                                    ([cid for cid in client_ids if cid in resync], keyframe)]
+                encoded = time.perf_counter()
+                for client_ids, msg in messages:
+                    self.network.send_to(client_ids, msg)
+                if self.profiler:
+                    self.profiler.add('encode', encoded - start)
+                    self.profiler.add('send', time.perf_counter() - encoded)
+
+    def apply_snapshot(self):
+        # Client: bring the display snakes in line with the decoder's mirror
+        snapshot = {}
+        for sid, s_data in self.decoder.snakes.items():
+            if sid not in self.snakes:
+                # Create new
+                self.snakes[sid] = Snake(self.config, s_data['body'][0], sid, s_data['name'])
+            snake = self.snakes[sid]
+            snake.corner_mode = s_data['model'] == 'corners'
+            snake.color = s_data['color']
+            snapshot[sid] = (s_data['seq'], len(s_data['body']))
+
+            if sid == self.local_player_id:
+                # Ours: the host's version plus the inputs it hasn't applied yet
+                self.predictor.reconcile(snake, s_data, self.decoder.tick,
+                                         self.decoder.acks.get(str(sid)))
+            elif snake.corner_mode:
+                # Only a handful of corners; shown as of the latest snapshot
+                snake.body = s_data['body'].copy()
+                snake.direction = Direction[s_data['direction']]
+            else:
+                # Keep a trail with some history to interpolate along
+                trail = snake.body if sid in self.trails else None
+                snake.body = follow(trail, self.trails.get(sid, 0), s_data['body'], s_data['seq'])
+                snake.direction = Direction[s_data['direction']]
+                snake.seq = s_data['seq']
+                self.trails[sid] = s_data['seq']
+        self.snapshots.push(self.decoder.tick, snapshot)
+
+        # Remove disconnected snakes
+        to_remove = [k for k in self.snakes if k not in self.decoder.snakes]
+        for k in to_remove:
+            del self.snakes[k]
+            self.trails.pop(k, None)
+
+    def update_camera(self):
+        # Follow our head, or a snake still alive while spectating
+        if not self.camera.active:
+            return None
+        self.camera.prune(self.snakes)
+        snake = self.snakes.get(self.local_player_id)
+        if snake is None and self.snakes:
+            snake = self.snakes[min(self.snakes)]
+        if snake is not None:
+            span = self.interp_span(snake.id)
+            if span is not None and span[0] < len(snake.body):
+                self.camera.follow(snake.body[span[0]])
+            else:
+                self.camera.follow(snake.ends(self.alpha)[0])
+        return self.camera
+
+    def interp_span(self, snake_id):
+        # Client: which part of a remote snake's trail to draw at the render tick
+        if snake_id not in self.trails:
+            return None
+        sample = self.snapshots.sample(snake_id)
+        if sample is None:
+            return None
+        seq, length = sample
+        return max(0, round(self.trails[snake_id] - seq)), max(1, round(length))
+
+    def reload_leaderboard(self):
+        # The screens draw from this copy; only re-read after it changes
+        self.leaderboard = self.scores.top(10)
 
     def check_leaderboard(self):
-        leaderboard = load_leaderboard()
         # Check if score qualifies for top 10
-        if len(leaderboard) < 10 or (leaderboard and self.score > leaderboard[-1]['score']):
+        if self.scores.qualifies(self.score, 10):
             self.input_active = True
             self.input_text = ""
         else:
             self.input_active = False
 
     def save_score(self, name):
-        leaderboard = load_leaderboard()
-        leaderboard.append({'name': name, 'score': self.score})
-        save_leaderboard(leaderboard)
+        self.scores.add(name, self.score)
+        self.reload_leaderboard()
 
     def handle_menu_selection(self):
         choice = self.menu_options[self.menu_index]
@@ -516,25 +599,44 @@ class Game:
         elif choice == "Quit":
             self.quit_game()
 
+    def start_recording(self):
+        # Record the match if replay.record is on (python replay.py FILE plays it back)
+        settings = self.config.get('replay', {})
+        if not settings.get('record') or getattr(self, 'world', None) is None or self.world.recorder:
+            return
+        folder = settings.get('dir', 'replays')
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, time.strftime("%Y%m%d-%H%M%S") + ".rpl")
+        self.world.recorder = Recorder(path, self.world, settings.get('keyframe_interval', 300))
+
+    def stop_recording(self):
+        world = getattr(self, 'world', None)
+        if world is not None and world.recorder is not None:
+            world.recorder.close()
+            world.recorder = None
+
     def quit_game(self):
         if self.network:
             self.network.stop()
         pygame.quit()
         sys.exit()
 
+    def snapshot_interval(self):
+        # Host sends a snapshot every this many ticks
+        return max(1, self.config.get('network', {}).get('snapshot_interval', 1))
+
     def start_multiplayer(self):
         if self.state == STATE_HOST_SETUP:
             try:
                 port = int(self.input_text)
-                self.network = SnakeNetwork(side="server")
+                self.network = SnakeNetwork(side="server", **network_options(self.config))
                 self.network.start_host(port)
                 self.is_server = True
                 self.local_player_id = 0
-                self.snakes = {}
-                start_pos = (self.width // 2, self.height // 2)
+                self.snakes.clear()
+                start_pos = (self.world.width // 2, self.world.height // 2)
                 # Host is ID 0
-                self.snakes[0] = Snake(self.config, start_pos, 0, self.player_name)
-                self.snakes[0].color = self.colors[0]
+                self.world.add_snake(0, start_pos, self.player_name, self.colors[0])
                 
                 self.state = STATE_LOBBY
                 self.input_active = False
@@ -545,6 +647,10 @@ class Game:
             target = self.input_text
             ip = "127.0.0.1"
             port = 5555
+            room = None
+            if "/" in target:
+                # ip:port/room picks a room on a dedicated server
+                target, room = target.split("/", 1)
             if ":" in target:
                 parts = target.split(":")
                 ip = parts[0]
@@ -555,26 +661,29 @@ class Game:
             else:
                 ip = target
             
-            self.network = SnakeNetwork(side="client")
+            self.network = SnakeNetwork(side="client", **network_options(self.config))
             if self.network.connect(ip, port):
                  self.is_server = False
                  self.state = STATE_LOBBY # Wait in lobby
                  self.input_active = False
                  # Send Init with Name
-                 self.network.send_input({"type": "init", "name": self.player_name})
-                 self.snakes = {} 
+                 init_msg = {"type": "init", "name": self.player_name}
+                 if room:
+                     init_msg["room"] = room
+                 self.network.send_input(init_msg)
+                 self.snakes.clear()
             else:
                  print("Connection Failed")
                  self.state = STATE_MENU
 
     def draw_menu(self):
         self.screen.fill((0, 0, 0))
-        title = self.font.render("SNAKE MULTIPLAYER", True, (0, 255, 0))
+        title = self.text.render(self.font, "SNAKE MULTIPLAYER", (0, 255, 0))
         self.screen.blit(title, (self.width//2 - 100, 100))
         
         for i, option in enumerate(self.menu_options):
             color = (255, 255, 0) if i == self.menu_index else (255, 255, 255)
-            text = self.font.render(option, True, color)
+            text = self.text.render(self.font, option, color)
             self.screen.blit(text, (self.width//2 - 50, 200 + i * 40))
 
     def draw_setup(self):
@@ -586,18 +695,18 @@ class Game:
         else:
             msg = "Enter IP:Port (e.g. 127.0.0.1:5555)"
             
-        text = self.font.render(msg, True, (255, 255, 255))
+        text = self.text.render(self.font, msg, (255, 255, 255))
         self.screen.blit(text, (self.width//2 - 100, 200))
         
-        input_s = self.font.render(self.input_text, True, (0, 255, 0))
+        input_s = self.text.render(self.font, self.input_text, (0, 255, 0))
         self.screen.blit(input_s, (self.width//2 - 100, 240))
         
-        hint = self.font.render("Press Enter to Confirm", True, (100, 100, 100))
+        hint = self.text.render(self.font, "Press Enter to Confirm", (100, 100, 100))
         self.screen.blit(hint, (self.width//2 - 80, 300))
 
     def draw_lobby(self):
         self.screen.fill((0, 0, 0))
-        title = self.font.render("LOBBY - Waiting for Players", True, (255, 255, 0))
+        title = self.text.render(self.font, "LOBBY - Waiting for Players", (255, 255, 0))
         self.screen.blit(title, (self.width//2 - 120, 50))
         
         # Display connected players
@@ -606,6 +715,7 @@ class Game:
         # For Client: uses self.lobby_players (received from server)
         
         players_to_show = []
+        stats = self.network.stats() if self.network else {}
         if self.is_server:
             players_to_show = [{"name": s.name, "id": s.id} for s in self.snakes.values()]
         else:
@@ -620,18 +730,61 @@ class Game:
                  color_idx = pid % len(self.colors)
                  color = self.colors[color_idx]
                  
-             p_text = self.font.render(f"P{p['id']}: {p['name']}", True, color)
+             label = f"P{p['id']}: {p['name']}"
+             # Our own numbers are measured here; the host sends everyone else's
+             p_stats = stats.get(pid, p)
+             if 'rtt' in p_stats:
+                 label += "  " + self.net_label(p_stats)
+             p_text = self.text.render(self.font, label, color)
              self.screen.blit(p_text, (self.width//2 - 50, 150 + i * 30))
              
         if self.is_server:
-            hint = self.font.render("Press ENTER to Start Game", True, (0, 255, 0))
+            hint = self.text.render(self.font, "Press ENTER to Start Game", (0, 255, 0))
             self.screen.blit(hint, (self.width//2 - 100, 400))
         else:
-            hint = self.font.render("Waiting for Host to Start...", True, (100, 100, 100))
+            hint = self.text.render(self.font, "Waiting for Host to Start...", (100, 100, 100))
             self.screen.blit(hint, (self.width//2 - 100, 400))
 
+    def net_label(self, stats):
+        # "ping 23 ms, input 31 ms"; dashes until there is a measurement
+        rtt = "-" if stats.get('rtt') is None else stats['rtt']
+        latency = "-" if stats.get('latency') is None else stats['latency']
+        return f"ping {rtt} ms, input {latency} ms"
+
+    def net_hud(self):
+        # In-game network stats under the score: every client on the host,
+        # just ourselves on a client
+        if not self.network:
+            return []
+        color = (200, 200, 200)
+        return [(self.text.render(self.small_font, f"P{pid} {self.net_label(s)}", color), (10, 40 + i * 16))
+                for i, (pid, s) in enumerate(sorted(self.network.stats().items()))]
+
     # Updated draw to handle states
+    def draw_playfield(self):
+        # Dirty-rect path for a running game; see render.py
+        hud = [(self.text.render(self.font, f"Score: {self.score}", tuple(self.config['colors']['text'])), (10, 10))]
+        if self.spectating:
+            hud.append((self.text.render(self.font, "SPECTATING - Waiting for others...", (200, 200, 200)),
+                        (self.width//2 - 150, 50)))
+        hud += self.net_hud()
+        spans = {}
+        for snake_id in self.snakes:
+            span = self.interp_span(snake_id)
+            if span is not None:
+                spans[snake_id] = span
+        if self.show_profile:
+            overlay = self.profiler.draw(self.small_font, self.text)
+            hud.append((overlay, (self.width - 10 - overlay.get_width(), 10)))
+        self.renderer.draw(self.snakes, self.food.positions, self.alpha, spans, hud)
+
     def draw(self):
+        if self.renderer:
+            if self.state == STATE_PLAYING and not self.paused and not self.game_over:
+                self.draw_playfield()
+                return
+            self.renderer.invalidate()
+
         if self.state == STATE_MENU:
             self.draw_menu()
         elif self.state in [STATE_HOST_SETUP, STATE_JOIN_SETUP, STATE_NAME_INPUT]:
@@ -641,60 +794,64 @@ class Game:
         else:
             self.screen.fill(tuple(self.config['colors']['background']))
             
-            for snake in self.snakes.values():
-                snake.draw(self.screen)
-            self.food.draw(self.screen)
+            camera = self.update_camera()
+            for snake_id, snake in self.snakes.items():
+                snake.draw(self.screen, self.alpha, self.interp_span(snake_id), camera)
+            self.food.draw(self.screen, camera)
             
             # Draw Score
-            score_text = self.font.render(f"Score: {self.score}", True, tuple(self.config['colors']['text']))
+            score_text = self.text.render(self.font, f"Score: {self.score}", tuple(self.config['colors']['text']))
             self.screen.blit(score_text, (10, 10))
+            for surface, pos in self.net_hud():
+                self.screen.blit(surface, pos)
             
             if self.spectating and not self.game_over:
-                spec_text = self.font.render("SPECTATING - Waiting for others...", True, (200, 200, 200))
+                spec_text = self.text.render(self.font, "SPECTATING - Waiting for others...", (200, 200, 200))
                 self.screen.blit(spec_text, (self.width//2 - 150, 50))
             
             if self.paused:
                 if self.showing_leaderboard:
                     # Show Leaderboard
                     y_offset = 40
-                    leaderboard = load_leaderboard()
-                    leaderboard.sort(key=lambda x: x['score'], reverse=True)
+                    leaderboard = self.leaderboard
                     
-                    title_text = self.font.render("LEADERBOARD", True, tuple(self.config['colors']['text']))
+                    title_text = self.text.render(self.font, "LEADERBOARD", tuple(self.config['colors']['text']))
                     title_rect = title_text.get_rect(center=(self.width/2, self.height/2 - 50))
                     self.screen.blit(title_text, title_rect)
                     
                     for i, entry in enumerate(leaderboard[:5]): # Show top 5
                         name = entry.get('name', 'Anonymous')
                         score = entry['score']
-                        lb_text = self.font.render(f"{i+1}. {name}: {score}", True, tuple(self.config['colors']['text']))
+                        lb_text = self.text.render(self.font, f"{i+1}. {name}: {score}", tuple(self.config['colors']['text']))
                         rect = lb_text.get_rect(center=(self.width/2, self.height/2 + i * 30))
                         self.screen.blit(lb_text, rect)
                 else:
-                    pause_text = self.font.render("PAUSED", True, tuple(self.config['colors']['text']))
+                    pause_text = self.text.render(self.font, "PAUSED", tuple(self.config['colors']['text']))
                     text_rect = pause_text.get_rect(center=(self.width/2, self.height/2))
                     self.screen.blit(pause_text, text_rect)
     
             if self.game_over:
                 if self.input_active:
-                    prompt_text = self.font.render("New High Score! Enter Name: " + self.input_text, True, tuple(self.config['colors']['text']))
+                    prompt_text = self.text.render(self.font, "New High Score! Enter Name: " + self.input_text, tuple(self.config['colors']['text']))
                     text_rect = prompt_text.get_rect(center=(self.width/2, self.height/2))
                     self.screen.blit(prompt_text, text_rect)
                 else:
-                    game_over_text = self.font.render("GAME OVER - Press R to Restart", True, tuple(self.config['colors']['text']))
+                    game_over_text = self.text.render(self.font, "GAME OVER - Press R to Restart", tuple(self.config['colors']['text']))
                     text_rect = game_over_text.get_rect(center=(self.width/2, self.height/2))
                     self.screen.blit(game_over_text, text_rect)
                     
                     # Show Leaderboard
                     y_offset = 40
-                    leaderboard = load_leaderboard()
-                    # Sort just in case
-                    leaderboard.sort(key=lambda x: x['score'], reverse=True)
+                    leaderboard = self.leaderboard
                     for i, entry in enumerate(leaderboard[:5]): # Show top 5
                         name = entry.get('name', 'Anonymous')
                         score = entry['score']
-                        lb_text = self.font.render(f"{i+1}. {name}: {score}", True, tuple(self.config['colors']['text']))
+                        lb_text = self.text.render(self.font, f"{i+1}. {name}: {score}", tuple(self.config['colors']['text']))
                         rect = lb_text.get_rect(center=(self.width/2, self.height/2 + y_offset + i * 30))
                         self.screen.blit(lb_text, rect)
+
+        if self.show_profile:
+            overlay = self.profiler.draw(self.small_font, self.text)
+            self.screen.blit(overlay, (self.width - 10 - overlay.get_width(), 10))
             
         pygame.display.flip()
@@ -0,0 +1,250 @@
+from array import array
+from collections import deque
+from utils import arena_size
+
+# Spatial index over the arena, one cell per block.
+# Every body point (and food item) is anchored in the cell containing its
+# top-left corner. Two blocks can only overlap if their anchor cells are
+# neighbours, so "does anything hit this head" is a lookup in at most 9 cells
+# instead of a scan over every segment of every snake.
+#
+# Per cell and owner, entries are kept in push order. Snakes push at the head
+# and pop at the tail, so the tail point is always the oldest entry in its
+# cell and both updates are O(1).
+#
+# Optionally (track_regions) the grid also counts entries per owner in coarse
+# regions of several cells, so "which snakes are anywhere near here" is a
+# handful of lookups (area of interest filtering, see interest.py).
+
+FOOD_OWNER = 'food'
+
+class FreeCells:
+    # Set of cell ids with O(1) add/remove and uniform sampling:
+    # ids live in a dense list, with a reverse index for swap-removal.
+    def __init__(self, size):
+        self.cells = array('i', range(size))
+        self.index = array('i', range(size)) # cell id -> position in cells, -1 if taken
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return self.index[cell] != -1
+
+    def take(self, cell):
+        pos = self.index[cell]
+        last = self.cells.pop()
+        if last != cell:
+            self.cells[pos] = last
+            self.index[last] = pos
+        self.index[cell] = -1
+
+    def release(self, cell):
+        self.index[cell] = len(self.cells)
+        self.cells.append(cell)
+
+    def sample(self, rng):
+        return self.cells[rng.randrange(len(self.cells))]
+
+class OccupancyGrid:
+    def __init__(self, config):
+        self.block_size = config['game']['block_size']
+        self.width, self.height = arena_size(config)
+        # Wrap-around arena: index cells (and measure distance) on a torus
+        self.wrap = not config['game']['solid_walls']
+
+        self.cols = -(-self.width // self.block_size)
+        self.rows = -(-self.height // self.block_size)
+        self.cells = {} # (cx, cy) -> {owner: deque of (seq, x, y)}
+
+        # Cells a food item may spawn in (whole blocks only), with the number
+        # of blocks covering each one. A cell is free while nothing covers it.
+        self.spawn_cols = self.width // self.block_size
+        self.spawn_rows = self.height // self.block_size
+        self.cover_count = array('i', [0]) * (self.spawn_cols * self.spawn_rows)
+        self.free = FreeCells(self.spawn_cols * self.spawn_rows)
+        self.regions = None # (rx, ry) -> {owner: entries}, once track_regions() is called
+        self.region_blocks = None
+
+    def cell_of(self, point):
+        # Same truncation as pygame.Rect, then floor to the block grid
+        cx = int(point[0]) // self.block_size
+        cy = int(point[1]) // self.block_size
+        if self.wrap:
+            cx %= self.cols
+            cy %= self.rows
+        return (cx, cy)
+
+    def _covered(self, point):
+        # Spawn cells overlapped by the block at point
+        size = self.block_size
+        if self.wrap:
+            # Corner bodies hand in unwrapped coordinates
+            point = (point[0] % self.width, point[1] % self.height)
+        px, py = int(point[0]), int(point[1])
+        xs = {gx % self.cols if self.wrap else gx for gx in (px // size, (px + size - 1) // size)}
+        ys = {gy % self.rows if self.wrap else gy for gy in (py // size, (py + size - 1) // size)}
+        for gx in xs:
+            if 0 <= gx < self.spawn_cols:
+                for gy in ys:
+                    if 0 <= gy < self.spawn_rows:
+                        yield gy * self.spawn_cols + gx
+
+    def _cover(self, point, delta):
+        self._cover_cells(self._covered(point), delta)
+
+    def _cover_cells(self, cells, delta):
+        for cell in cells:
+            count = self.cover_count[cell] + delta
+            self.cover_count[cell] = count
+            if count == 1 and delta > 0:
+                self.free.take(cell)
+            elif count == 0:
+                self.free.release(cell)
+
+    def add(self, owner, seq, point):
+        cell = self.cell_of(point)
+        owners = self.cells.setdefault(cell, {})
+        owners.setdefault(owner, deque()).append((seq, point[0], point[1]))
+        self._cover(point, 1)
+        if self.regions is not None:
+            self._count_region(cell, owner, 1)
+
+    def track_regions(self, blocks):
+        # Start counting entries per owner in regions of blocks x blocks cells
+        self.region_blocks = blocks
+        self.regions = {}
+        for cell, owners in self.cells.items():
+            for owner, entries in owners.items():
+                self._count_region(cell, owner, len(entries))
+
+    def _count_region(self, cell, owner, delta):
+        key = (cell[0] // self.region_blocks, cell[1] // self.region_blocks)
+        counts = self.regions.setdefault(key, {})
+        count = counts.get(owner, 0) + delta
+        if count:
+            counts[owner] = count
+        else:
+            del counts[owner]
+            if not counts:
+                del self.regions[key]
+
+    def owners_in(self, left, top, right, bottom):
+        """Owners with entries in the regions under a pixel box (right/bottom
+           exclusive, may run off a wrap-around arena). Coarse: a region
+           reaches up to region_blocks cells past the box.
+        """
+        size, blocks = self.block_size, self.region_blocks
+        cols = range(int(left) // size, (int(right) - 1) // size + 1)
+        rows = range(int(top) // size, (int(bottom) - 1) // size + 1)
+        if self.wrap:
+            rxs = {(cx % self.cols) // blocks for cx in cols}
+            rys = {(cy % self.rows) // blocks for cy in rows}
+        else:
+            rxs = {cx // blocks for cx in cols}
+            rys = {cy // blocks for cy in rows}
+        owners = set()
+        for rx in rxs:
+            for ry in rys:
+                counts = self.regions.get((rx, ry))
+                if counts:
+                    owners.update(counts)
+        return owners
+
+    # Corner bodies are not stored cell by cell; they only keep the free-cell
+    # counts right. A cell covered by the path is counted once when the tail's
+    # block sits on it plus once per time the head's block entered it.
+    def cover(self, point, delta):
+        self._cover(point, delta)
+
+    def sweep(self, a, b, delta):
+        # Block sliding from a to b along one axis. The head (delta=+1) counts
+        # the cells it enters, the tail (delta=-1) releases the cells it leaves.
+        # Steps stay under one block so no cell is skipped.
+        dist = abs(b[0] - a[0]) + abs(b[1] - a[1])
+        steps = int(dist // self.block_size) + 1
+        prev = set(self._covered(a))
+        for i in range(1, steps + 1):
+            if i == steps:
+                p = b
+            else:
+                t = i / steps
+                p = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+            cur = set(self._covered(p))
+            self._cover_cells(cur - prev if delta > 0 else prev - cur, delta)
+            prev = cur
+
+    def sample_free(self, rng):
+        # Top-left corner of a uniformly chosen empty cell, or None if the board is full
+        if not self.free:
+            return None
+        cell = self.free.sample(rng)
+        return ((cell % self.spawn_cols) * self.block_size,
+                (cell // self.spawn_cols) * self.block_size)
+
+    def _entries(self, owner, point):
+        owners = self.cells[self.cell_of(point)]
+        return owners, owners[owner]
+
+    def _prune(self, owners, owner, point):
+        if self.regions is not None:
+            self._count_region(self.cell_of(point), owner, -1)
+        if not owners[owner]:
+            del owners[owner]
+            if not owners:
+                del self.cells[self.cell_of(point)]
+
+    def pop_oldest(self, owner, point):
+        # Tail of a snake moved on
+        owners, entries = self._entries(owner, point)
+        entries.popleft()
+        self._prune(owners, owner, point)
+        self._cover(point, -1)
+
+    def pop_newest(self, owner, point):
+        # Head of a snake was moved in place (grid snapping)
+        owners, entries = self._entries(owner, point)
+        entries.pop()
+        self._prune(owners, owner, point)
+        self._cover(point, -1)
+
+    def remove(self, owner, point):
+        # Arbitrary entry, e.g. an eaten food item
+        owners, entries = self._entries(owner, point)
+        for entry in entries:
+            if entry[1] == point[0] and entry[2] == point[1]:
+                entries.remove(entry)
+                break
+        self._prune(owners, owner, point)
+        self._cover(point, -1)
+
+    def overlaps(self, point):
+        """Yield (owner, seq, (x, y)) for every entry whose block overlaps the block at point."""
+        size = self.block_size
+        px, py = int(point[0]), int(point[1])
+        cx, cy = px // size, py // size
+
+        if self.wrap:
+            # Small arenas can map several neighbours onto the same cell;
+            # sets make sure each one is only visited once
+            cols = {(cx - 1) % self.cols, cx % self.cols, (cx + 1) % self.cols}
+            rows = {(cy - 1) % self.rows, cy % self.rows, (cy + 1) % self.rows}
+        else:
+            cols = (cx - 1, cx, cx + 1)
+            rows = (cy - 1, cy, cy + 1)
+
+        for gx in cols:
+            for gy in rows:
+                owners = self.cells.get((gx, gy))
+                if not owners:
+                    continue
+
+                for owner, entries in owners.items():
+                    for seq, x, y in entries:
+                        dx = abs(int(x) - px)
+                        dy = abs(int(y) - py)
+                        if self.wrap:
+                            dx = min(dx, self.width - dx)
+                            dy = min(dy, self.height - dy)
+                        if dx < size and dy < size:
+                            yield owner, seq, (x, y)
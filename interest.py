@@ -0,0 +1,90 @@
+from delta import StateEncoder
+
+# Area of interest filtering of state broadcasts (network.interest_radius in
+# config, pixels; 0 sends every client everything).
+#
+# Each client gets its own StateEncoder, fed with only the snakes and food
+# within interest_radius of its head (a square, wrapping with the arena) and
+# its own input acks. A snake that comes into range arrives as 'added' with
+# its whole body and one that goes out of range is 'removed', the same as
+# snakes joining and dying, so clients need nothing new. A client always
+# gets its own snake; a spectator gets the area around the live snake with
+# the lowest ID, which is the one its camera follows.
+#
+# Nearby snakes are found through the occupancy grid's coarse region counts
+# (REGION_BLOCKS cells square), so a lookup costs the same however many
+# snakes and points are elsewhere in the arena. Corner bodies aren't stored
+# in the grid; their few segments are tested directly.
+
+REGION_BLOCKS = 8
+
+
+def _overlaps(lo, hi, start, end, period):
+    # Does [lo, hi) overlap [start, end), going round an arena of `period`?
+    if period is None:
+        return lo < end and start < hi
+    if hi - lo + end - start >= period:
+        return True
+    return (lo - start) % period < end - start or (start - lo) % period < hi - lo
+
+
+class InterestManager:
+    def __init__(self, config):
+        self.radius = config.get('network', {}).get('interest_radius', 0)
+        self.block_size = config['game']['block_size']
+        self.encoders = {} # player ID -> StateEncoder
+
+    def request_keyframe(self, pid):
+        encoder = self.encoders.get(pid)
+        if encoder is not None:
+            encoder.request_keyframe()
+
+    def forget(self, pid):
+        self.encoders.pop(pid, None)
+
+    def encode(self, world, client_ids):
+        """One state/delta message per client: [(player ID, msg)]."""
+        if world.grid.regions is None:
+            world.grid.track_regions(REGION_BLOCKS)
+        messages = []
+        for pid in client_ids:
+            snakes, food = self.select(world, pid)
+            encoder = self.encoders.get(pid)
+            if encoder is None:
+                encoder = self.encoders[pid] = StateEncoder()
+            acks = {pid: world.acks[pid]} if pid in world.acks else {}
+            messages.append((pid, encoder.encode(snakes, food, world.tick, acks)))
+        return messages
+
+    def center(self, world, pid):
+        snake = world.snakes.get(pid)
+        if snake is None and world.snakes:
+            snake = world.snakes[min(world.snakes)]
+        return snake.body.head if snake is not None else None
+
+    def select(self, world, pid):
+        # (snakes, food positions) that client pid should know about
+        center = self.center(world, pid)
+        if center is None:
+            return world.snakes, world.food.positions
+        size, r = self.block_size, self.radius
+        box = (center[0] - r, center[1] - r, center[0] + size + r, center[1] + size + r)
+        period = world.period or (None, None)
+
+        near = world.grid.owners_in(*box)
+        snakes = {}
+        for sid, snake in world.snakes.items():
+            if sid == pid or sid in near or (snake.corner_mode and self._corners_near(snake, box, period)):
+                snakes[sid] = snake
+        food = [p for p in world.food.positions
+                if _overlaps(p[0], p[0] + size, box[0], box[2], period[0]) and
+                _overlaps(p[1], p[1] + size, box[1], box[3], period[1])]
+        return snakes, food
+
+    def _corners_near(self, snake, box, period):
+        size = self.block_size
+        for a, b in snake.body.segments():
+            if (_overlaps(min(a[0], b[0]), max(a[0], b[0]) + size, box[0], box[2], period[0]) and
+                    _overlaps(min(a[1], b[1]), max(a[1], b[1]) + size, box[1], box[3], period[1])):
+                return True
+        return False
@@ -0,0 +1,136 @@
+from collections import deque
+from snake import Direction
+
+# Client-side smoothing for multiplayer.
+#
+# The host only sends a snapshot every few ticks (network.snapshot_interval),
+# each stamped with its World.tick. Clients don't run physics for other
+# players' snakes any more: SnapshotBuffer keeps the last snapshots and the
+# renderer shows remote snakes a little in the past, interpolated between the
+# two snapshots around the render tick.
+#
+# The local snake is still predicted every tick so steering feels instant.
+# Inputs are numbered; when a snapshot acks one, Predictor resets our snake to
+# the host's version and replays the ticks the host hasn't seen yet.
+
+TRAIL_MARGIN = 64 # Extra tail points kept so interpolation can draw older tails
+HISTORY = 180 # Ticks of local input kept for replay
+
+
+class SnapshotBuffer:
+    def __init__(self, delay, size=32):
+        self.delay = delay # Ticks the render clock runs behind the newest snapshot
+        self.snapshots = deque(maxlen=size) # (tick, {snake ID: (seq, length)}), oldest first
+        self.render_tick = None
+
+    def clear(self):
+        self.snapshots.clear()
+        self.render_tick = None
+
+    def push(self, tick, snakes):
+        if self.snapshots and tick <= self.snapshots[-1][0]:
+            self.clear() # Host restarted
+        self.snapshots.append((tick, snakes))
+
+    def advance(self):
+        # Once per client tick: move the render clock on by a tick, easing it
+        # toward `delay` ticks behind the newest snapshot
+        if not self.snapshots:
+            return
+        latest = self.snapshots[-1][0]
+        target = latest - self.delay
+        if self.render_tick is None or abs(target - self.render_tick) > self.delay * 2:
+            self.render_tick = target
+        else:
+            self.render_tick += 1 + (target - self.render_tick) * 0.1
+        self.render_tick = min(self.render_tick, latest)
+
+    def sample(self, sid):
+        """(seq, length) of snake sid at the render tick, or None if unknown."""
+        if self.render_tick is None:
+            return None
+        t = self.render_tick
+        before = after = None
+        for tick, snakes in self.snapshots:
+            if sid not in snakes:
+                continue
+            if tick <= t:
+                before = (tick, snakes[sid])
+            else:
+                after = (tick, snakes[sid])
+                break
+        if before is None:
+            return after[1] if after else None
+        if after is None:
+            return before[1]
+        (t0, (seq0, len0)), (t1, (seq1, len1)) = before, after
+        frac = (t - t0) / (t1 - t0)
+        return seq0 + (seq1 - seq0) * frac, len0 + (len1 - len0) * frac
+
+
+def follow(trail, trail_seq, body, seq):
+    """Bring trail (a body copy that keeps some extra tail) up to date with
+       body, whose newest point was pushed as seq. Returns the new trail.
+    """
+    pushed = seq - trail_seq
+    if trail is None or not 0 <= pushed < len(body):
+        return body.copy()
+    for point in reversed(body[:pushed]):
+        trail.push_head(point)
+    trail[pushed] = body[pushed] # Grid snapping may have moved the old head
+    while len(trail) > len(body) + TRAIL_MARGIN:
+        trail.pop_tail()
+    return trail
+
+
+class Predictor:
+    # Local snake: what we did on each tick, so it can be replayed
+    def __init__(self):
+        self.tick = 0 # Client ticks predicted so far
+        self.seq = 0 # Last input number handed out
+        self.history = deque(maxlen=HISTORY) # (tick, seq, direction or None, held)
+        self.pending = (None, None)
+        self.offset = None # client tick - host tick, learnt from acks
+
+    def input(self, direction):
+        # Number a steering input; it takes effect on the next predicted tick
+        self.seq += 1
+        self.pending = (self.seq, direction)
+        return self.seq
+
+    def record(self, held):
+        self.tick += 1
+        seq, direction = self.pending
+        self.pending = (None, None)
+        self.history.append((self.tick, seq, direction, held))
+
+    def reconcile(self, snake, data, host_tick, ack):
+        """Reset snake to the host's version (a StateDecoder snake) at host_tick,
+           then replay our inputs the host hadn't applied yet.
+        """
+        last_acked = None
+        if ack is not None:
+            for tick, seq, direction, held in self.history:
+                if seq == ack[0]:
+                    # Our tick `tick` was the host's tick ack[1] + 1
+                    self.offset = tick - (ack[1] + 1)
+                if seq is not None and seq <= ack[0]:
+                    last_acked = direction
+
+        snake.body = data['body'].copy()
+        snake.seq = data['seq']
+        snake.direction = Direction[data['direction']]
+        snake.next_direction = snake.direction
+        if self.offset is None:
+            return
+
+        # A turn the host accepted may still be waiting for the next grid line
+        if last_acked is not None:
+            snake.steer(last_acked)
+        base = host_tick + self.offset
+        for tick, seq, direction, held in self.history:
+            if tick <= base:
+                continue
+            if direction is not None and (ack is None or seq > ack[0]):
+                snake.steer(direction)
+            snake.update(held=held)
@@ -0,0 +1,91 @@
+import sqlite3
+import time
+from utils import load_leaderboard
+
+# High scores in SQLite instead of rewriting leaderboard.json.
+#
+# Every result is one INSERT (atomic, no rewrite of the whole board), and an
+# index on (board, score) answers top-N and rank-of-score without reading
+# everything. Boards keep game modes apart, e.g. "pixel-wrap" vs "grid-walls".
+# Several processes (server room workers) can write at once: the database runs
+# in WAL mode and writers wait for each other instead of failing.
+# Open one Leaderboard per process; top() results are cached until a write,
+# ours or another process's (PRAGMA data_version tells us about theirs).
+
+LEADERBOARD_DB = 'leaderboard.db'
+TOP_SIZE = 10
+
+
+def board_for(config):
+    # Board name for a game mode
+    game = config['game']
+    movement = 'pixel' if game.get('pixel_movement', False) else 'grid'
+    walls = 'walls' if game['solid_walls'] else 'wrap'
+    return f"{movement}-{walls}"
+
+
+class Leaderboard:
+    def __init__(self, path=LEADERBOARD_DB, board="default"):
+        self.board = board # Used when a call doesn't name one
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS scores (
+                                     id INTEGER PRIMARY KEY,
+                                     board TEXT NOT NULL,
+                                     name TEXT NOT NULL,
+                                     score INTEGER NOT NULL,
+                                     created REAL NOT NULL)""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS scores_rank ON scores (board, score DESC)")
+        self._top = {} # (board, n) -> cached top() result
+        self._version = None # data_version the cache was filled at
+        self._import_legacy()
+
+    def _import_legacy(self):
+        # First run: bring over the old leaderboard.json into this board.
+        # Check and insert in one write transaction, or workers opening the
+        # database together would each find it empty and import it again.
+        entries = load_leaderboard()
+        if not entries:
+            return
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        with self.conn:
+            if self.conn.execute("SELECT 1 FROM scores LIMIT 1").fetchone():
+                return
+            self.conn.executemany(
+                "INSERT INTO scores (board, name, score, created) VALUES (?, ?, ?, ?)",
+                [(self.board, e.get('name', 'Anonymous'), e['score'], now) for e in entries])
+
+    def add(self, name, score, board=None):
+        board = board or self.board
+        with self.conn:
+            self.conn.execute("INSERT INTO scores (board, name, score, created) VALUES (?, ?, ?, ?)",
+                              (board, name, score, time.time()))
+        self._top = {key: rows for key, rows in self._top.items() if key[0] != board}
+
+    def top(self, n=TOP_SIZE, board=None):
+        """Best n results as [{'name', 'score'}], highest first."""
+        key = (board or self.board, n)
+        version, = self.conn.execute("PRAGMA data_version").fetchone()
+        if version != self._version: # Another process wrote since
+            self._top, self._version = {}, version
+        if key not in self._top:
+            rows = self.conn.execute(
+                "SELECT name, score FROM scores WHERE board = ? ORDER BY score DESC, id LIMIT ?",
+                key).fetchall()
+            self._top[key] = [{'name': name, 'score': score} for name, score in rows]
+        return self._top[key]
+
+    def rank(self, score, board=None):
+        # Position a new result with this score would take (1 = best)
+        count, = self.conn.execute("SELECT COUNT(*) FROM scores WHERE board = ? AND score >= ?",
+                                   (board or self.board, score)).fetchone()
+        return count + 1
+
+    def qualifies(self, score, n=TOP_SIZE, board=None):
+        return self.rank(score, board) <= n
+
+    def close(self):
+        self.conn.close()
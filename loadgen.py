@@ -0,0 +1,232 @@
+import argparse
+import random
+import time
+from delta import StateDecoder
+from network import SnakeNetwork
+from utils import load_config
+
+# Headless load generator: python loadgen.py [ip:port[/room]] --clients 50
+#
+# Opens N client connections to a host (the dedicated server.py, or a game
+# hosting from the menu) with no pygame and no display. Each bot joins like
+# the game does (connect, format negotiation, "init" with a name), then sends
+# direction changes and acceleration toggles at the configured rates: random
+# turns by default, or cycling through --script. Broadcasts go through the
+# same StateDecoder as the game, so a bot that misses a delta asks for a
+# keyframe just like a real client. --transport udp talks to a host with
+# network.transport "udp"; --loss/--delay/--jitter then degrade what the bots
+# send (set udp_loss etc. in the host's config for the other direction).
+#
+# Reported per bot and in total since the start, every --report seconds and
+# at the end:
+#   ticks/s     host simulation rate, from the tick numbers in snapshots,
+#               over each match (the count restarts with every world)
+#   latency     broadcast send -> arrival in ms (p50/p95), on the host's
+#               clock using the ping offset estimate
+#   ping        smoothed round trip in ms
+#   KB, KB/s    bytes received
+#   resyncs     keyframes requested after missing a delta
+
+DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT']
+OPPOSITE = {'UP': 'DOWN', 'DOWN': 'UP', 'LEFT': 'RIGHT', 'RIGHT': 'LEFT'}
+POLL_INTERVAL = 0.005 # Seconds between sweeps over all bots
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Bot:
+    def __init__(self, index, config, args, rng):
+        self.index = index
+        self.name = f"Bot {index}"
+        self.args = args
+        self.rng = rng
+        self.network = SnakeNetwork(side="client", wire_format=args.wire_format, transport=args.transport,
+                                    loss=args.loss, delay=args.delay, jitter=args.jitter)
+        self.decoder = StateDecoder(config)
+        self.script = args.script.split(',') if args.script else None
+        self.step = 0
+        self.seq = 0
+        self.accelerating = False
+        self.playing = False
+
+        # Staggered so N bots don't all send in the same instant
+        now = time.monotonic()
+        self.next_input = now + rng.random() / args.input_rate if args.input_rate else None
+        self.next_accel = now + rng.random() / args.accel_rate if args.accel_rate else None
+        self.since = now
+        self.latencies = [] # Seconds
+        self.first = None # (arrival, tick) of the first snapshot this match
+        self.last = None
+        self.done = (0, 0.0) # (ticks, seconds) over the matches before it
+        self.resyncs = 0
+
+    def connect(self, ip, port, room):
+        if not self.network.connect(ip, port):
+            return False
+        init_msg = {"type": "init", "name": self.name}
+        if room:
+            init_msg["room"] = room
+        self.network.send_input(init_msg)
+        return True
+
+    def direction(self):
+        # Next direction to send: scripted, or a random turn (never straight back)
+        if self.script:
+            direction = self.script[self.step % len(self.script)]
+            self.step += 1
+            return direction
+        snake = self.decoder.snakes.get(self.network.my_id)
+        current = snake['direction'] if snake else None
+        return self.rng.choice([d for d in DIRECTIONS if d != current and d != OPPOSITE.get(current)])
+
+    def poll(self, now):
+        for msg in self.network.get_events():
+            if msg['type'] == 'start_game':
+                self.playing = True
+            elif msg['type'] in ('game_over', 'restart'):
+                self.playing = False
+                if msg['type'] == 'restart':
+                    self.end_match() # The new world counts ticks from 0 again
+            elif msg['type'] in ('state', 'delta'):
+                self.playing = True
+                if 'received' in msg:
+                    self.latencies.append(msg['received'] - msg['sent'])
+                applied, want_resync = self.decoder.apply(msg)
+                if want_resync:
+                    self.resyncs += 1
+                    self.network.send_input({"type": "resync"})
+                if self.last and msg['tick'] < self.last[1]:
+                    self.end_match() # Restarted and we missed the message
+                self.last = (now, msg['tick'])
+                if self.first is None:
+                    self.first = self.last
+
+        if not self.playing:
+            return
+        if self.next_input is not None and now >= self.next_input:
+            self.seq += 1
+            self.network.send_input({"type": "input", "dir": self.direction(), "seq": self.seq})
+            self.next_input += 1.0 / self.args.input_rate
+        if self.next_accel is not None and now >= self.next_accel:
+            self.accelerating = not self.accelerating
+            self.network.send_input({"type": "accel", "state": self.accelerating})
+            self.next_accel += 1.0 / self.args.accel_rate
+
+    def end_match(self):
+        # Fold this match's tick span into the totals and start counting afresh
+        if self.first:
+            ticks, seconds = self.done
+            self.done = (ticks + self.last[1] - self.first[1], seconds + self.last[0] - self.first[0])
+        self.first = self.last = None
+
+    def stats(self, now):
+        # Ticks/s over the spans of every match seen, so the gaps between
+        # matches and the tick counter's reset don't skew it
+        ticks, seconds = self.done
+        if self.first:
+            ticks += self.last[1] - self.first[1]
+            seconds += self.last[0] - self.first[0]
+        ticks_per_sec = ticks / seconds if seconds > 0 else None
+        ordered = sorted(self.latencies)
+        received = self.network.server.received if self.network.server else 0
+        rtt = self.network.server.rtt if self.network.server else None
+        return {"ticks_per_sec": ticks_per_sec,
+                "p50": _percentile(ordered, 0.5),
+                "p95": _percentile(ordered, 0.95),
+                "rtt": rtt,
+                "kb": received / 1024,
+                "kb_per_sec": received / 1024 / max(1e-9, now - self.since),
+                "resyncs": self.resyncs}
+
+
+def _fmt(value, scale=1.0, digits=1):
+    return "-" if value is None else f"{value * scale:.{digits}f}"
+
+
+def report(bots, now, per_bot):
+    rows = [(bot, bot.stats(now)) for bot in bots]
+    header = f"{'bot':<8} {'ticks/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'ping ms':>8} {'KB':>9} {'KB/s':>7} {'resyncs':>7}"
+    if per_bot:
+        print(header)
+        for bot, s in rows:
+            print(f"{bot.name:<8} {_fmt(s['ticks_per_sec']):>8} {_fmt(s['p50'], 1000):>7} "
+                  f"{_fmt(s['p95'], 1000):>7} {_fmt(s['rtt'], 1000):>8} {s['kb']:>9.1f} "
+                  f"{s['kb_per_sec']:>7.1f} {s['resyncs']:>7}")
+
+    rates = [s['ticks_per_sec'] for _, s in rows if s['ticks_per_sec'] is not None]
+    latencies = sorted(lat for bot in bots for lat in bot.latencies)
+    total_kb = sum(s['kb'] for _, s in rows)
+    connected = sum(1 for bot in bots if bot.network.running)
+    print(f"{connected}/{len(bots)} connected, host {_fmt(min(rates) if rates else None)}-"
+          f"{_fmt(max(rates) if rates else None)} ticks/s, latency p50 {_fmt(_percentile(latencies, 0.5), 1000)} "
+          f"p95 {_fmt(_percentile(latencies, 0.95), 1000)} max {_fmt(latencies[-1] if latencies else None, 1000)} ms, "
+          f"{total_kb:.0f} KB received ({total_kb / max(1, len(bots)):.1f} KB per bot), "
+          f"{sum(s['resyncs'] for _, s in rows)} resyncs")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python loadgen.py")
+    parser.add_argument("target", nargs="?", default="127.0.0.1:5555", help="ip:port, optionally /room")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds; 0 runs until Ctrl+C")
+    parser.add_argument("--input-rate", type=float, default=2.0, help="direction changes per second per bot")
+    parser.add_argument("--accel-rate", type=float, default=0.5, help="acceleration toggles per second per bot")
+    parser.add_argument("--script", help="comma-separated directions to cycle through instead of random turns")
+    parser.add_argument("--connect-rate", type=float, default=20.0, help="new connections per second")
+    parser.add_argument("--report", type=float, default=5.0, help="seconds between reports")
+    parser.add_argument("--per-bot", action="store_true", help="a line per bot in every report")
+    parser.add_argument("--wire-format", default="binary", choices=["binary", "json"])
+    parser.add_argument("--transport", default="tcp", choices=["tcp", "udp"], help="must match the host")
+    parser.add_argument("--loss", type=float, default=0.0, help="UDP: fraction of the bots' datagrams dropped")
+    parser.add_argument("--delay", type=float, default=0.0, help="UDP: seconds the bots' datagrams are held back")
+    parser.add_argument("--jitter", type=float, default=0.0, help="UDP: up to this many seconds more, at random")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.script and any(d not in DIRECTIONS for d in args.script.split(',')):
+        parser.error(f"--script takes directions from {','.join(DIRECTIONS)}")
+
+    target, room = args.target, None
+    if "/" in target:
+        target, room = target.split("/", 1)
+    ip, _, port = target.partition(":")
+    port = int(port) if port else 5555
+
+    config = load_config()
+    rng = random.Random(args.seed)
+    bots = []
+    try:
+        for i in range(args.clients):
+            bot = Bot(i + 1, config, args, random.Random(rng.random()))
+            if not bot.connect(ip, port, room):
+                break
+            bots.append(bot)
+            time.sleep(1.0 / args.connect_rate)
+        print(f"{len(bots)} bots connected to {ip}:{port}" + (f"/{room}" if room else ""))
+
+        start = last_report = time.monotonic()
+        now = start
+        while not args.duration or now - start < args.duration:
+            now = time.monotonic()
+            for bot in bots:
+                bot.poll(now)
+            if now - last_report >= args.report:
+                report(bots, now, args.per_bot)
+                last_report = now
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        now = time.monotonic()
+        if bots:
+            print("Final:")
+            report(bots, now, True)
+        for bot in bots:
+            bot.network.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 import socket
+import selectors
+import struct
 import threading
+import heapq
 import json
+import random
 import time
+from collections import deque
+import wire
 
 class NetworkManager:
     def __init__(self):
@@ -97,132 +103,767 @@ class GameServer:
         # Let's refine.
         pass
 
-# Redefining structure to be simpler and integrated
-# We will use non-blocking sockets or threads per client.
+# Redefining structure to be simpler and integrated.
+# All sockets are non-blocking and served by one I/O thread with a selector,
+# so the game loop never waits on the network: send_update/send_input only
+# queue bytes, and each connection's queue is bounded. When a client can't
+# keep up, queued state/delta/lobby frames are dropped (the client notices the
+# missing tick and asks for a keyframe) instead of stalling everybody else.
+
+#
+# Both ends ping each other every PING_INTERVAL from the I/O thread and answer
+# pings there too, so a busy game loop doesn't inflate the round trip. Each
+# pong carries the answering side's clock: rtt is smoothed, and the clock
+# offset is taken from the quickest of the last PING_SAMPLES exchanges (the
+# one least skewed by queueing). Clients stamp direction changes with the
+# send time on the host's clock ("sent"); the host calls input_applied() when
+# the simulation takes one, and hands the resulting latency back in its pongs.
+# State and delta broadcasts are stamped the same way when they are queued,
+# and a client notes when each one arrived ("received", also host clock).
+# All times are time.monotonic() seconds.
+#
+# network.transport "udp" swaps the TCP sockets for one UDP socket per side;
+# a host tells clients apart by their address. Each datagram starts with
+# UDP_HEADER: kind (RELIABLE, UNRELIABLE or ACK), a binary-frame flag, seq,
+# the next reliable seq wanted from the other side (everything before it has
+# arrived), a bitmask of the 32 after that which arrived early, and which
+# piece of how many pieces this is.
+#   Unreliable: state and delta frames, pings and pongs. Each frame gets the
+#   next unreliable seq and goes out in UDP_PAYLOAD pieces. The receiver only
+#   assembles the newest seq and throws away anything older than what it has
+#   already delivered, so a late snapshot never replaces a newer one. A lost
+#   piece loses the frame; a lost delta makes the client ask for a keyframe,
+#   just like a dropped frame over TCP.
+#   Reliable: everything else (init, format, inputs, lobby, start_game,
+#   restart, game_over...). It's the byte stream TCP would have carried, cut
+#   into UDP_PAYLOAD chunks with their own seq; the receiver puts the chunks
+#   back in order and feeds them to the same frame parser. Every datagram
+#   carries the ack, a bare ACK goes back when there's nothing to piggyback
+#   on, and a chunk not acked after max(UDP_MIN_RTO, 2 rtt) is sent again,
+#   backing off to UDP_MAX_RTO.
+# A peer that sends nothing for UDP_TIMEOUT (pings keep it alive) is dropped.
+# udp_loss, udp_delay and udp_jitter (config) drop and hold back outgoing
+# datagrams, to try all this out on loopback.
+
+MAX_QUEUE_BYTES = 256 * 1024 # Per connection, before droppable frames are discarded
+DROPPABLE = {"state", "delta", "lobby"} # Superseded by the next one anyway
+UNRELIABLE_TYPES = {"state", "delta"} # Sent unreliably over UDP
+RECV_SIZE = 65536 # Most bytes taken per read
+RECV_BUFFER = 4 * RECV_SIZE # Receive buffer per connection; grows for bigger messages
+MAX_MESSAGE = 16 * 1024 * 1024 # Bigger frames (or JSON lines) drop the connection
+PING_INTERVAL = 1.0
+PING_SAMPLES = 8
+RTT_SMOOTHING = 0.25
+LATENCY_SMOOTHING = 0.1
+CLOSE_GRACE = 2.0 # Seconds disconnect() waits for queued frames to go out
+
+UDP_HEADER = struct.Struct('<BBIIIHH') # kind, binary, seq, ack, ack bits, piece, pieces
+RELIABLE, UNRELIABLE, ACK = 1, 2, 3 # Datagram kinds
+UDP_PAYLOAD = 1200 # Bytes per datagram after the header, under a typical MTU
+UDP_RECV_SIZE = 65536
+UDP_WINDOW = 1024 # Reliable chunks buffered ahead of the next one expected
+UDP_INITIAL_RTO = 0.2 # Resend timeout before the first ping comes back
+UDP_MIN_RTO = 0.05
+UDP_MAX_RTO = 1.0
+UDP_TIMEOUT = 10.0
+
+
+def network_options(config):
+    # SnakeNetwork keyword arguments from the network section of config
+    net = config.get('network', {})
+    return {"wire_format": net.get('wire_format', 'binary'),
+            "transport": net.get('transport', 'tcp'),
+            "loss": net.get('udp_loss', 0.0),
+            "delay": net.get('udp_delay', 0.0),
+            "jitter": net.get('udp_jitter', 0.0)}
+
+
+def input_latency(msg):
+    # Host: seconds from the client sending msg to now, or None if unstamped
+    if 'sent' not in msg:
+        return None
+    return max(0.0, time.monotonic() - msg['sent']) # Offset error can dip below 0
+
+
+def _json_message(data):
+    # A JSON line (or UDP frame) -> message dict; ValueError unless it's an object
+    msg = json.loads(data)
+    if not isinstance(msg, dict):
+        raise ValueError(f"bad message (a JSON {type(msg).__name__}, not an object)")
+    return msg
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000)
+
+
+class _Connection:
+    stream = True # TCP: one socket per connection, bytes arrive in order
+
+    def __init__(self, sock, conn_id):
+        self.sock = sock
+        self.id = conn_id # Player ID; -1 for the client's link to the host
+        self.format = "json" # What we send; switched after negotiation
+        self.binary = False # What we receive: JSON lines until the format ack
+        self.inbuf = bytearray(RECV_BUFFER) # Received, not yet parsed: inbuf[start:end]
+        self.start = 0
+        self.end = 0
+        self.scan = 0 # JSON: no newline in inbuf[start:scan]
+        self.outq = deque() # [bytes, droppable]
+        self.out_bytes = 0
+        self.sent = 0 # Bytes of outq[0] already written
+        self.received = 0 # Bytes read in total
+
+        self.pings = deque(maxlen=PING_SAMPLES) # (rtt, offset)
+        self.rtt = None # Smoothed round trip, seconds
+        self.offset = 0.0 # Their clock minus ours, seconds
+        self.input_latency = None # Smoothed input send -> applied on the host, seconds
+        self.next_ping = 0.0
+        self.closing = None # When disconnect() was asked for
+
+    def queue(self, data, droppable=False, unreliable=False):
+        if droppable and self.out_bytes + len(data) > MAX_QUEUE_BYTES:
+            # Slow consumer: keep the frame being written and anything that
+            # must arrive, drop the stale state
+            keep = deque()
+            for i, item in enumerate(self.outq):
+                if item[1] and not (i == 0 and self.sent):
+                    self.out_bytes -= len(item[0])
+                else:
+                    keep.append(item)
+            self.outq = keep
+        self.outq.append([data, droppable])
+        self.out_bytes += len(data)
+
+    def flush(self):
+        # Write as much as the socket takes. Returns True once the queue is empty.
+        while self.outq:
+            data = self.outq[0][0]
+            n = self.sock.send(memoryview(data)[self.sent:])
+            self.sent += n
+            if self.sent < len(data):
+                return False
+            self.outq.popleft()
+            self.out_bytes -= len(data)
+            self.sent = 0
+        return True
+
+    def reserve(self, free):
+        # Make room for `free` more bytes after end. Only the unparsed tail
+        # moves (to the front), and only when the space runs out.
+        if self.start == self.end:
+            self.start = self.end = self.scan = 0
+            if len(self.inbuf) > RECV_BUFFER:
+                self.inbuf = bytearray(RECV_BUFFER) # Done with a big message
+        if len(self.inbuf) - self.end >= free:
+            return
+        pending = self.end - self.start
+        if self.start:
+            self.inbuf[:pending] = self.inbuf[self.start:self.end]
+            self.scan -= self.start
+            self.start, self.end = 0, pending
+        if len(self.inbuf) < pending + free:
+            self.inbuf.extend(bytes(pending + free - len(self.inbuf)))
+
+    def fill(self):
+        # One recv_into straight into the buffer; returns the byte count (0: closed)
+        self.reserve(RECV_SIZE)
+        with memoryview(self.inbuf) as view:
+            n = self.sock.recv_into(view[self.end:], RECV_SIZE)
+        self.end += n
+        self.received += n
+        return n
+
+    def feed(self, data):
+        self.reserve(len(data))
+        self.inbuf[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def messages(self):
+        """Decode the complete frames in the buffer, in place, one at a time
+           (so a format switch applies from the next frame). Raises
+           ValueError on anything malformed: a frame over MAX_MESSAGE, a
+           payload wire.decode rejects, a JSON line that isn't an object.
+        """
+        buf = self.inbuf
+        while self.start < self.end:
+            if self.binary:
+                if self.end - self.start < 4:
+                    return
+                size, = struct.unpack_from('<I', buf, self.start)
+                if size > MAX_MESSAGE:
+                    raise ValueError(f"{size} byte frame, over the {MAX_MESSAGE} byte limit")
+                stop = self.start + 4 + size
+                if stop > self.end:
+                    self.reserve(stop - self.end) # Room for the rest of it, in one piece
+                    return
+                with memoryview(buf) as view, view[self.start + 4:stop] as payload:
+                    msg = wire.decode(payload)
+                self.start = self.scan = stop
+            else:
+                newline = buf.find(b"\n", max(self.scan, self.start), self.end)
+                if newline == -1:
+                    if self.end - self.start > MAX_MESSAGE:
+                        raise ValueError(f"JSON line over the {MAX_MESSAGE} byte limit")
+                    self.scan = self.end
+                    return
+                line = buf[self.start:newline]
+                self.start = self.scan = newline + 1
+                if not line:
+                    continue
+                msg = _json_message(line)
+            yield msg
+
+    def pong(self, sent, remote, now):
+        # A ping we sent at `sent` came back; the other side's clock read `remote`
+        rtt = now - sent
+        self.pings.append((rtt, remote - (sent + now) / 2))
+        self.rtt = rtt if self.rtt is None else self.rtt + (rtt - self.rtt) * RTT_SMOOTHING
+        self.offset = min(self.pings)[1]
+
+
+class _Link:
+    # Sends datagrams from a UDP socket, losing and holding back some of them
+    # when asked to (udp_loss, udp_delay, udp_jitter) to test on loopback
+    def __init__(self, sock, loss=0.0, delay=0.0, jitter=0.0):
+        self.sock = sock
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.rng = random.Random()
+        self.held = [] # Heap of (due, n, packet, addr)
+        self.count = 0
+
+    def send(self, packet, addr):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        if self.delay or self.jitter:
+            # Jitter reorders datagrams as well as delaying them
+            self.count += 1
+            due = time.monotonic() + self.delay + self.rng.random() * self.jitter
+            heapq.heappush(self.held, (due, self.count, packet, addr))
+            return
+        self._send(packet, addr)
+
+    def _send(self, packet, addr):
+        try:
+            if addr is None:
+                self.sock.send(packet) # The client's socket is connected to the host
+            else:
+                self.sock.sendto(packet, addr)
+        except OSError:
+            pass # Buffer full or nobody there: as good as lost
+
+    def pump(self):
+        # Send the held datagrams that are due; returns seconds until the next one
+        now = time.monotonic()
+        while self.held and self.held[0][0] <= now:
+            _, _, packet, addr = heapq.heappop(self.held)
+            self._send(packet, addr)
+        return self.held[0][0] - now if self.held else None
+
+
+class _UdpConnection(_Connection):
+    # One peer on a UDP socket: the reliable and unreliable channels
+    stream = False
+
+    def __init__(self, link, conn_id, addr):
+        super().__init__(link.sock, conn_id)
+        self.link = link
+        self.addr = addr # None on the client (connected socket)
+        self.heard = time.monotonic()
+
+        self.next_seq = 1 # Reliable, outgoing
+        self.unacked = {} # seq -> [chunk, last sent, resends]
+        self.expected = 1 # Reliable, incoming: next seq to deliver
+        self.early = {} # seq -> chunk that arrived ahead of it
+        self.ack_due = False
+
+        self.next_useq = 1 # Unreliable, outgoing
+        self.delivered = 0 # Unreliable, incoming: newest seq delivered
+        self.assembling = 0 # ... seq being put together from pieces
+        self.pieces = {}
+
+    def _packet(self, kind, seq, payload=b"", binary=False, piece=0, pieces=1):
+        bits = 0
+        if self.early:
+            for i in range(32):
+                if self.expected + 1 + i in self.early:
+                    bits |= 1 << i
+        self.ack_due = False # Every datagram carries the ack
+        return UDP_HEADER.pack(kind, binary, seq, self.expected, bits, piece, pieces) + payload
+
+    def queue(self, data, droppable=False, unreliable=False):
+        # Sends straight away; nothing waits in a queue
+        if unreliable:
+            pieces = -(-len(data) // UDP_PAYLOAD) or 1
+            if pieces > 0xFFFF:
+                print(f"Frame too big for UDP ({len(data)} bytes), not sent")
+                return
+            seq = self.next_useq
+            self.next_useq += 1
+            binary = self.format == "binary" # What the frame was encoded as
+            for i in range(pieces):
+                chunk = data[i * UDP_PAYLOAD:(i + 1) * UDP_PAYLOAD]
+                self.link.send(self._packet(UNRELIABLE, seq, chunk, binary, i, pieces), self.addr)
+            return
+        now = time.monotonic()
+        for i in range(0, len(data), UDP_PAYLOAD):
+            seq = self.next_seq
+            self.next_seq += 1
+            chunk = data[i:i + UDP_PAYLOAD]
+            self.unacked[seq] = [chunk, now, 0]
+            self.link.send(self._packet(RELIABLE, seq, chunk), self.addr)
+
+    def flush(self):
+        # Resend overdue chunks and ack what came in. Returns True unless
+        # datagrams are being held back for the I/O thread to send later.
+        now = time.monotonic()
+        rto = max(UDP_MIN_RTO, 2 * self.rtt) if self.rtt is not None else UDP_INITIAL_RTO
+        for seq, entry in self.unacked.items():
+            chunk, sent, resends = entry
+            if now - sent >= min(UDP_MAX_RTO, rto * 2 ** resends):
+                entry[1] = now
+                entry[2] += 1
+                self.link.send(self._packet(RELIABLE, seq, chunk), self.addr)
+        if self.ack_due:
+            self.link.send(self._packet(ACK, 0), self.addr)
+        return not self.link.held
+
+    def receive(self, packet):
+        """One datagram in. Returns (bytes for the reliable stream, a complete
+           unreliable frame as (binary, frame) or None).
+        """
+        if len(packet) < UDP_HEADER.size:
+            raise ValueError(f"short datagram ({len(packet)} bytes)")
+        kind, binary, seq, ack, bits, piece, pieces = UDP_HEADER.unpack_from(packet)
+        payload = packet[UDP_HEADER.size:]
+        self.heard = time.monotonic()
+        self.received += len(packet)
+
+        for done in [s for s in self.unacked if s < ack or (ack < s <= ack + 32 and bits >> (s - ack - 1) & 1)]:
+            del self.unacked[done]
+
+        if kind == RELIABLE:
+            self.ack_due = True # Duplicates too: our last ack may have been lost
+            if self.expected <= seq < self.expected + UDP_WINDOW:
+                self.early[seq] = payload
+            stream = []
+            while self.expected in self.early:
+                stream.append(self.early.pop(self.expected))
+                self.expected += 1
+            return b"".join(stream), None
+
+        if kind == UNRELIABLE:
+            if seq <= self.delivered or seq < self.assembling or piece >= pieces:
+                return b"", None # Stale: something newer got here first
+            if seq > self.assembling:
+                self.assembling, self.pieces = seq, {} # Give up on an older, incomplete one
+            self.pieces[piece] = payload
+            if len(self.pieces) == pieces:
+                self.delivered = seq
+                frame = b"".join(self.pieces[i] for i in range(pieces))
+                self.pieces = {}
+                return b"", (bool(binary), frame)
+        return b"", None
+
 
 class SnakeNetwork:
-    def __init__(self, side="client"): # side: server or client
+    def __init__(self, side="client", wire_format="binary", transport="tcp",
+                 loss=0.0, delay=0.0, jitter=0.0): # side: server or client
         self.sock = None
-        self.clients = {} # ID -> socket (Server only)
+        self.clients = {} # ID -> _Connection (Server only)
+        self.server = None # Client only: _Connection to the host
         self.running = False
         self.input_queue = [] # Messages received
-        self.lock = threading.Lock()
+        self.lock = threading.Lock() # Guards clients, queues and input_queue
         self.my_id = None # Assigned by server
+        self.wire_format = wire_format # Preferred format: "binary", or "json" for debugging
+        self.next_id = 1
+        self.transport = transport # "tcp" or "udp"
+        self.link = None # UDP only: sends datagrams, with the simulated loss and delay
+        self.link_options = (loss, delay, jitter)
+        self.peers = {} # UDP host: address -> _UdpConnection
+
+        self.selector = selectors.DefaultSelector()
+        # Game thread -> I/O thread: "there is something new to send"
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
 
     def stop(self):
         self.running = False
-        try:
-            if self.sock:
-                self.sock.close()
-        except:
-            pass
+        self._wake()
 
-    def start_host(self, port=5555):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Allow reuse
-        self.sock.bind(('0.0.0.0', port))
-        self.sock.listen(4)
+    def start_host(self, port=5555, backlog=4):
+        if self.transport == "udp":
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind(('0.0.0.0', port))
+            self.link = _Link(self.sock, *self.link_options)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Allow reuse
+            self.sock.bind(('0.0.0.0', port))
+            self.sock.listen(backlog)
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ, None)
         self.running = True
         self.my_id = 0
-        
-        # Accept thread
-        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+        threading.Thread(target=self._io_loop, daemon=True).start()
 
     def connect(self, ip, port=5555):
+        if self.transport == "udp":
+            return self._connect_udp(ip, port)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(5)
+            self.sock.connect((ip, port))
+        except Exception as e:
+            print(f"Connect failed: {e}")
+            return False
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Don't hold inputs back
+        self.server = _Connection(self.sock, -1)
+        self.selector.register(self.sock, selectors.EVENT_READ, self.server)
+        self.running = True
+
+        threading.Thread(target=self._io_loop, daemon=True).start()
+        return True
+
+    def _connect_udp(self, ip, port):
+        # Nothing to handshake: the host takes us on with our first datagram
+        # (the game's "init"), and drops us if we go quiet
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
             self.sock.connect((ip, port))
-            self.running = True
-            
-            # Start receive thread
-            threading.Thread(target=self._receive_loop, args=(self.sock, -1), daemon=True).start()
-            return True
         except Exception as e:
             print(f"Connect failed: {e}")
             return False
+        self.sock.setblocking(False)
+        self.link = _Link(self.sock, *self.link_options)
+        self.server = _UdpConnection(self.link, -1, None)
+        self.selector.register(self.sock, selectors.EVENT_READ, self.server)
+        self.running = True
+
+        threading.Thread(target=self._io_loop, daemon=True).start()
+        return True
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass # Already pending, or shut down
 
-    def _accept_loop(self):
-        next_id = 1
+    # --- I/O thread ---
+
+    def _io_loop(self):
         while self.running:
-            try:
-                conn, addr = self.sock.accept()
-                print(f"New connection from {addr}, assigning ID {next_id}")
-                
-                with self.lock:
-                    self.clients[next_id] = conn
-                
-                # Send ID assignment
-                init_msg = {"type": "init", "id": next_id}
-                self._send_raw(conn, init_msg)
-                
-                # Start receive thread for this client
-                threading.Thread(target=self._receive_loop, args=(conn, next_id), daemon=True).start()
-                
-                next_id += 1
-            except Exception as e:
-                if self.running: print(f"Accept error: {e}")
+            timeout = self._ping_all()
+            if self.link is not None:
+                timeout = min(timeout, self._udp_timers())
+            for key, events in self.selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif self.link is not None:
+                    self._read_datagrams()
+                elif key.fileobj is self.sock and self.server is None:
+                    self._accept()
+                elif events & selectors.EVENT_READ:
+                    self._read(key.data)
+            self._flush_all()
+
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+        self._wake_w.close()
+
+    def _ping_all(self):
+        # Ping every connection that is due; returns how long select() may
+        # wait: until the next ping is due, or not at all if one was just queued
+        now = time.monotonic()
+        wait = PING_INTERVAL
+        with self.lock:
+            conns = list(self.clients.values()) if self.server is None else [self.server]
+            for conn in conns:
+                if now >= conn.next_ping:
+                    conn.queue(wire.frame({"type": "ping", "t": now}, conn.format), unreliable=True)
+                    conn.next_ping = now + PING_INTERVAL
+                    wait = 0.0
+                wait = min(wait, conn.next_ping - now)
+        return wait
+
+    def _udp_timers(self):
+        # Send held back datagrams that are due and drop peers gone quiet;
+        # returns how long select() may wait for those and for resends
+        now = time.monotonic()
+        wait = UDP_TIMEOUT
+        with self.lock:
+            due = self.link.pump()
+            conns = list(self.clients.values()) if self.server is None else [self.server]
+        if due is not None:
+            wait = min(wait, due)
+        for conn in conns:
+            if now - conn.heard > UDP_TIMEOUT:
+                print(f"Connection {conn.id} timed out")
+                self._drop(conn)
+            elif conn.unacked:
+                wait = min(wait, UDP_MIN_RTO)
+        return wait
+
+    def _accept(self):
+        try:
+            sock, addr = self.sock.accept()
+        except BlockingIOError:
+            return
+        conn_id = self.next_id
+        self.next_id += 1
+        print(f"New connection from {addr}, assigning ID {conn_id}")
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Small frames, sent now
+        conn = _Connection(sock, conn_id)
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+        self._welcome(conn)
+
+    def _welcome(self, conn):
+        with self.lock:
+            # ID assignment (always a JSON line) with the formats we speak
+            conn.queue(wire.frame({"type": "init", "id": conn.id, "formats": wire.FORMATS}, "json"))
+            self.clients[conn.id] = conn
 
-    def _receive_loop(self, sock, client_id):
-        buffer = ""
+    def _read(self, conn):
+        try:
+            n = conn.fill()
+        except BlockingIOError:
+            return
+        except OSError:
+            n = 0
+        if not n:
+            self._drop(conn)
+            return
+        self._parse(conn)
+
+    def _read_datagrams(self):
         while self.running:
             try:
-                data = sock.recv(4096)
-                if not data:
-                    break
-                
-                buffer += data.decode()
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if line:
-                        msg = json.loads(line)
-                        if client_id != -1: # Server receiving from client
-                            msg['player_id'] = client_id # Force ID trust
-                        
-                        # Special handling for Init on client side
-                        if msg.get('type') == 'init' and client_id == -1:
-                            self.my_id = msg['id']
-                            print(f"Assigned Player ID: {self.my_id}")
-                        else:
-                            with self.lock:
-                                self.input_queue.append(msg)
-            except Exception as e:
-                # print(f"Receive error (ID {client_id}): {e}")
-                break
-        
-        # Cleanup
-        if client_id != -1:
+                packet, addr = self.sock.recvfrom(UDP_RECV_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                return # An earlier datagram bounced (nobody listening); the timeout deals with it
+            conn = self.server if self.server is not None else self.peers.get(addr)
+            if conn is None:
+                if (len(packet) < UDP_HEADER.size or
+                        UDP_HEADER.unpack_from(packet)[:3] != (RELIABLE, 0, 1)):
+                    continue # Not a new client's first chunk: leftovers from a dropped peer
+                conn_id = self.next_id
+                self.next_id += 1
+                print(f"New connection from {addr}, assigning ID {conn_id}")
+                conn = self.peers[addr] = _UdpConnection(self.link, conn_id, addr)
+                self._welcome(conn)
+            try:
+                stream, frame = conn.receive(packet)
+                if frame is not None:
+                    binary, data = frame
+                    self._handle_message(conn, wire.decode(data[4:]) if binary else _json_message(data))
+            except Exception as e: # See _parse
+                print(f"Bad message from {conn.id}: {e!r}")
+                self._drop(conn)
+                continue
+            if stream:
+                conn.feed(stream)
+                self._parse(conn)
+
+    def _parse(self, conn):
+        # Handle every complete frame received on conn
+        try:
+            for msg in conn.messages():
+                self._handle_message(conn, msg)
+        except Exception as e:
+            # Whatever a peer sends that can't be decoded or handled (not an
+            # object, missing fields...) costs that peer its connection, not
+            # the I/O thread every other connection depends on
+            print(f"Bad message from {conn.id}: {e!r}")
+            self._drop(conn)
+
+    def _flush_all(self):
+        broken = []
+        now = time.monotonic()
+        with self.lock:
+            conns = list(self.clients.values()) if self.server is None else [self.server]
+            for conn in conns:
+                if not conn.stream:
+                    conn.flush()
+                    if conn.closing is not None and (not conn.unacked or now - conn.closing > CLOSE_GRACE):
+                        broken.append(conn)
+                    continue
+                if conn.sock.fileno() == -1:
+                    continue
+                try:
+                    done = conn.flush()
+                except BlockingIOError:
+                    done = False
+                except OSError:
+                    broken.append(conn)
+                    continue
+                if conn.closing is not None and (done or now - conn.closing > CLOSE_GRACE):
+                    broken.append(conn)
+                    continue
+                # Only ask for writability while there is a backlog
+                events = selectors.EVENT_READ if done else selectors.EVENT_READ | selectors.EVENT_WRITE
+                if self.selector.get_key(conn.sock).events != events:
+                    self.selector.modify(conn.sock, events, conn)
+        for conn in broken:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        if not conn.stream:
+            # The UDP socket is shared; just forget the peer
+            if conn.id != -1 and self.peers.pop(conn.addr, None) is None:
+                return # Already gone
+        else:
+            try:
+                self.selector.unregister(conn.sock)
+            except (KeyError, ValueError):
+                return # Already gone
+            conn.sock.close()
+        with self.lock:
+            if conn.id == -1:
+                self.running = False
+            elif self.clients.pop(conn.id, None) is not None:
+                self.input_queue.append({"type": "disconnect", "player_id": conn.id})
+
+    def _handle_message(self, conn, msg):
+        if conn.id != -1: # Server receiving from client
+            msg['player_id'] = conn.id # Force ID trust
+
+        if msg.get('type') == 'ping':
+            reply = {"type": "pong", "t": msg['t'], "now": time.monotonic()}
+            if conn.input_latency is not None:
+                reply['latency'] = conn.input_latency # Host: how late their inputs land
             with self.lock:
-                if client_id in self.clients:
-                    del self.clients[client_id]
-            # Enqueue disconnect message
+                conn.queue(wire.frame(reply, conn.format), unreliable=True)
+            return
+
+        if msg.get('type') == 'pong':
+            conn.pong(msg['t'], msg['now'], time.monotonic())
+            if 'latency' in msg:
+                conn.input_latency = msg['latency']
+            return
+
+        if msg.get('type') == 'format':
+            fmt = msg['format'] if msg.get('format') in wire.FORMATS else "json"
+            if conn.id != -1:
+                # Server: ack as the last JSON line, then switch this client over
+                with self.lock:
+                    conn.queue(wire.frame({"type": "format", "format": fmt}, "json"))
+                    conn.format = fmt
+            conn.binary = fmt == "binary"
+            return
+
+        # Special handling for Init on client side
+        if msg.get('type') == 'init' and conn.id == -1:
+            self.my_id = msg['id']
+            print(f"Assigned Player ID: {self.my_id}")
+            if self.wire_format in msg.get('formats', []) and self.wire_format != "json":
+                with self.lock:
+                    conn.queue(wire.frame({"type": "format", "format": self.wire_format}, "json"))
+                    conn.format = self.wire_format
+        else:
+            if 'sent' in msg and conn.id == -1:
+                msg['received'] = self.host_time()
             with self.lock:
-                self.input_queue.append({"type": "disconnect", "player_id": client_id})
+                self.input_queue.append(msg)
 
-    def _send_raw(self, sock, data):
-        try:
-            msg = json.dumps(data) + "\n"
-            sock.sendall(msg.encode())
-        except:
-            pass
+    # --- Game thread ---
 
     def send_update(self, state_data):
         # Server sending game state to all
-        # Optimization: Don't send JSON if state is massive?
-        # For Snake, it's okay for now.
-        msg_str = json.dumps(state_data) + "\n"
-        encoded = msg_str.encode()
-        
+        self.send_to(None, state_data)
+
+    def send_to(self, client_ids, state_data):
+        # Server sending to some clients (None: all of them): encode once per
+        # wire format in use and queue it; never blocks
+        encoded = {}
+        droppable = state_data.get('type') in DROPPABLE
+        unreliable = state_data.get('type') in UNRELIABLE_TYPES
+        if state_data.get('type') in ('state', 'delta'):
+            state_data['sent'] = time.monotonic()
+
         with self.lock:
-            for cid, conn in self.clients.items():
-                try:
-                    conn.sendall(encoded)
-                except:
-                    pass # Handle cleanup in recv loop
+            if client_ids is None:
+                conns = list(self.clients.values())
+            else:
+                conns = [self.clients[cid] for cid in client_ids if cid in self.clients]
+            for conn in conns:
+                if conn.format not in encoded:
+                    encoded[conn.format] = wire.frame(state_data, conn.format)
+                conn.queue(encoded[conn.format], droppable, unreliable)
+        self._wake()
 
     def send_input(self, input_data):
-        # Client sending input
-        if self.sock:
-            self._send_raw(self.sock, input_data)
+        # Client sending input. Direction changes are stamped on the host's
+        # clock, and written straight away instead of waiting for the I/O thread.
+        if not self.server:
+            return
+        if input_data.get('type') == 'input':
+            input_data['sent'] = self.host_time()
+        with self.lock:
+            conn = self.server
+            conn.queue(wire.frame(input_data, conn.format))
+            try:
+                if conn.flush():
+                    return
+            except OSError: # Includes BlockingIOError; the I/O thread deals with it
+                pass
+        self._wake()
+
+    def host_time(self):
+        # Now, on the host's clock
+        if self.server is None:
+            return time.monotonic()
+        return time.monotonic() + self.server.offset
+
+    def input_applied(self, msg):
+        # Host: the simulation just took input msg
+        latency = input_latency(msg)
+        if latency is not None:
+            self.record_latency(msg.get('player_id'), latency)
+
+    def record_latency(self, client_id, latency):
+        with self.lock:
+            conn = self.clients.get(client_id)
+            if conn is None:
+                return
+            if conn.input_latency is None:
+                conn.input_latency = latency
+            else:
+                conn.input_latency += (latency - conn.input_latency) * LATENCY_SMOOTHING
+
+    def stats(self):
+        # Player ID -> {"rtt": ms, "latency": ms} (None until measured). The
+        # host knows every client; a client only knows itself.
+        with self.lock:
+            if self.server is None:
+                conns = self.clients.items()
+            else:
+                conns = [(self.my_id, self.server)] if self.my_id is not None else []
+            return {pid: {"rtt": _ms(conn.rtt), "latency": _ms(conn.input_latency)}
+                    for pid, conn in conns}
+
+    def disconnect(self, client_id):
+        # Host: close a client's connection once what is queued for it has
+        # gone out (or after CLOSE_GRACE). A "disconnect" event follows.
+        with self.lock:
+            conn = self.clients.get(client_id)
+            if conn is not None and conn.closing is None:
+                conn.closing = time.monotonic()
+        self._wake()
 
     def get_events(self):
         with self.lock:
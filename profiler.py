@@ -0,0 +1,134 @@
+import json
+import time
+from collections import deque
+
+try:
+    import pygame
+except ImportError: # Headless: timing and dumps still work
+    pygame = None
+
+# Per-phase frame profiler (profiler.enabled in config, F3 toggles the overlay).
+#
+# Game and World report how long each phase took with add(); frame() closes
+# the frame, so every phase gets one sample per frame: its total time in that
+# frame (several ticks can run in one frame, or none). The last `window`
+# frames are kept per phase for the overlay's percentiles and histograms;
+# whole-session histograms are kept alongside for the dump on exit.
+#
+# Phases: events (pygame input), network (draining and handling received
+# messages), move (Snake.update), collide (collision checks and removing dead
+# snakes), food (eating and spawning), encode (state/delta serialization),
+# send (queueing it for the network thread), draw (drawing and the flip).
+
+PHASES = ['events', 'network', 'move', 'collide', 'food', 'encode', 'send', 'draw']
+WINDOW = 600 # Frames kept for the overlay: 10 s at 60 fps
+BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16] # Upper edges; one more bucket for slower
+OVERLAY_REFRESH = 15 # Frames between overlay redraws
+
+
+def _bucket(ms):
+    for i, edge in enumerate(BUCKETS_MS):
+        if ms < edge:
+            return i
+    return len(BUCKETS_MS)
+
+
+class Profiler:
+    def __init__(self, window=WINDOW):
+        names = PHASES + ['frame']
+        self.samples = {name: deque(maxlen=window) for name in names} # ms per frame
+        self.session = {name: [0] * (len(BUCKETS_MS) + 1) for name in names}
+        self.worst = dict.fromkeys(names, 0.0)
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.frames = 0
+        self.started = time.time()
+        self.overlay = None
+
+    def add(self, phase, seconds):
+        self.current[phase] += seconds
+
+    def frame(self, seconds):
+        # End of a frame that took `seconds` (not counting the wait for the fps cap)
+        self.current['frame'] = seconds
+        for name, value in self.current.items():
+            ms = value * 1000
+            self.samples[name].append(ms)
+            self.session[name][_bucket(ms)] += 1
+            self.worst[name] = max(self.worst[name], ms)
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.frames += 1
+
+    def stats(self, phase):
+        """p50/p95/max/mean in ms over the window."""
+        ordered = sorted(self.samples[phase])
+        if not ordered:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0, "mean": 0.0}
+        return {"p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+                "mean": sum(ordered) / len(ordered)}
+
+    def histogram(self, phase):
+        # Frame counts per bucket over the window
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        for ms in self.samples[phase]:
+            counts[_bucket(ms)] += 1
+        return counts
+
+    def report(self):
+        lines = [f"{'phase':<8} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7}  (last {len(self.samples['frame'])} frames)"]
+        for name in self.samples:
+            s = self.stats(name)
+            lines.append(f"{name:<8} {s['p50']:>7.2f} {s['p95']:>7.2f} {s['max']:>7.2f}")
+        return lines
+
+    def dump(self, path=None):
+        # Summary to stdout; session histograms to path as JSON
+        if not self.frames:
+            return
+        print(f"Profile over {self.frames} frames:")
+        for line in self.report():
+            print("  " + line)
+        if path:
+            with open(path, 'w') as f:
+                json.dump({"frames": self.frames,
+                           "seconds": time.time() - self.started,
+                           "buckets_ms": BUCKETS_MS,
+                           "phases": {name: {"window": self.stats(name),
+                                             "max": self.worst[name],
+                                             "histogram": self.session[name]}
+                                      for name in self.samples}}, f, indent=4)
+            print(f"Profile saved to {path}")
+
+    def draw(self, font, text):
+        """Overlay surface: one row per phase with percentiles and a bar
+           histogram of the window. text is a render.TextCache.
+        """
+        if self.overlay is not None and self.frames % OVERLAY_REFRESH:
+            return self.overlay
+        row = font.get_linesize()
+        bars_x = font.size("collide 00.00 00.00 00.00 ")[0]
+        bar_w = 6
+        width = bars_x + (len(BUCKETS_MS) + 1) * (bar_w + 1) + 4
+        surface = pygame.Surface((width, row * (len(self.samples) + 1) + 4), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 180))
+
+        color = (255, 255, 255)
+        surface.blit(text.render(font, "phase     p50   p95   max  <50us .. >16ms", color), (2, 2))
+        for i, name in enumerate(self.samples, 1):
+            s = self.stats(name)
+            y = 2 + i * row
+            # Round so the text cache sees the same strings frame to frame
+            line = f"{name:<7} {s['p50']:5.2f} {s['p95']:5.2f} {s['max']:5.1f}"
+            surface.blit(text.render(font, line, color), (2, y))
+            counts = self.histogram(name)
+            total = max(1, sum(counts))
+            for b, count in enumerate(counts):
+                if not count:
+                    continue
+                h = max(1, round((row - 2) * count / total))
+                slow = b >= _bucket(16.6) # Over a 60 fps frame budget
+                pygame.draw.rect(surface, (255, 80, 80) if slow else (80, 200, 255),
+                                 (bars_x + b * (bar_w + 1), y + row - 1 - h, bar_w, h))
+        self.overlay = surface
+        return surface
@@ -0,0 +1,238 @@
+from collections import OrderedDict
+from itertools import chain
+
+try:
+    import pygame
+except ImportError: # Headless server
+    pygame = None
+
+# Dirty-rectangle renderer for the playfield (window.dirty_rects in config).
+#
+# Snakes and food are painted onto a persistent field surface. Each frame only
+# what changed is painted or erased there: for point bodies, the points that
+# entered or left the drawn window of seq numbers (new heads, old tails), for
+# corner bodies the segment rects that changed. Erasing a block can uncover
+# parts of its neighbours, so the few points around it are painted again.
+# The screen gets the field copied back only where something changed, the
+# interpolated head/tail and the HUD on top, and display.update() is told
+# just those rects instead of flipping the whole window.
+#
+# Overlap between different snakes isn't tracked (it only lasts until the
+# collision kills one of them, which repaints everything), and any stray
+# pixels are healed by a full repaint every FULL_REPAINT_INTERVAL frames.
+
+FULL_REPAINT_INTERVAL = 120
+TEXT_CACHE_SIZE = 256
+
+
+class TextCache:
+    # font.render() results keyed by (font, text, color). Menus, HUD and
+    # leaderboard lines are the same strings frame after frame; the least
+    # recently used surface is dropped once there are more than `size`.
+    def __init__(self, size=TEXT_CACHE_SIZE):
+        self.size = size
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, antialias, color)
+            if len(self.surfaces) > self.size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+class _Painted:
+    # What of one snake is currently on the field
+    def __init__(self, snake):
+        self.body = snake.body
+        self.corner_mode = snake.corner_mode
+        self.points = {} # seq -> block rect, point bodies
+        self.lo, self.hi = 0, -1 # Seq range painted
+        self.rects = set() # Corner bodies
+
+
+class Renderer:
+    def __init__(self, screen, config):
+        self.screen = screen
+        self.size = config['game']['block_size']
+        self.background = tuple(config['colors']['background'])
+        self.food_color = tuple(config['colors']['food'])
+        self.field = pygame.Surface(screen.get_size())
+        self.painted = {} # snake ID -> _Painted
+        self.food = set()
+        self.overlays = [] # Rects drawn straight onto the screen last frame
+        self.frames = 0
+        self.full = True
+
+    def invalidate(self):
+        # Something else drew on the screen: repaint everything next frame
+        self.full = True
+
+    def _block(self, p):
+        return (int(p[0]), int(p[1]), self.size, self.size)
+
+    def _paint(self, rect, color):
+        pygame.draw.rect(self.field, color, rect)
+        self.dirty.append(rect)
+
+    def _erase(self, rect):
+        self.field.fill(self.background, rect)
+        self.dirty.append(rect)
+        self.erased.append(rect)
+
+    def _hits(self, rect, rects=None):
+        x, y, w, h = rect
+        for ex, ey, ew, eh in self.erased if rects is None else rects:
+            if x < ex + ew and ex < x + w and y < ey + eh and ey < y + h:
+                return True
+        return False
+
+    def draw(self, snakes, food_positions, alpha=1.0, spans=None, hud=()):
+        """Paint the playfield and push the changed parts to the display.
+           spans: {snake ID: (start, count)} for remote snakes drawn from
+           interpolation trails (see Snake.draw).
+           hud: (surface, pos) pairs drawn on top.
+        """
+        spans = spans or {}
+        self.frames += 1
+        if (self.full or self.frames % FULL_REPAINT_INTERVAL == 0 or
+                any(sid not in snakes or snakes[sid].corner_mode != p.corner_mode
+                    for sid, p in self.painted.items())):
+            # Start from an empty field; everything counts as new below
+            self.full = True
+            self.field.fill(self.background)
+            self.painted = {}
+            self.food = set()
+            self.overlays = []
+
+        self.dirty = list(self.overlays)
+        self.erased = []
+        touched = {} # snake ID -> seqs whose neighbours need repainting
+
+        for sid, snake in snakes.items():
+            if sid not in self.painted:
+                self.painted[sid] = _Painted(snake)
+            if snake.corner_mode:
+                self._update_corners(self.painted[sid], snake, alpha)
+            else:
+                touched[sid] = self._update_points(self.painted[sid], snake, spans.get(sid))
+
+        food = {self._block(p) for p in food_positions}
+        for rect in self.food - food:
+            self._erase(rect)
+        for rect in food - self.food:
+            self._paint(rect, self.food_color)
+        self.food = food
+
+        if self.erased:
+            self._repair(snakes, touched)
+        # Food goes on top of anything painted or repaired under it
+        if not self.full:
+            for rect in self.food:
+                if self._hits(rect, self.dirty):
+                    pygame.draw.rect(self.field, self.food_color, rect)
+
+        # Screen: field where it changed, then the moving ends and the HUD
+        if self.full:
+            self.screen.blit(self.field, (0, 0))
+        else:
+            for rect in set(self.dirty):
+                self.screen.blit(self.field, rect, rect)
+        self.overlays = []
+        for sid, snake in snakes.items():
+            if snake.corner_mode or sid in spans:
+                continue
+            head, tail = snake.ends(alpha)
+            self.overlays.append(self._block(head))
+            pygame.draw.rect(self.screen, snake.color, self.overlays[-1])
+            if tail != snake.body[-1]:
+                self.overlays.append(self._block(tail))
+                pygame.draw.rect(self.screen, snake.color, self.overlays[-1])
+        for surface, pos in hud:
+            self.overlays.append(tuple(self.screen.blit(surface, pos)))
+
+        if self.full:
+            pygame.display.flip()
+            self.full = False
+        else:
+            pygame.display.update(list(set(self.dirty)) + self.overlays)
+
+    def _window(self, snake, span):
+        # Seq range of the body to have on the field. body[i] is seq - i;
+        # the head itself is an overlay unless the snake is drawn from a span.
+        oldest = snake.seq - len(snake.body) + 1
+        if span is None:
+            return oldest, snake.seq - 1
+        start, count = span
+        hi = snake.seq - start
+        return max(oldest, hi - count + 1), hi
+
+    def _update_points(self, painted, snake, span):
+        lo, hi = self._window(snake, span)
+        body, top, points = snake.body, snake.seq, painted.points
+        touched = []
+
+        if painted.body is not body:
+            # Replaced (reconciled, resynced): fix whatever moved
+            for s in range(max(lo, painted.lo), min(hi, painted.hi) + 1):
+                rect = self._block(body[top - s])
+                if rect != points[s]:
+                    self._erase(points[s])
+                    points[s] = rect
+                    self._paint(rect, snake.color)
+                    touched.append(s)
+            painted.body = body
+
+        # Out of the window: old tails (or heads when the window moved back)
+        for s in chain(range(painted.lo, min(painted.hi, lo - 1) + 1),
+                       range(max(painted.lo, hi + 1), painted.hi + 1)):
+            self._erase(points.pop(s))
+            touched.append(s)
+
+        # Into the window: new heads
+        for s in chain(range(lo, min(hi, painted.lo - 1) + 1),
+                       range(max(lo, painted.hi + 1), hi + 1)):
+            points[s] = self._block(body[top - s])
+            self._paint(points[s], snake.color)
+
+        painted.lo, painted.hi = lo, hi
+        return touched
+
+    def _update_corners(self, painted, snake, alpha):
+        rects = {tuple(map(int, r)) for r in snake.corner_rects(*snake.ends(alpha))}
+        for rect in painted.rects - rects:
+            self._erase(rect)
+        for rect in rects - painted.rects:
+            self._paint(rect, snake.color)
+        painted.rects = rects
+
+    def _reach(self, snake):
+        # How many points along the body can overlap one block
+        if snake.pixel_mode:
+            return int(2 * self.size / snake.pixel_speed) + 2
+        return 2
+
+    def _repair(self, snakes, touched):
+        # Erased blocks may have cut into neighbours: paint those again
+        for sid, snake in snakes.items():
+            painted = self.painted[sid]
+            if snake.corner_mode:
+                for rect in painted.rects:
+                    if self._hits(rect):
+                        pygame.draw.rect(self.field, snake.color, rect)
+                continue
+
+            reach = self._reach(snake)
+            # Around erased points of this snake, and near the head for
+            # food it just ate
+            near = set(range(painted.hi - 2 * reach, painted.hi + 1))
+            for s in touched.get(sid, ()):
+                near.update(range(s - reach, s + reach + 1))
+            for s in near:
+                rect = painted.points.get(s)
+                if rect is not None and self._hits(rect):
+                    pygame.draw.rect(self.field, snake.color, rect)
@@ -0,0 +1,409 @@
+import json
+import os
+import struct
+import zlib
+from array import array
+from engine import World
+from grid import FOOD_OWNER
+from snake import Snake, Direction
+import wire
+
+# Match recording and headless playback.
+#
+# A replay is the config plus everything that was fed into the World, tick by
+# tick, so playing it back runs exactly the same simulation:
+#   - inputs passed to World.step() and the held-keys dict,
+#   - every snake's next_direction/accelerating right before the step (local
+#     steering goes straight to the Snake, not through the World),
+#   - changes made between steps: apply_input(), add_snake(), remove_snake()
+#     and spawn_food() calls.
+#
+# Every keyframe_interval ticks a full keyframe of the World is written (bodies,
+# food, the RNG state and the free-cell order food spawning samples from). The
+# file is a series of zlib-compressed chunks, each starting with a keyframe,
+# and ends with an index of (tick, offset) per chunk, so seeking decompresses
+# one chunk and replays at most keyframe_interval ticks. If the recording
+# never got closed (crash), the index is rebuilt by walking the chunk headers.
+#
+# File: MAGIC, <u8 version>, <u32 length><JSON header>,
+#       chunks: <u32 first tick><u32 length><zlib data>,
+#       index: <u32 count>(<u32 tick><u64 offset>)*, <u64 index offset>, INDEX_MAGIC
+
+MAGIC = b"SNKREPLY"
+INDEX_MAGIC = b"SNKRIDX1"
+VERSION = 1
+KEYFRAME_INTERVAL = 300
+
+REC_KEYFRAME = 0
+REC_TICK = 1
+REC_INPUT = 2
+REC_ADD = 3
+REC_REMOVE = 4
+REC_SPAWN = 5
+
+DIRECTIONS = list(Direction)
+
+_CHUNK = struct.Struct('<II')
+_TRAILER = struct.Struct('<Q')
+
+
+def capture(world):
+    """Everything needed to rebuild world exactly, as a JSON-able dict."""
+    snakes = []
+    for sid, snake in world.snakes.items():
+        s = {'id': sid, 'name': snake.name, 'color': list(snake.color),
+             'corners': snake.corner_mode, 'body': [list(p) for p in snake.body],
+             'seq': snake.seq, 'direction': snake.direction.name,
+             'next_direction': snake.next_direction.name, 'grow_pending': snake.grow_pending,
+             'speed_multiplier': snake.speed_multiplier, 'accelerating': snake.accelerating,
+             'score': snake.score}
+        if snake.corner_mode:
+            s['length'] = snake.body.length
+            s['advanced'] = snake.body._advanced
+        snakes.append(s)
+    version, state, gauss = world.rng.getstate()
+    return {'tick': world.tick, 'snakes': snakes,
+            'food': [list(p) for p in world.food.positions],
+            'dead': sorted(world.dead_players),
+            'acks': [[pid, seq, tick] for pid, (seq, tick) in world.acks.items()],
+            'rng': [version, list(state), gauss],
+            'free': list(world.grid.free.cells)}
+
+
+def restore(config, state):
+    """A new World in the captured state."""
+    world = World(config)
+    for s in state['snakes']:
+        snake = Snake(config, tuple(s['body'][0]), s['id'], s['name'])
+        snake.color = tuple(s['color'])
+        snake.corner_mode = s['corners']
+        snake.body = snake._new_body([tuple(p) for p in s['body']])
+        if snake.corner_mode:
+            snake.body.length = s['length']
+            snake.body._advanced = s['advanced']
+        snake.seq = s['seq']
+        snake.direction = Direction[s['direction']]
+        snake.next_direction = Direction[s['next_direction']]
+        snake.grow_pending = s['grow_pending']
+        snake.speed_multiplier = s['speed_multiplier']
+        snake.accelerating = s['accelerating']
+        snake.score = s['score']
+        snake.attach(world.grid)
+        world.snakes[s['id']] = snake
+    for pos in state['food']:
+        pos = tuple(pos)
+        world.food.positions.append(pos)
+        world.grid.add(FOOD_OWNER, 0, pos)
+
+    # Food spawning samples by position in the free-cell list: same order
+    free = world.grid.free
+    free.cells = array('i', state['free'])
+    for i in range(len(free.index)):
+        free.index[i] = -1
+    for pos, cell in enumerate(free.cells):
+        free.index[cell] = pos
+
+    world.dead_players.update(state['dead'])
+    world.acks = {pid: (seq, tick) for pid, seq, tick in state['acks']}
+    version, rng_state, gauss = state['rng']
+    world.rng.setstate((version, tuple(rng_state), gauss))
+    world.tick = state['tick']
+    return world
+
+
+class Recorder:
+    # Attached as world.recorder; the World reports to it (see engine.py)
+    def __init__(self, path, world, keyframe_interval=KEYFRAME_INTERVAL):
+        self.file = open(path, 'wb')
+        self.world = world
+        self.keyframe_interval = keyframe_interval
+        self.index = [] # (first tick, file offset) per chunk
+        self.chunk = None # Records of the chunk being built
+        self.chunk_tick = None
+
+        header = json.dumps({"config": world.config, "seed": world.seed,
+                             "keyframe_interval": keyframe_interval}).encode()
+        self.file.write(MAGIC + struct.pack('<BI', VERSION, len(header)) + header)
+
+    def _flush_chunk(self):
+        if self.chunk is None:
+            return
+        data = zlib.compress(b"".join(self.chunk))
+        self.index.append((self.chunk_tick, self.file.tell()))
+        self.file.write(_CHUNK.pack(self.chunk_tick, len(data)) + data)
+        self.file.flush()
+        self.chunk = None
+
+    def _start_chunk(self):
+        self._flush_chunk()
+        keyframe = json.dumps(capture(self.world)).encode()
+        self.chunk = [struct.pack('<BI', REC_KEYFRAME, len(keyframe)), keyframe]
+        self.chunk_tick = self.world.tick
+
+    # Between steps
+
+    def input(self, msg):
+        # Send times are for latency stats, not the simulation
+        payload = wire.encode({k: v for k, v in msg.items() if k != 'sent'})
+        self._op(struct.pack('<BHH', REC_INPUT, msg.get('player_id', 0), len(payload)) + payload)
+
+    def add(self, snake_id, start_pos, name, color):
+        data = json.dumps([snake_id, list(start_pos), name, list(color) if color else None]).encode()
+        self._op(struct.pack('<BH', REC_ADD, len(data)) + data)
+
+    def remove(self, snake_id):
+        self._op(struct.pack('<BH', REC_REMOVE, snake_id))
+
+    def spawn(self, count):
+        self._op(struct.pack('<BH', REC_SPAWN, count))
+
+    def _op(self, record):
+        if self.chunk is None:
+            self._start_chunk() # Nothing stepped yet: the keyframe already has this
+            return
+        self.chunk.append(record)
+
+    # At the start of World.step
+
+    def step(self, inputs, held):
+        if self.chunk is None or self.world.tick - self.chunk_tick >= self.keyframe_interval:
+            self._start_chunk()
+        parts = [struct.pack('<BB', REC_TICK, len(self.world.snakes))]
+        for sid, snake in self.world.snakes.items():
+            parts.append(struct.pack('<HBB', sid, DIRECTIONS.index(snake.next_direction),
+                                     snake.accelerating))
+        parts.append(struct.pack('<B', len(inputs)))
+        for msg in inputs:
+            payload = wire.encode(msg)
+            parts.append(struct.pack('<HH', msg.get('player_id', 0), len(payload)) + payload)
+        held = held or {}
+        parts.append(struct.pack('<B', len(held)))
+        for sid, directions in held.items():
+            mask = sum(1 << DIRECTIONS.index(d) for d in directions or ())
+            parts.append(struct.pack('<HB', sid, mask))
+        self.chunk.append(b"".join(parts))
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._flush_chunk()
+        offset = self.file.tell()
+        self.file.write(struct.pack('<I', len(self.index)))
+        for tick, chunk_offset in self.index:
+            self.file.write(struct.pack('<IQ', tick, chunk_offset))
+        self.file.write(_TRAILER.pack(offset) + INDEX_MAGIC)
+        self.file.close()
+
+
+def _read_records(data):
+    # Yield (kind, payload) from a decompressed chunk
+    pos = 0
+    while pos < len(data):
+        kind = data[pos]
+        pos += 1
+        if kind == REC_KEYFRAME:
+            n, = struct.unpack_from('<I', data, pos)
+            pos += 4
+            yield kind, json.loads(data[pos:pos + n])
+            pos += n
+        elif kind == REC_TICK:
+            count, = struct.unpack_from('<B', data, pos)
+            pos += 1
+            steer = []
+            for _ in range(count):
+                steer.append(struct.unpack_from('<HBB', data, pos))
+                pos += 4
+            count, = struct.unpack_from('<B', data, pos)
+            pos += 1
+            inputs = []
+            for _ in range(count):
+                pid, n = struct.unpack_from('<HH', data, pos)
+                pos += 4
+                msg = wire.decode(data[pos:pos + n])
+                msg['player_id'] = pid
+                inputs.append(msg)
+                pos += n
+            count, = struct.unpack_from('<B', data, pos)
+            pos += 1
+            held = {}
+            for _ in range(count):
+                sid, mask = struct.unpack_from('<HB', data, pos)
+                held[sid] = {d for i, d in enumerate(DIRECTIONS) if mask & (1 << i)}
+                pos += 3
+            yield kind, (steer, inputs, held)
+        elif kind == REC_INPUT:
+            pid, n = struct.unpack_from('<HH', data, pos)
+            pos += 4
+            msg = wire.decode(data[pos:pos + n])
+            msg['player_id'] = pid
+            yield kind, msg
+            pos += n
+        elif kind == REC_ADD:
+            n, = struct.unpack_from('<H', data, pos)
+            pos += 2
+            yield kind, json.loads(data[pos:pos + n])
+            pos += n
+        elif kind in (REC_REMOVE, REC_SPAWN):
+            value, = struct.unpack_from('<H', data, pos)
+            pos += 2
+            yield kind, value
+        else:
+            raise ValueError(f"Unknown replay record {kind}")
+
+
+def _apply(world, kind, payload):
+    # Replay one non-keyframe record. Returns step events for ticks, else None.
+    if kind == REC_TICK:
+        steer, inputs, held = payload
+        for sid, direction, accelerating in steer:
+            snake = world.snakes.get(sid)
+            if snake is not None:
+                snake.next_direction = DIRECTIONS[direction]
+                snake.accelerating = bool(accelerating)
+        return world.step(inputs, held)
+    if kind == REC_INPUT:
+        world.apply_input(payload)
+    elif kind == REC_ADD:
+        sid, pos, name, color = payload
+        world.add_snake(sid, tuple(pos), name, tuple(color) if color else None)
+    elif kind == REC_REMOVE:
+        world.remove_snake(payload)
+    elif kind == REC_SPAWN:
+        world.spawn_food(payload)
+    return None
+
+
+def _simulated(state):
+    # A keyframe without the steering set since the last step: that only
+    # reaches the replay with the next tick record
+    state = json.loads(json.dumps(state))
+    for s in state['snakes']:
+        del s['next_direction'], s['accelerating']
+    return state
+
+
+class Replay:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        if not self.data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a replay")
+        pos = len(MAGIC)
+        version, n = struct.unpack_from('<BI', self.data, pos)
+        if version != VERSION:
+            raise ValueError(f"Unsupported replay version {version}")
+        pos += 5
+        header = json.loads(self.data[pos:pos + n])
+        self.config = header['config']
+        self.seed = header['seed']
+        self.keyframe_interval = header['keyframe_interval']
+        self.index = self._read_index(pos + n)
+
+    def _read_index(self, first_chunk):
+        if self.data.endswith(INDEX_MAGIC):
+            end = len(self.data) - len(INDEX_MAGIC) - _TRAILER.size
+            offset, = _TRAILER.unpack_from(self.data, end)
+            count, = struct.unpack_from('<I', self.data, offset)
+            return [struct.unpack_from('<IQ', self.data, offset + 4 + i * 12) for i in range(count)]
+        # Not closed: walk the chunks, dropping a torn one at the end
+        index = []
+        pos = first_chunk
+        while pos + _CHUNK.size <= len(self.data):
+            tick, n = _CHUNK.unpack_from(self.data, pos)
+            if pos + _CHUNK.size + n > len(self.data):
+                break
+            index.append((tick, pos))
+            pos += _CHUNK.size + n
+        return index
+
+    def _chunk(self, i):
+        tick, offset = self.index[i]
+        _, n = _CHUNK.unpack_from(self.data, offset)
+        start = offset + _CHUNK.size
+        return _read_records(zlib.decompress(self.data[start:start + n]))
+
+    @property
+    def first_tick(self):
+        return self.index[0][0] if self.index else 0
+
+    def seek(self, tick):
+        """World as it was right before step number `tick` (clamped to the recording)."""
+        i = 0
+        while i + 1 < len(self.index) and self.index[i + 1][0] <= tick:
+            i += 1
+        world = None
+        for kind, payload in self._chunk(i):
+            if kind == REC_KEYFRAME:
+                world = restore(self.config, payload)
+            elif kind == REC_TICK and world.tick >= tick:
+                break
+            else:
+                _apply(world, kind, payload)
+        return world
+
+    def play(self, start=None):
+        """Yield (world, events) after every recorded step, from tick start on."""
+        first = 0
+        if start is not None:
+            while first + 1 < len(self.index) and self.index[first + 1][0] <= start:
+                first += 1
+        world = None
+        for i in range(first, len(self.index)):
+            for kind, payload in self._chunk(i):
+                if kind == REC_KEYFRAME:
+                    if world is None:
+                        world = restore(self.config, payload)
+                    continue
+                if kind == REC_TICK and start is not None and world.tick < start:
+                    _apply(world, kind, payload)
+                    continue
+                events = _apply(world, kind, payload)
+                if events is not None:
+                    yield world, events
+
+    def verify(self):
+        """Replay the whole recording, checking the state against every keyframe.
+           Returns the ticks where the replay diverged (empty if deterministic).
+        """
+        diverged = []
+        world = None
+        for i in range(len(self.index)):
+            for kind, payload in self._chunk(i):
+                if kind == REC_KEYFRAME:
+                    if world is not None and _simulated(capture(world)) != _simulated(payload):
+                        diverged.append(payload['tick'])
+                    world = restore(self.config, payload)
+                else:
+                    _apply(world, kind, payload)
+        return diverged
+
+
+if __name__ == "__main__":
+    # Headless playback: python replay.py FILE [seek tick] [--verify]
+    import sys
+    import time
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    replay = Replay(args[0])
+    print(f"{os.path.getsize(args[0])} bytes, {len(replay.index)} chunks, "
+          f"ticks from {replay.first_tick}, keyframe every {replay.keyframe_interval}")
+
+    if '--verify' in sys.argv:
+        diverged = replay.verify()
+        print("Deterministic" if not diverged else f"Diverged at ticks {diverged}")
+
+    if len(args) > 1:
+        start = time.perf_counter()
+        world = replay.seek(int(args[1]))
+        print(f"Seek to tick {world.tick} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for sid, snake in world.snakes.items():
+            print(f"  {sid} {snake.name}: head {snake.body[0]} length {len(snake.body)} score {snake.score}")
+    else:
+        start = time.perf_counter()
+        ticks = deaths = 0
+        for world, events in replay.play():
+            ticks += 1
+            deaths += sum(1 for e in events if e['type'] == 'death')
+        elapsed = time.perf_counter() - start
+        print(f"Played {ticks} ticks in {elapsed:.2f}s ({ticks / elapsed if elapsed else 0:.0f} ticks/s), "
+              f"{deaths} deaths")
@@ -0,0 +1,588 @@
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from multiprocessing.connection import wait
+from engine import World, tick_rate
+from delta import StateEncoder
+from interest import InterestManager
+from network import SnakeNetwork, input_latency, network_options
+from leaderboard import Leaderboard, board_for
+from utils import load_config
+
+# Dedicated headless server: python server.py [port]
+#
+# Runs many independent rooms in one process, without pygame or a display.
+# Clients join with the normal "Join Game" menu; "ip:port/name" asks for a
+# room by name, plain "ip:port" gets the first room still in its lobby (or a
+# new one). A room starts start_delay seconds after its first player joins,
+# or as soon as it is full, and goes back to its lobby restart_delay seconds
+# after the last snake dies.
+#
+# All rooms are ticked from this one loop; the network I/O thread only queues
+# messages, so a busy room or a slow client never holds up the others.
+#
+# With server.workers > 1 (0 means one per CPU core) the rooms are sharded
+# across worker processes instead, so matches aren't all fighting over one
+# GIL. The Supervisor keeps every socket and routes each player's messages to
+# the worker running their room; workers tick their rooms and send back what
+# to broadcast. New rooms go to the least loaded worker, rooms sitting in
+# their lobby are moved off a busy one, and per-worker tick load is printed
+# every REPORT_INTERVAL seconds. A move is a hand-off: the worker only lets a
+# room go if it is still in its lobby by the time it gets the request.
+#
+# A room that raises is closed on its own, and a worker process that dies
+# takes only its own rooms with it: their players get an error and are
+# disconnected, and a fresh worker takes its place.
+#
+# Finished snakes are recorded on the leaderboard for the configured mode.
+# Each process opens its own Leaderboard; the SQLite store lets all the
+# workers write to it at once.
+
+ROOM_LOBBY = 0
+ROOM_PLAYING = 1
+ROOM_OVER = 2
+
+MAX_LAG = 0.25 # Seconds behind schedule before we stop catching up
+REPORT_INTERVAL = 10 # Seconds between worker load reports
+REBALANCE_INTERVAL = 5 # Seconds between attempts to move a room
+REBALANCE_GAP = 0.25 # Load difference (fraction of a tick) worth moving a room for
+LOAD_SMOOTHING = 0.05
+
+COLORS = [
+    (0, 255, 0),
+    (255, 0, 255),
+    (0, 0, 255),
+    (255, 255, 0),
+]
+
+
+class Room:
+    def __init__(self, name, config, network, leaderboard=None):
+        self.name = name
+        self.config = config
+        self.network = network
+        self.leaderboard = leaderboard # Where finished snakes' scores go, if anywhere
+        settings = config.get('server', {})
+        self.size = settings.get('room_size', 4)
+        self.start_delay = settings.get('start_delay', 10)
+        self.restart_delay = settings.get('restart_delay', 5)
+        self.snapshot_interval = max(1, config.get('network', {}).get('snapshot_interval', 1))
+
+        self.players = {} # ID -> name, in join order
+        self.inputs = []
+        self.reset()
+
+    def reset(self):
+        self.world = World(self.config)
+        self.encoder = StateEncoder()
+        # network.interest_radius: each player only gets what is near their head
+        self.interest = InterestManager(self.config) if self.config.get('network', {}).get('interest_radius') else None
+        self.state = ROOM_LOBBY
+        self.since = time.monotonic() # When the current state began
+
+    def is_open(self):
+        return self.state == ROOM_LOBBY and len(self.players) < self.size
+
+    def send(self, msg):
+        self.network.send_to(list(self.players), msg)
+
+    def send_lobby(self):
+        self.send({"type": "lobby",
+                   "players": [{"id": pid, "name": name} for pid, name in self.players.items()]})
+
+    def join(self, pid, name):
+        if not self.players:
+            self.since = time.monotonic()
+        self.players[pid] = name
+        self.send_lobby()
+
+    def leave(self, pid):
+        self.players.pop(pid, None)
+        self.world.remove_snake(pid)
+        if self.interest:
+            self.interest.forget(pid)
+        if self.state == ROOM_LOBBY:
+            self.send_lobby()
+
+    def handle(self, msg):
+        if msg['type'] in ('input', 'accel'):
+            self.inputs.append(msg)
+        elif msg['type'] == 'resync':
+            if self.interest:
+                self.interest.request_keyframe(msg['player_id'])
+            else:
+                self.encoder.request_keyframe(msg['player_id'])
+
+    def start(self):
+        width, height = self.world.width, self.world.height
+        for i, (pid, name) in enumerate(self.players.items()):
+            start_pos = (width // 2 + i * 20, height // 2 + i * 20)
+            self.world.add_snake(pid, start_pos, name, COLORS[i % len(COLORS)])
+        self.world.spawn_food(1)
+        self.state = ROOM_PLAYING
+        self.since = time.monotonic()
+        self.send({"type": "start_game"})
+
+    def tick(self):
+        now = time.monotonic()
+        if self.state == ROOM_LOBBY:
+            if self.players and (len(self.players) >= self.size or
+                                 now - self.since >= self.start_delay):
+                self.start()
+            return
+
+        if self.state == ROOM_OVER:
+            if now - self.since >= self.restart_delay:
+                self.reset()
+                self.since = now
+                self.send({"type": "restart"})
+                self.send_lobby()
+            return
+
+        inputs, self.inputs = self.inputs, []
+        for msg in inputs:
+            if msg['type'] == 'input':
+                self.network.input_applied(msg)
+        for event in self.world.step(inputs):
+            if event['type'] == 'death' and self.leaderboard is not None:
+                self.leaderboard.add(self.players.get(event['player_id'], "Anonymous"), event['score'])
+        if not self.world.snakes:
+            self.state = ROOM_OVER
+            self.since = now
+            self.send({"type": "game_over"})
+            return
+        if self.world.tick % self.snapshot_interval == 0:
+            if self.interest:
+                for pid, msg in self.interest.encode(self.world, list(self.players)):
+                    self.network.send_to([pid], msg)
+            else:
+                msg = self.encoder.encode(self.world.snakes, self.world.food.positions,
+                                          self.world.tick, self.world.acks)
+                resync, keyframe = self.encoder.take_resyncs(self.world.snakes, self.world.food.positions,
+                                                             self.world.acks)
+                self.network.send_to([pid for pid in self.players if pid not in resync], msg)
+                if keyframe is not None:
+                    self.network.send_to([pid for pid in self.players if pid in resync], keyframe)
+
+
+class Server:
+    def __init__(self, config, port):
+        self.config = config
+        self.network = SnakeNetwork(side="server", **network_options(config))
+        self.network.start_host(port, backlog=64)
+        self.leaderboard = Leaderboard(board=board_for(config))
+        self.rooms = {} # name -> Room
+        self.player_rooms = {} # player ID -> Room
+        self.next_room = 1
+
+    def room_for(self, wanted):
+        if wanted:
+            room = self.rooms.get(wanted)
+            if room is None:
+                room = self.rooms[wanted] = Room(wanted, self.config, self.network, self.leaderboard)
+            return room if room.is_open() else None
+        for room in self.rooms.values():
+            if room.is_open():
+                return room
+        while str(self.next_room) in self.rooms:
+            self.next_room += 1
+        name = str(self.next_room)
+        room = self.rooms[name] = Room(name, self.config, self.network, self.leaderboard)
+        return room
+
+    def poll(self):
+        # Route network events to rooms
+        for msg in self.network.get_events():
+            pid = msg.get('player_id')
+            if msg['type'] == 'init':
+                if pid in self.player_rooms:
+                    continue
+                room = self.room_for(msg.get('room'))
+                if room is None:
+                    # Named room is mid-match or full
+                    self.network.send_to([pid], {"type": "error", "message": "Room is not open"})
+                    continue
+                self.player_rooms[pid] = room
+                try:
+                    room.join(pid, msg.get('name') or f"Player {pid}")
+                except Exception:
+                    self.fail(room)
+            elif msg['type'] == 'disconnect':
+                room = self.player_rooms.pop(pid, None)
+                if room is not None:
+                    try:
+                        room.leave(pid)
+                    except Exception:
+                        self.fail(room)
+                    if not room.players:
+                        self.rooms.pop(room.name, None)
+            elif pid in self.player_rooms:
+                room = self.player_rooms[pid]
+                try:
+                    room.handle(msg)
+                except Exception:
+                    self.fail(room)
+
+    def fail(self, room):
+        # One room's bug closes that room, not the server and its other rooms:
+        # its players get an error and are let go
+        print(f"Room {room.name} failed:")
+        traceback.print_exc()
+        self.rooms.pop(room.name, None)
+        players = list(room.players)
+        self.network.send_to(players, {"type": "error", "message": "Room failed"})
+        for pid in players:
+            self.player_rooms.pop(pid, None)
+            self.network.disconnect(pid)
+        room.players = {}
+
+    def run(self):
+        tick_time = 1.0 / tick_rate(self.config)
+        next_tick = time.perf_counter()
+        while True:
+            self.poll()
+            for room in list(self.rooms.values()):
+                try:
+                    room.tick()
+                except Exception:
+                    self.fail(room)
+
+            next_tick += tick_time
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -MAX_LAG:
+                # Overloaded: drop the backlog rather than spiral
+                next_tick = time.perf_counter()
+
+
+class _Outbox:
+    # Stands in for SnakeNetwork inside a worker: collects what rooms send
+    def __init__(self):
+        self.messages = []
+        self.latencies = [] # (player ID, seconds) for the supervisor's network stats
+
+    def send_to(self, client_ids, msg):
+        self.messages.append((client_ids, msg))
+
+    def input_applied(self, msg):
+        latency = input_latency(msg) # Same monotonic clock in every process
+        if latency is not None:
+            self.latencies.append((msg['player_id'], latency))
+
+    def take(self):
+        messages, self.messages = self.messages, []
+        latencies, self.latencies = self.latencies, []
+        return messages, latencies
+
+
+def _worker_main(config, conn):
+    # Worker process: tick the rooms the supervisor gives us. Commands:
+    # ('open', name, players, since), ('close', name), ('join', name, pid, player_name),
+    # ('leave', name, pid), ('msg', name, msg), ('release', name), ('stop',)
+    # Every tick we answer (messages to send, seconds spent ticking, {room: state},
+    # input latencies, released, failed): released holds (name, since) for
+    # each room handed off, since None if it refused (a match started);
+    # failed names the rooms that raised and were closed.
+    rooms = {}
+    outbox = _Outbox()
+    leaderboard = Leaderboard(board=board_for(config))
+    tick_time = 1.0 / tick_rate(config)
+    next_tick = time.perf_counter()
+    released, failed = [], []
+
+    def fail(name):
+        # One room's bug closes that room, not the worker and its other rooms
+        print(f"Room {name} failed:")
+        traceback.print_exc()
+        rooms.pop(name, None)
+        failed.append(name)
+
+    while True:
+        while conn.poll():
+            cmd = conn.recv()
+            op = cmd[0]
+            if op == 'stop':
+                return
+            if op == 'open':
+                _, name, players, since = cmd
+                try:
+                    room = rooms[name] = Room(name, config, outbox, leaderboard)
+                    for pid, player_name in players.items():
+                        room.join(pid, player_name)
+                    room.since = since
+                except Exception:
+                    fail(name)
+                continue
+            room = rooms.get(cmd[1])
+            if op == 'release':
+                # Only a room still in its lobby moves; a match stays here
+                if room is not None and room.state == ROOM_LOBBY:
+                    del rooms[cmd[1]]
+                    released.append((cmd[1], room.since))
+                else:
+                    released.append((cmd[1], None))
+                continue
+            if room is None:
+                continue # Closed or moved away meanwhile
+            try:
+                if op == 'close':
+                    del rooms[cmd[1]]
+                elif op == 'join':
+                    room.join(cmd[2], cmd[3])
+                elif op == 'leave':
+                    room.leave(cmd[2])
+                elif op == 'msg':
+                    room.handle(cmd[2])
+            except Exception:
+                fail(cmd[1])
+
+        start = time.perf_counter()
+        for name, room in list(rooms.items()):
+            try:
+                room.tick()
+            except Exception:
+                fail(name)
+        busy = time.perf_counter() - start
+        messages, latencies = outbox.take()
+        conn.send((messages, busy, {name: room.state for name, room in rooms.items()}, latencies,
+                   released, failed))
+        released, failed = [], []
+
+        next_tick += tick_time
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -MAX_LAG:
+            next_tick = time.perf_counter()
+
+
+class _Worker:
+    def __init__(self, index, config):
+        self.index = index
+        # Spawned, not forked: a forked worker would inherit the host's client
+        # sockets, and a respawned one would then hold dropped peers open
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(config, child), daemon=True)
+        self.process.start()
+        self.rooms = set() # Names of the rooms it runs
+        self.load = 0.0 # Smoothed fraction of each tick spent ticking rooms
+        self.ticks = 0
+
+
+class _RoomInfo:
+    # The supervisor's view of a room that lives in a worker
+    def __init__(self, name, worker):
+        self.name = name
+        self.worker = worker
+        self.players = {} # ID -> name
+        self.state = ROOM_LOBBY # As last reported by the worker
+        self.since = time.monotonic()
+        self.moving_to = None # Worker it goes to once its worker releases it
+        self.held = [] # Player messages that arrived while it was moving
+
+
+class Supervisor:
+    def __init__(self, config, port, workers):
+        self.config = config
+        self.size = config.get('server', {}).get('room_size', 4)
+        self.tick_time = 1.0 / tick_rate(config)
+        self.network = SnakeNetwork(side="server", **network_options(config))
+        self.network.start_host(port, backlog=64)
+        self.workers = [_Worker(i, config) for i in range(workers)]
+        self.rooms = {} # name -> _RoomInfo
+        self.player_rooms = {} # player ID -> _RoomInfo
+        self.next_room = 1
+
+    def _open_room(self, name, worker=None, players=None, since=None):
+        if worker is None:
+            worker = min(self.workers, key=lambda w: (w.load, len(w.rooms)))
+        info = self.rooms.get(name) or _RoomInfo(name, worker)
+        info.worker = worker
+        if players is not None:
+            info.players = players
+        if since is not None:
+            info.since = since
+        self.rooms[name] = info
+        worker.rooms.add(name)
+        self._send(worker, ('open', name, dict(info.players), info.since))
+        return info
+
+    def _is_open(self, info):
+        return info.state == ROOM_LOBBY and len(info.players) < self.size
+
+    def room_for(self, wanted):
+        if wanted:
+            info = self.rooms.get(wanted) or self._open_room(wanted)
+            return info if self._is_open(info) else None
+        for info in self.rooms.values():
+            if self._is_open(info):
+                return info
+        while str(self.next_room) in self.rooms:
+            self.next_room += 1
+        return self._open_room(str(self.next_room))
+
+    def poll(self):
+        # Route network events to the worker running the player's room
+        for msg in self.network.get_events():
+            pid = msg.get('player_id')
+            if msg['type'] == 'init':
+                if pid in self.player_rooms:
+                    continue
+                info = self.room_for(msg.get('room'))
+                if info is None:
+                    self.network.send_to([pid], {"type": "error", "message": "Room is not open"})
+                    continue
+                name = msg.get('name') or f"Player {pid}"
+                info.players[pid] = name
+                self.player_rooms[pid] = info
+                self._send(info.worker, ('join', info.name, pid, name))
+            elif msg['type'] == 'disconnect':
+                info = self.player_rooms.pop(pid, None)
+                if info is None:
+                    continue
+                info.players.pop(pid, None)
+                if info.players:
+                    self._send(info.worker, ('leave', info.name, pid))
+                else:
+                    self._send(info.worker, ('close', info.name))
+                    info.worker.rooms.discard(info.name)
+                    del self.rooms[info.name]
+            elif pid in self.player_rooms:
+                info = self.player_rooms[pid]
+                if info.moving_to is not None:
+                    info.held.append(msg) # Goes wherever the room ends up
+                else:
+                    self._send(info.worker, ('msg', info.name, msg))
+
+    def _send(self, worker, cmd):
+        try:
+            worker.conn.send(cmd)
+        except OSError:
+            pass # It died; collect() finds the closed pipe and cleans up
+
+    def collect(self, timeout):
+        # Broadcast what the workers produced and take their load reports
+        by_conn = {w.conn: w for w in self.workers}
+        for conn in wait(list(by_conn), timeout):
+            worker = by_conn[conn]
+            try:
+                while conn.poll():
+                    self._take_report(worker, conn.recv())
+            except (EOFError, OSError):
+                self._worker_died(worker)
+
+    def _take_report(self, worker, report):
+        messages, busy, states, latencies, released, failed = report
+        for client_ids, msg in messages:
+            self.network.send_to(client_ids, msg)
+        for pid, latency in latencies:
+            self.network.record_latency(pid, latency)
+        worker.load += (busy / self.tick_time - worker.load) * LOAD_SMOOTHING
+        worker.ticks += 1
+        for name, state in states.items():
+            info = self.rooms.get(name)
+            if info is not None and info.worker is worker:
+                info.state = state
+        for name, since in released:
+            self._released(worker, name, since)
+        for name in failed:
+            self._room_failed(name)
+
+    def _released(self, worker, name, since):
+        # The worker's answer to a hand-off request
+        info = self.rooms.get(name)
+        if info is None or info.worker is not worker or info.moving_to is None:
+            return # Closed meanwhile
+        target, info.moving_to = info.moving_to, None
+        if since is not None: # None: refused, its match started after the report we went by
+            worker.rooms.discard(name)
+            self._open_room(name, target if target in self.workers else None, since=since) # Target may have died
+        for msg in info.held:
+            self._send(info.worker, ('msg', name, msg))
+        info.held = []
+
+    def _room_failed(self, name):
+        # The room is gone: tell its players and let them go
+        info = self.rooms.pop(name, None)
+        if info is None:
+            return
+        info.worker.rooms.discard(name)
+        players = list(info.players)
+        self.network.send_to(players, {"type": "error", "message": "Room failed"})
+        for pid in players:
+            self.player_rooms.pop(pid, None)
+            self.network.disconnect(pid)
+
+    def _worker_died(self, worker):
+        worker.process.join(1)
+        if worker.process.is_alive():
+            worker.process.terminate() # Alive but its pipe broke: no use to us
+            worker.process.join(1)
+        print(f"worker {worker.index} died (exit code {worker.process.exitcode}), "
+              f"losing {len(worker.rooms)} rooms; starting a new one")
+        worker.conn.close()
+        for name in list(worker.rooms):
+            self._room_failed(name)
+        self.workers[self.workers.index(worker)] = _Worker(worker.index, self.config)
+
+    def rebalance(self):
+        # Ask the busiest worker to hand one lobby room to the idlest. Rooms
+        # in a match stay put: their whole world would have to travel with
+        # them. The state we go by may be a tick old, so the worker decides.
+        busiest = max(self.workers, key=lambda w: w.load)
+        idlest = min(self.workers, key=lambda w: w.load)
+        if busiest.load - idlest.load < REBALANCE_GAP:
+            return
+        for name in list(busiest.rooms):
+            info = self.rooms[name]
+            if info.state == ROOM_LOBBY and info.moving_to is None:
+                info.moving_to = idlest
+                self._send(busiest, ('release', name))
+                return
+
+    def report(self):
+        for w in self.workers:
+            players = sum(len(self.rooms[name].players) for name in w.rooms)
+            print(f"worker {w.index}: {len(w.rooms)} rooms, {players} players, "
+                  f"load {w.load:.0%}, {w.ticks / REPORT_INTERVAL:.0f} ticks/s")
+            w.ticks = 0
+
+    def run(self):
+        last_report = last_rebalance = time.monotonic()
+        try:
+            while True:
+                self.poll()
+                self.collect(self.tick_time / 4)
+                now = time.monotonic()
+                if now - last_rebalance >= REBALANCE_INTERVAL:
+                    self.rebalance()
+                    last_rebalance = now
+                if now - last_report >= REPORT_INTERVAL:
+                    self.report()
+                    last_report = now
+        finally:
+            for w in self.workers:
+                try:
+                    w.conn.send(('stop',))
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    config = load_config()
+    settings = config.get('server', {})
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else settings.get('port', 5555)
+    workers = settings.get('workers', 0) or os.cpu_count() or 1
+    print(f"Snake server listening on port {port}")
+    try:
+        if workers > 1:
+            print(f"Sharding rooms across {workers} worker processes")
+            Supervisor(config, port, workers).run()
+        else:
+            Server(config, port).run()
+    except KeyboardInterrupt:
+        pass
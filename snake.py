@@ -1,5 +1,10 @@
-import pygame
 from enum import Enum
+from body import RingBody, CornerBody
+from collision import body_hits
+from utils import arena_size
+
+# pygame is imported where drawing and key handling need it, so the
+# headless engine/server never loads it
 
 class Direction(Enum):
     UP = (0, -1)
@@ -14,22 +19,25 @@ class Snake:
         self.block_size = config['game']['block_size']
         self.color = tuple(config['colors']['snake'])
         # Allow custom color per snake later
-        self.body = [start_pos] # List of (x, y) tuples
+        self.pixel_mode = config['game'].get('pixel_movement', False)
+        self.pixel_speed = config['game'].get('pixel_speed', 2)
+        # Pixel mode can store only the turn points instead of every point
+        self.corner_mode = self.pixel_mode and config['game'].get('body_model', 'points') == 'corners'
+        
+        self.arena_width, self.arena_height = arena_size(config)
+        self.solid_walls = config['game']['solid_walls']
+        
+        self.body = self._new_body([start_pos])
+        self.seq = 0 # Number of head pushes; body[i] was pushed as seq - i
+        self.occupancy = None # OccupancyGrid, attached by the engine
         self.direction = Direction.RIGHT
         self.next_direction = Direction.RIGHT
-        self.next_direction = Direction.RIGHT
         self.grow_pending = 0
         self.speed_multiplier = 1.0
         self.accelerating = False
         self.score = 0
         self.base_speed = config['game']['speed']
-        
-        self.window_width = config['window']['width']
-        self.window_height = config['window']['height']
-        self.solid_walls = config['game']['solid_walls']
-        
-        self.pixel_mode = config['game'].get('pixel_movement', False)
-        self.pixel_speed = config['game'].get('pixel_speed', 2)
+        self.last_ends = None # (head, tail) before the last update, for interpolated drawing
         
         # In pixel mode, we need to track length in pixels or points
         if self.pixel_mode:
@@ -37,11 +45,27 @@ class Snake:
             # But initially just one point is fine, it will grow
             pass
 
+    def _new_body(self, points):
+        if self.corner_mode:
+            period = None if self.solid_walls else (self.arena_width, self.arena_height)
+            return CornerBody(points, period)
+        # Ring buffer of (x, y) points, head first. Grid mode stays on integer coords.
+        return RingBody(points, 'd' if self.pixel_mode else 'i')
+
+    @property
+    def body_model(self):
+        # Tells the other side how to read 'body'
+        if self.corner_mode:
+            return 'corners'
+        return 'points' if self.pixel_mode else 'grid'
+
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
-            'body': self.body,
+            'model': self.body_model,
+            'body': self.body.to_list(), # Corner mode: turn points only
+            'seq': self.seq, # Head pushes so far, so clients can line snapshots up
             'direction': self.direction.name,
             'color': self.color,
             'score': len(self.body) # Simple score approximation or track separately
@@ -54,7 +78,10 @@ class Snake:
         return snake
 
     def update_from_dict(self, data):
-        self.body = [tuple(p) for p in data['body']]
+        # Follow the sender's body model, whatever our own config says
+        self.corner_mode = data.get('model', self.body_model) == 'corners'
+        self.body = self._new_body(data['body'])
+        self.seq = data.get('seq', 0)
         self.direction = Direction[data['direction']]
         self.color = tuple(data['color'])
         self.id = data['id']
@@ -62,7 +89,66 @@ class Snake:
 
 
 
+    def attach(self, occupancy):
+        # Register the whole body in the engine's occupancy grid
+        self.occupancy = occupancy
+        if self.corner_mode:
+            # Corner bodies only feed the free-cell counts, from tail to head
+            corners = self.body.to_list()
+            occupancy.cover(corners[-1], 1)
+            for i in range(len(corners) - 1, 0, -1):
+                occupancy.sweep(corners[i], corners[i - 1], 1)
+            return
+        # Oldest first: the grid keeps each cell's entries in push order
+        for i in range(len(self.body) - 1, -1, -1):
+            occupancy.add(self.id, self.seq - i, self.body[i])
+
+    def detach(self):
+        if self.occupancy is not None:
+            if self.corner_mode:
+                corners = self.body.to_list()
+                for i in range(len(corners) - 1, 0, -1):
+                    self.occupancy.sweep(corners[i], corners[i - 1], -1)
+                self.occupancy.cover(corners[0], -1)
+            else:
+                for point in self.body:
+                    self.occupancy.pop_oldest(self.id, point)
+            self.occupancy = None
+
+    def _push_head(self, point):
+        if self.corner_mode:
+            leg = self.body.push_head(point)
+            if self.occupancy is not None and leg:
+                self.occupancy.sweep(leg[0], leg[1], 1)
+            return
+        self.body.push_head(point)
+        self.seq += 1
+        if self.occupancy is not None:
+            self.occupancy.add(self.id, self.seq, self.body.head)
+
+    def _pop_tail(self):
+        if self.corner_mode:
+            for start, end in self.body.pop_tail():
+                if self.occupancy is not None:
+                    self.occupancy.sweep(start, end, -1)
+            return
+        point = self.body.pop_tail()
+        if self.occupancy is not None:
+            self.occupancy.pop_oldest(self.id, point)
+
+    def _move_head(self, point):
+        if self.corner_mode:
+            # Snapping only ever moves the head forward: same as a push
+            self._push_head(point)
+            return
+        if self.occupancy is not None:
+            self.occupancy.pop_newest(self.id, self.body.head)
+        self.body[0] = point
+        if self.occupancy is not None:
+            self.occupancy.add(self.id, self.seq, self.body.head)
+
     def handle_input(self, event):
+        import pygame
         if event.type == pygame.KEYDOWN:
             new_dir = None
             if event.key == pygame.K_UP:
@@ -75,18 +161,25 @@ class Snake:
                 new_dir = Direction.RIGHT
             
             if new_dir:
-                # Prevent reversing direction immediately
-                # Check if new direction is opposite to current
-                if (new_dir.value[0] * -1 != self.direction.value[0] or 
-                    new_dir.value[1] * -1 != self.direction.value[1]):
-                    
-                    if new_dir != self.direction:
-                        self.next_direction = new_dir
+                self.steer(new_dir)
+
+    def steer(self, new_dir):
+        # Prevent reversing direction immediately
+        # Check if new direction is opposite to current
+        if (new_dir.value[0] * -1 != self.direction.value[0] or 
+            new_dir.value[1] * -1 != self.direction.value[1]):
+            
+            if new_dir != self.direction:
+                self.next_direction = new_dir
+
+    def update(self, held=None):
+        # held: set of Directions whose keys are held down by the local player.
+        # None for snakes driven remotely (acceleration arrives via 'accel' messages).
+        self.last_ends = (self.body.head, self.body[-1])
 
-    def update(self, is_local=True):
         # Handle direction changes with grid snapping in pixel mode
         if self.pixel_mode:
-            head_x, head_y = self.body[0]
+            head_x, head_y = self.body.head
             
             # Calculate move amount
             move_amount = self.pixel_speed * self.speed_multiplier
@@ -137,7 +230,7 @@ class Snake:
                     elif current_dir == Direction.UP: head_y -= dist_to_grid
                     
                     # Update body[0] to snapped position
-                    self.body[0] = (head_x, head_y)
+                    self._move_head((head_x, head_y))
                     
                     # Apply turn
                     self.direction = next_dir
@@ -188,18 +281,12 @@ class Snake:
         
         # Check for acceleration (hold key for current direction)
         # BUG FIX: Only check keys if this snake is controlled locally
-        if is_local:
-            keys = pygame.key.get_pressed()
-            self.accelerating = False
-            if ((self.direction == Direction.UP and keys[pygame.K_UP]) or
-                (self.direction == Direction.DOWN and keys[pygame.K_DOWN]) or
-                (self.direction == Direction.LEFT and keys[pygame.K_LEFT]) or
-                (self.direction == Direction.RIGHT and keys[pygame.K_RIGHT])):
-                self.accelerating = True
+        if held is not None:
+            self.accelerating = self.direction in held
         
         self.speed_multiplier = 1.5 if self.accelerating else 1.0
         
-        head_x, head_y = self.body[0]
+        head_x, head_y = self.body.head
         dx, dy = self.direction.value
         
         if self.pixel_mode:
@@ -243,6 +330,10 @@ class Snake:
                     # Consume move amount
                     move_amount -= dist_to_grid
                     
+                    if self.corner_mode:
+                        # Corner bodies need the turn point itself, not a diagonal step
+                        self._move_head((start_x, start_y))
+                    
                     # Turn
                     self.direction = self.next_direction
                     dx, dy = self.direction.value
@@ -268,12 +359,12 @@ class Snake:
             new_y = head_y + dy * self.block_size
         
         if not self.solid_walls:
-            new_x = new_x % self.window_width
-            new_y = new_y % self.window_height
+            new_x = new_x % self.arena_width
+            new_y = new_y % self.arena_height
             
         new_head = (new_x, new_y)
         
-        self.body.insert(0, new_head)
+        self._push_head(new_head)
         
         if self.grow_pending > 0:
             # Check if we have enough pending growth to cover this move
@@ -285,6 +376,7 @@ class Snake:
             if self.grow_pending >= move_len:
                 self.grow_pending -= move_len
                 # Don't pop, effectively growing
+                self.body.keep_tail()
             else:
                 # Not enough pending growth to cover a full step (or pixel step)
                 # But wait, if we are in pixel mode, we grow by NOT popping.
@@ -296,44 +388,136 @@ class Snake:
                 # No, the requirement is "increase by one grid".
                 # So we added 'block_size' to grow_pending.
                 # We consume it as we move.
-                self.body.pop()
+                self._pop_tail()
         else:
-            self.body.pop()
+            self._pop_tail()
             
     def grow(self):
         # Always add exactly one block size worth of growth
         self.grow_pending += self.block_size
 
-    def draw(self, surface):
-        for segment in self.body:
-            pygame.draw.rect(surface, self.color, 
-                             (segment[0], segment[1], self.block_size, self.block_size))
+    def _lerp(self, a, b, alpha):
+        # Point alpha of the way from a to b. Only straight moves of at most one
+        # block are blended: a wrap jump or a snapped turn just shows b.
+        if a[0] != b[0] and a[1] != b[1]:
+            return b
+        if abs(a[0] - b[0]) > self.block_size or abs(a[1] - b[1]) > self.block_size:
+            return b
+        return (a[0] + (b[0] - a[0]) * alpha, a[1] + (b[1] - a[1]) * alpha)
+
+    def ends(self, alpha):
+        # Head and tail as they were alpha of the way through the last tick
+        head, tail = self.body.head, self.body[-1]
+        if self.last_ends is None or alpha >= 1:
+            return head, tail
+        return self._lerp(self.last_ends[0], head, alpha), self._lerp(self.last_ends[1], tail, alpha)
+
+    def draw(self, surface, alpha=1.0, span=None, camera=None):
+        # alpha: how far the renderer is between the previous tick and this one
+        # span: (start, count) to draw only body[start:start + count] instead,
+        # for remote snakes interpolated from snapshots (see interp.py)
+        # camera: camera.Camera for an arena bigger than the window; only
+        # what is in view gets drawn
+        if span is not None and not self.corner_mode:
+            start, count = span
+            self._draw_points(surface, start, start + count, camera)
+            return
+
+        head, tail = self.ends(alpha)
+        if self.corner_mode:
+            self._draw_corners(surface, head, tail, camera)
+            return
+        self._draw_points(surface, 1, len(self.body), camera)
+        if tail != self.body[-1]:
+            # The old tail still slides out of its block
+            self._draw_block(surface, tail, camera)
+        self._draw_block(surface, head, camera)
+
+    def _draw_block(self, surface, point, camera):
+        if camera is not None:
+            if not camera.block_visible(point):
+                return
+            point = camera.to_screen(point)
+        import pygame
+        pygame.draw.rect(surface, self.color, (point[0], point[1], self.block_size, self.block_size))
+
+    def _draw_points(self, surface, start, stop, camera):
+        # body[start:stop]
+        import pygame
+        size, color = self.block_size, self.color
+        runs = [(start, stop)] if camera is None else camera.runs(self, start, stop)
+        for lo, hi in runs:
+            for segment in self.body.iter_from(lo, hi):
+                if camera is not None:
+                    segment = camera.to_screen(segment)
+                pygame.draw.rect(surface, color, (segment[0], segment[1], size, size))
+
+    def _draw_corners(self, surface, head, tail, camera=None):
+        import pygame
+        for rect in self.corner_rects(head, tail):
+            for screen_rect in ([rect] if camera is None else camera.rects(rect)):
+                pygame.draw.rect(surface, self.color, screen_rect)
+
+    def corner_rects(self, head, tail):
+        # One rect per straight segment, repeated across the edges of a
+        # wrap-around arena since corners are stored unwrapped
+        size = self.block_size
+        w, h = self.arena_width, self.arena_height
+        corners = self.body.to_list()
+        corners[0] = head
+        if len(corners) > 1:
+            corners[-1] = tail
+        for a, b in zip(corners, corners[1:] or corners):
+            left, top = min(a[0], b[0]), min(a[1], b[1])
+            rect_w = abs(a[0] - b[0]) + size
+            rect_h = abs(a[1] - b[1]) + size
+            shifts_x = [0] if self.solid_walls else [-w, 0, w]
+            shifts_y = [0] if self.solid_walls else [-h, 0, h]
+            for sx in shifts_x:
+                if left + sx >= w or left + sx + rect_w <= 0:
+                    continue
+                for sy in shifts_y:
+                    if top + sy >= h or top + sy + rect_h <= 0:
+                        continue
+                    yield (left + sx, top + sy, rect_w, rect_h)
+
+    def hits_wall(self):
+        head = self.body.head
+        return self.solid_walls and (head[0] < 0 or head[0] >= self.arena_width or
+                                     head[1] < 0 or head[1] >= self.arena_height)
+
+    @property
+    def neck(self):
+        # Body points right behind the head that can't count as a self hit.
+        # In pixel mode, head overlaps with immediate body points.
+        # Robust fix: Skip 3 blocks worth of segments to ensure we clear the "neck"
+        # even during turns.
+        if self.pixel_mode:
+            return int(3 * self.block_size / self.pixel_speed)
+        return 1
 
     def check_collision(self):
-        head = self.body[0]
-        head_rect = pygame.Rect(head[0], head[1], self.block_size, self.block_size)
+        head = self.body.head
         
         # Wall collision
-        if self.solid_walls:
-            if (head[0] < 0 or head[0] >= self.window_width or 
-                head[1] < 0 or head[1] >= self.window_height):
-                return True
+        if self.hits_wall():
+            return True
 
         # Self collision
-        # In pixel mode, head overlaps with immediate body points.
-        # We need to skip the first few points that are "inside" the head.
-        start_check = 1
-        if self.pixel_mode:
-            # Skip points within block_size distance
-            # Robust fix: Skip 3 blocks worth of segments to ensure we clear the "neck"
-            # even during turns.
-            start_check = int(3 * self.block_size / self.pixel_speed)
-            if start_check >= len(self.body):
-                return False
-                
-        for segment in self.body[start_check:]:
-            seg_rect = pygame.Rect(segment[0], segment[1], self.block_size, self.block_size)
-            if head_rect.colliderect(seg_rect):
-                return True
-            
-        return False
+        if self.corner_mode:
+            # Same neck as below, measured along the path
+            return self.body.overlaps(head, self.block_size, skip=3 * self.block_size)
+
+        start_check = self.neck
+        if start_check >= len(self.body):
+            return False
+
+        if self.occupancy is not None:
+            # Only points pushed at least start_check moves ago can hit the head
+            newest = self.seq - start_check
+            for owner, seq, _ in self.occupancy.overlaps(head):
+                if owner == self.id and seq <= newest:
+                    return True
+            return False
+
+        return body_hits(self.body, head, self.block_size, start_check)
@@ -0,0 +1,42 @@
+import unittest
+from delta import StateEncoder, StateDecoder
+from engine import World
+from utils import load_config
+
+# python -m unittest discover tests  (or python -m pytest), from the repo root
+
+
+def _mirror(decoder):
+    return ({sid: list(s['body']) for sid, s in decoder.snakes.items()},
+            sorted(decoder.food), decoder.scores)
+
+
+class ResyncTest(unittest.TestCase):
+    def test_only_the_asker_gets_a_keyframe(self):
+        world = World(load_config())
+        world.add_snake(1, (200, 200), "Ann")
+        world.add_snake(2, (400, 300), "Bo")
+        world.spawn_food(3)
+        encoder = StateEncoder()
+        steady, lossy = StateDecoder(world.config), StateDecoder(world.config)
+
+        for tick in range(20):
+            world.step([{"type": "input", "player_id": 1, "dir": "DOWN"}] if tick == 5 else [])
+            msg = encoder.encode(world.snakes, world.food.positions, world.tick, world.acks)
+            resync, keyframe = encoder.take_resyncs(world.snakes, world.food.positions, world.acks)
+            steady.apply(msg)
+            if tick == 8:
+                continue # lossy never sees this delta
+            applied, want_resync = lossy.apply(keyframe if 2 in resync else msg)
+            if want_resync:
+                encoder.request_keyframe(2)
+            if tick > 0:
+                self.assertEqual(msg['type'], "delta") # Nobody else was sent a keyframe
+            if tick == 10:
+                self.assertEqual(keyframe['type'], "state")
+            if tick >= 10:
+                self.assertEqual(_mirror(lossy), _mirror(steady))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import random
+import unittest
+import wire
+
+# python -m unittest discover tests  (or python -m pytest), from the repo root
+
+
+def _state():
+    return {"type": "state", "tick": 42, "sent": 1.5,
+            "snakes": [{"id": 1, "name": "Ann", "model": "points", "direction": "UP",
+                        "color": [0, 255, 0], "seq": 7, "body": [(20.0, 40.0), (20.0, 43.0)]}],
+            "scores": {"1": 10}, "food": [(100.0, 100.0)], "acks": {"1": [3, 40]}}
+
+
+def _delta():
+    return {"type": "delta", "tick": 43, "base": 42, "sent": 1.625,
+            "snakes": [{"id": 1, "push": 1, "trim": 1, "len": 2, "head": [(20.0, 37.0)], "dir": "LEFT"},
+                       {"id": 2, "body": [(5.0, 5.0), (5.0, 8.0), (8.0, 8.0)]}],
+            "added": [{"id": 3, "name": "Bo", "model": "corners", "direction": "DOWN",
+                       "color": [1, 2, 3], "seq": 0, "body": [(60.0, 60.0)], "score": 4}],
+            "removed": [4, 5], "food_add": [(12.0, 14.0)], "food_remove": [(100.0, 100.0)],
+            "scores": {"1": 10, "3": 4}, "acks": {"1": [8, 43]}}
+
+
+def _messages():
+    return [_state(), _delta(),
+            {"type": "input", "dir": "LEFT", "seq": 9, "sent": 2.0},
+            {"type": "input", "dir": "UP", "seq": 10},
+            {"type": "accel", "state": True},
+            {"type": "lobby", "players": [{"id": 1, "name": "Ann"}]}]
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_round_trip(self):
+        for msg in _messages():
+            self.assertEqual(wire.decode(wire.encode(msg)), msg)
+
+    def test_long_name_cut_on_a_character(self):
+        # 200 two-byte characters: the 255-byte limit falls inside one
+        msg = _state()
+        msg['snakes'][0]['name'] = "\u00e9" * 200
+        name = wire.decode(wire.encode(msg))['snakes'][0]['name']
+        self.assertEqual(name, "\u00e9" * 127)
+
+
+class DecodeMalformedTest(unittest.TestCase):
+    def payloads(self):
+        return [wire.encode(msg) for msg in _messages()]
+
+    def test_truncated(self):
+        for payload in self.payloads():
+            for n in range(len(payload) - 1):
+                try:
+                    wire.decode(payload[:n])
+                except ValueError:
+                    pass # Expected; anything else fails the test
+        # Cut inside the body points and the name: not silently shortened
+        payload = wire.encode(_state())
+        with self.assertRaises(ValueError):
+            wire.decode(payload[:-40])
+
+    def test_garbage(self):
+        rng = random.Random(0)
+        headers = [bytes([wire.VERSION, t]) for t in (wire.MSG_STATE, wire.MSG_DELTA, wire.MSG_INPUT,
+                                                        wire.MSG_ACCEL, wire.MSG_JSON)]
+        for _ in range(2000):
+            payload = rng.choice(headers) + bytes(rng.getrandbits(8) for _ in range(rng.randrange(40)))
+            try:
+                wire.decode(payload)
+            except ValueError:
+                pass
+        for payload in (b"", b"\x03", b"\x03\x01\x00", b"\x09\x00{}", b"\x03\x07",
+                        b"\x03\x03\x09\x00\x00\x00\x00"): # Direction index out of range
+            with self.assertRaises(ValueError, msg=payload):
+                wire.decode(payload)
+
+    def test_json_not_an_object(self):
+        for body in (b"[1, 2]", b"3", b'"ping"', b"null", b"{"):
+            with self.assertRaises(ValueError):
+                wire.decode(bytes([wire.VERSION, wire.MSG_JSON]) + body)
+
+
+if __name__ == "__main__":
+    unittest.main()
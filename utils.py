@@ -18,7 +18,20 @@ def load_config():
             "audio": {"volume": 0.5, "enabled": True}
         }
 
+def arena_size(config):
+    # Playfield size in pixels. Defaults to the window; a bigger arena is
+    # shown through a camera that follows the player (see camera.py).
+    window, arena = config['window'], config.get('arena', {})
+    return arena.get('width', window['width']), arena.get('height', window['height'])
+
+def blocks_overlap(a, b, size):
+    # Same test as pygame.Rect(a, size).colliderect(pygame.Rect(b, size)),
+    # without needing pygame (Rect truncates float coordinates to ints).
+    return (abs(int(a[0]) - int(b[0])) < size and
+            abs(int(a[1]) - int(b[1])) < size)
+
 def load_leaderboard():
+    # Old JSON leaderboard; scores live in leaderboard.db now (see leaderboard.py)
     if not os.path.exists(LEADERBOARD_FILE):
         return []
     try:
@@ -26,10 +39,3 @@ def load_leaderboard():
             return json.load(f)
     except:
         return []
-
-def save_leaderboard(scores):
-    # Keep top 10
-    scores.sort(key=lambda x: x['score'], reverse=True)
-    scores = scores[:10]
-    with open(LEADERBOARD_FILE, 'w') as f:
-        json.dump(scores, f, indent=4)
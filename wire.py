@@ -0,0 +1,309 @@
+import json
+import struct
+import sys
+from array import array
+from itertools import chain
+
+# Binary wire format for SnakeNetwork.
+#
+# Every message is a frame: <u32 payload length><payload>, little-endian.
+# The payload starts with <u8 version><u8 message type>. The hot messages
+# (state keyframes, deltas, inputs) have packed layouts; everything else
+# (lobby, start_game, init, ...) travels as MSG_JSON, a JSON body inside a
+# binary frame, so any message can always be sent.
+#
+# Coordinates are 32-bit floats: as compact as int32 fixed point and exact to
+# 1/256 pixel for any arena under 65536 px, but packed by array() in C
+# instead of a per-point Python loop. Ids are u16.
+#
+# Negotiation: the host's 'init' lists the formats it speaks. The client
+# answers with a JSON line {"type": "format", "format": "binary"}; the host
+# acks with the same line and both switch from newline-delimited JSON to
+# binary frames right after it. Choose "json" in config to debug traffic.
+
+VERSION = 3 # 2: snake seq, input seq and input acks; 3: input and state send times
+MIN_VERSION = 2 # Oldest payloads we still read (a v2 payload is valid v3), e.g. in replays
+FORMATS = ["binary", "json"]
+
+MSG_JSON = 0
+MSG_STATE = 1
+MSG_DELTA = 2
+MSG_INPUT = 3
+MSG_ACCEL = 4
+
+MODELS = ['grid', 'points', 'corners']
+DIRECTIONS = ['UP', 'DOWN', 'LEFT', 'RIGHT']
+
+# Change flags in a delta snake record
+HAS_HEAD = 1
+HAS_BODY = 2
+HAS_DIR = 4
+
+_LEN = struct.Struct('<I')
+_HEADER = struct.Struct('<BB')
+
+
+class _Writer:
+    def __init__(self, msg_type):
+        self.parts = [_HEADER.pack(VERSION, msg_type)]
+
+    def pack(self, fmt, *values):
+        self.parts.append(struct.pack('<' + fmt, *values))
+
+    def text(self, s):
+        # At most 255 bytes, cut on a character boundary so it still decodes
+        data = s.encode()[:255].decode('utf-8', 'ignore').encode()
+        self.pack('B', len(data))
+        self.parts.append(data)
+
+    def points(self, points, count_fmt='I'):
+        flat = array('f', chain.from_iterable(points))
+        if sys.byteorder != 'little':
+            flat.byteswap()
+        self.pack(count_fmt, len(flat) // 2)
+        self.parts.append(flat.tobytes())
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+class _Reader:
+    def __init__(self, payload):
+        self.buf = payload
+        self.pos = _HEADER.size
+
+    def unpack(self, fmt):
+        s = struct.Struct('<' + fmt)
+        values = s.unpack_from(self.buf, self.pos)
+        self.pos += s.size
+        return values
+
+    def take(self, n):
+        # The next n bytes must all be there
+        if self.pos + n > len(self.buf):
+            raise ValueError(f"truncated payload: {n} bytes wanted at {self.pos} of {len(self.buf)}")
+
+    def text(self):
+        n, = self.unpack('B')
+        self.take(n)
+        s = bytes(self.buf[self.pos:self.pos + n]).decode()
+        self.pos += n
+        return s
+
+    def points(self, count_fmt='I'):
+        n, = self.unpack(count_fmt)
+        self.take(n * 8)
+        flat = array('f')
+        flat.frombytes(self.buf[self.pos:self.pos + n * 8])
+        if sys.byteorder != 'little':
+            flat.byteswap()
+        self.pos += n * 8
+        coords = iter(flat)
+        return list(zip(coords, coords))
+
+
+def _write_snake(w, s, score):
+    w.pack('HBB3BiI', s['id'], MODELS.index(s.get('model', 'points')),
+           DIRECTIONS.index(s['direction']), *s['color'], score, s.get('seq', 0))
+    w.text(s['name'])
+    w.points(s['body'])
+
+def _read_snake(r):
+    sid, model, direction, cr, cg, cb, score, seq = r.unpack('HBB3BiI')
+    name = r.text()
+    return {'id': sid, 'name': name, 'model': MODELS[model], 'direction': DIRECTIONS[direction],
+            'color': [cr, cg, cb], 'seq': seq, 'body': r.points()}, score
+
+
+def _write_acks(w, msg):
+    acks = msg.get('acks', {})
+    w.pack('B', len(acks))
+    for pid, (seq, tick) in acks.items():
+        w.pack('HII', int(pid), seq, tick)
+
+def _read_acks(r, msg):
+    count, = r.unpack('B')
+    if count:
+        msg['acks'] = {}
+        for _ in range(count):
+            pid, seq, tick = r.unpack('HII')
+            msg['acks'][str(pid)] = [seq, tick]
+
+
+def _write_sent(w, msg):
+    # Optional trailing send time (host clock)
+    if 'sent' in msg:
+        w.pack('d', msg['sent'])
+
+def _read_sent(r, msg):
+    if r.pos < len(r.buf):
+        msg['sent'], = r.unpack('d')
+
+
+def _encode_state(msg):
+    w = _Writer(MSG_STATE)
+    w.pack('IB', msg.get('tick', 0), len(msg['snakes']))
+    for s in msg['snakes']:
+        _write_snake(w, s, msg['scores'].get(str(s['id']), 0))
+    w.points(msg['food'], 'H')
+    _write_acks(w, msg)
+    _write_sent(w, msg)
+    return w.getvalue()
+
+def _decode_state(r):
+    tick, count = r.unpack('IB')
+    snakes, scores = [], {}
+    for _ in range(count):
+        s, score = _read_snake(r)
+        snakes.append(s)
+        scores[str(s['id'])] = score
+    msg = {"type": "state", "tick": tick, "snakes": snakes,
+           "food": r.points('H'), "scores": scores}
+    _read_acks(r, msg)
+    _read_sent(r, msg)
+    return msg
+
+
+def _encode_delta(msg):
+    w = _Writer(MSG_DELTA)
+    w.pack('II', msg['tick'], msg['base'])
+
+    changes = msg.get('snakes', [])
+    w.pack('B', len(changes))
+    for c in changes:
+        flags = ((HAS_HEAD if 'head' in c else 0) | (HAS_BODY if 'body' in c else 0) |
+                 (HAS_DIR if 'dir' in c else 0))
+        w.pack('HB', c['id'], flags)
+        if flags & HAS_HEAD:
+            w.pack('HHI', c['push'], c['trim'], c['len'])
+            w.points(c['head'], 'H')
+        if flags & HAS_BODY:
+            w.points(c['body'])
+        if flags & HAS_DIR:
+            w.pack('B', DIRECTIONS.index(c['dir']))
+
+    added = msg.get('added', [])
+    w.pack('B', len(added))
+    for s in added:
+        _write_snake(w, s, s.get('score', 0))
+
+    removed = msg.get('removed', [])
+    w.pack('B%dH' % len(removed), len(removed), *removed)
+    w.points(msg.get('food_add', []), 'H')
+    w.points(msg.get('food_remove', []), 'H')
+
+    scores = msg.get('scores', {})
+    w.pack('B', len(scores))
+    for sid, score in scores.items():
+        w.pack('Hi', int(sid), score)
+    _write_acks(w, msg)
+    _write_sent(w, msg)
+    return w.getvalue()
+
+def _decode_delta(r):
+    tick, base = r.unpack('II')
+    msg = {"type": "delta", "tick": tick, "base": base}
+
+    count, = r.unpack('B')
+    changes = []
+    for _ in range(count):
+        sid, flags = r.unpack('HB')
+        c = {"id": sid}
+        if flags & HAS_HEAD:
+            c['push'], c['trim'], c['len'] = r.unpack('HHI')
+            c['head'] = r.points('H')
+        if flags & HAS_BODY:
+            c['body'] = r.points()
+        if flags & HAS_DIR:
+            c['dir'] = DIRECTIONS[r.unpack('B')[0]]
+        changes.append(c)
+    if changes:
+        msg['snakes'] = changes
+
+    count, = r.unpack('B')
+    added = []
+    for _ in range(count):
+        s, s['score'] = _read_snake(r)
+        added.append(s)
+    if added:
+        msg['added'] = added
+
+    count, = r.unpack('B')
+    if count:
+        msg['removed'] = list(r.unpack('%dH' % count))
+    food_add = r.points('H')
+    if food_add:
+        msg['food_add'] = food_add
+    food_remove = r.points('H')
+    if food_remove:
+        msg['food_remove'] = food_remove
+
+    count, = r.unpack('B')
+    if count:
+        msg['scores'] = {}
+        for _ in range(count):
+            sid, score = r.unpack('Hi')
+            msg['scores'][str(sid)] = score
+    _read_acks(r, msg)
+    _read_sent(r, msg)
+    return msg
+
+
+def encode(msg):
+    """Message dict -> binary payload (without the length prefix)."""
+    t = msg.get('type')
+    if t == 'state':
+        return _encode_state(msg)
+    if t == 'delta':
+        return _encode_delta(msg)
+    if t == 'input' and set(msg) <= {'type', 'dir', 'seq', 'sent', 'player_id'}:
+        if 'sent' not in msg: # Same bytes as v2
+            return _HEADER.pack(VERSION, MSG_INPUT) + struct.pack('<BI', DIRECTIONS.index(msg['dir']),
+                                                                  msg.get('seq', 0))
+        return _HEADER.pack(VERSION, MSG_INPUT) + struct.pack('<BId', DIRECTIONS.index(msg['dir']),
+                                                              msg.get('seq', 0), msg['sent'])
+    if t == 'accel' and set(msg) <= {'type', 'state', 'player_id'}:
+        return _HEADER.pack(VERSION, MSG_ACCEL) + struct.pack('<B', bool(msg['state']))
+    return _HEADER.pack(VERSION, MSG_JSON) + json.dumps(msg).encode()
+
+def decode(payload):
+    """Binary payload -> message dict. Anything malformed (truncated,
+       garbage, not a JSON object) raises ValueError.
+    """
+    try:
+        msg = _decode(payload)
+    except (struct.error, IndexError, KeyError, TypeError) as e:
+        raise ValueError(f"bad frame ({e})") from e
+    if not isinstance(msg, dict):
+        raise ValueError(f"bad frame (a JSON {type(msg).__name__}, not an object)")
+    return msg
+
+def _decode(payload):
+    version, msg_type = _HEADER.unpack_from(payload)
+    if not MIN_VERSION <= version <= VERSION:
+        raise ValueError(f"Unsupported wire version {version}")
+    r = _Reader(payload)
+    if msg_type == MSG_STATE:
+        return _decode_state(r)
+    if msg_type == MSG_DELTA:
+        return _decode_delta(r)
+    if msg_type == MSG_INPUT:
+        direction, seq = r.unpack('BI')
+        msg = {"type": "input", "dir": DIRECTIONS[direction]}
+        if seq:
+            msg['seq'] = seq # 0: unnumbered
+        if len(payload) > r.pos:
+            msg['sent'], = r.unpack('d')
+        return msg
+    if msg_type == MSG_ACCEL:
+        return {"type": "accel", "state": bool(payload[r.pos])}
+    if msg_type == MSG_JSON:
+        return json.loads(bytes(payload[r.pos:]))
+    raise ValueError(f"Unknown message type {msg_type}")
+
+def frame(msg, fmt="binary"):
+    # Ready-to-send bytes for the given connection format
+    if fmt == "binary":
+        payload = encode(msg)
+        return _LEN.pack(len(payload)) + payload
+    return (json.dumps(msg) + "\n").encode()